@@ -28,7 +28,8 @@ if __name__ == "__main__":
 
     train_data, data_info = DatasetFeat.build_trainset(
         train_data, user_col, item_col, sparse_col, dense_col)
-    test_data = DatasetFeat.build_testset(test_data, sparse_col, dense_col)
+    test_data = DatasetFeat.build_testset(
+        test_data, sparse_col, dense_col, data_info=data_info)
 
     # sample negative items for each record
     train_data.build_negative_samples(data_info)
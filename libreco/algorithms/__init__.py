@@ -1,15 +1,35 @@
-from .user_cf import UserCF
-from .item_cf import ItemCF
-from .svd import SVD
-from .svdpp import SVDpp
-from .als import ALS
-from .bpr import BPR
-from .ncf import NCF
-from .youtube_match import YouTubeMatch
-from .youtube_ranking import YouTubeRanking
-from .fm import FM
-from .wide_deep import WideDeep
-from .deepfm import DeepFM
-from .autoint import AutoInt
-from .din import DIN
+import importlib
 
+# Models are imported on first access, so that tensorflow is only imported
+# when a tensorflow based model is actually used.
+_MODEL_MODULES = {
+    "UserCF": "user_cf",
+    "ItemCF": "item_cf",
+    "SVD": "svd",
+    "SVDpp": "svdpp",
+    "ALS": "als",
+    "BPR": "bpr",
+    "NCF": "ncf",
+    "YouTubeMatch": "youtube_match",
+    "YouTubeRanking": "youtube_ranking",
+    "FM": "fm",
+    "WideDeep": "wide_deep",
+    "DeepFM": "deepfm",
+    "AutoInt": "autoint",
+    "DIN": "din",
+    "VectorModel": "vector_model",
+}
+
+__all__ = list(_MODEL_MODULES)
+
+
+def __getattr__(name):
+    if name in _MODEL_MODULES:
+        module = importlib.import_module(
+            f".{_MODEL_MODULES[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
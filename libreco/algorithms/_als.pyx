@@ -1,6 +1,6 @@
 import numpy as np
 import cython
-from cython.parallel import parallel, prange
+from cython.parallel import parallel, prange, threadid
 from libc.stdlib cimport malloc, free
 from libc.string cimport memcpy, memset
 
@@ -33,37 +33,84 @@ cdef inline void scal(int *n, float *sa, float *sx, int *incx) nogil:
     cython_blas.sscal(n, sa, sx, incx)
 
 
+# columns of per-thread statistics collected by the kernels
+cdef enum:
+    N_ROWS = 0
+    N_CG_ITERS = 1
+    LOSS = 2
+STAT_COLUMNS = ("rows", "cg_iters", "loss")
+
+
 def als_update(interaction, X, Y, reg, task, use_cg=True, 
-               num_threads=1, cg_steps=3):
-    if task == "rating" and use_cg:
-        _least_squares_cg(interaction.indices, interaction.indptr, 
-            interaction.data, X, Y, reg, num_threads, 0, cg_steps)
-    elif task == "rating" and not use_cg:
-        _least_squares(interaction.indices, interaction.indptr, 
-            interaction.data, X, Y, reg, num_threads, 0)
-    elif task == "ranking" and use_cg:
+               num_threads=1, cg_steps=3, YtY=None, compute_loss=False):
+    # YtY is the Gram matrix of Y, only used in implicit(ranking) task.
+    # Pass a cached one to avoid recomputing it in every call.
+    # The loss costs another pass over all interactions, so it is only
+    # computed if `compute_loss` is True, otherwise it stays zero.
+    cdef int implicit = 1 if task == "ranking" else 0
+    cdef int with_loss = 1 if compute_loss else 0
+    initialA = _initial_A(Y, reg, implicit, YtY)
+    thread_stats = np.zeros((num_threads, len(STAT_COLUMNS)), dtype=np.float64)
+    if use_cg:
         _least_squares_cg(interaction.indices, interaction.indptr, 
-            interaction.data, X, Y, reg, num_threads, 1, cg_steps)
-    elif task == "ranking" and not use_cg:
+            interaction.data, X, Y, initialA, thread_stats, num_threads, 
+            implicit, cg_steps, with_loss)
+    else:
         _least_squares(interaction.indices, interaction.indptr, 
-            interaction.data, X, Y, reg, num_threads, 1)
+            interaction.data, X, Y, initialA, thread_stats, num_threads, 
+            implicit, with_loss)
+    return {
+        col: thread_stats[:, i] for i, col in enumerate(STAT_COLUMNS)
+    }
+
+
+def _initial_A(Y, reg, implicit, YtY=None):
+    embed_size = Y.shape[1]
+    if implicit > 0:
+        if YtY is None:
+            YtY = np.dot(np.transpose(Y), Y)
+        initialA = YtY + reg * np.eye(embed_size, dtype=np.single)
+    else:
+        initialA = reg * np.eye(embed_size, dtype=np.single)
+    return np.ascontiguousarray(initialA, dtype=np.single)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double _row_loss(const int[:] indices, const int[:] indptr, 
+    const float[:] data, float[:, ::1] Y, float[:, ::1] initialA, 
+    float *x, float *buf, int m, int embed_size, int implicit) nogil:
+    # objective of row m after update, i.e. x^T @ initialA @ x plus
+    # implicit: sum((c-1) * (y @ x)^2 - 2c * (y @ x) + c)
+    # explicit: sum((r - y @ x)^2)
+    cdef int i, index, one = 1
+    cdef float alpha = 1.0, zero = 0.0, score, label
+    cdef double loss
+
+    symv("U", &embed_size, &alpha, &initialA[0, 0], &embed_size, x, &one, &zero, buf, &one)
+    loss = dot(&embed_size, x, &one, buf, &one)
+    for index in range(indptr[m], indptr[m+1]):
+        i = indices[index]
+        label = data[index]
+        score = dot(&embed_size, &Y[i, 0], &one, x, &one)
+        if implicit > 0:
+            loss += (label - 1) * score * score - 2 * label * score + label
+        else:
+            loss += (label - score) * (label - score)
+    return loss
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
 cdef void _least_squares(const int[:] indices, const int[:] indptr, 
-    const float[:] data, float[:, ::1] X, float[:, ::1] Y, double reg, 
-    int num_threads, int implicit):
+    const float[:] data, float[:, ::1] X, float[:, ::1] Y, 
+    float[:, ::1] initialA, double[:, ::1] thread_stats, int num_threads, 
+    int implicit, int with_loss):
     cdef int n_x = X.shape[0], embed_size = X.shape[1]
-    cdef int m, i, j, index, err, one = 1
+    cdef int m, i, j, t, index, err, one = 1
     cdef float rating, confidence, temp
 
-    cdef float[:, ::1] initialA
-    if implicit > 0:
-        initialA = np.dot(np.transpose(Y), Y) + reg * np.eye(embed_size, dtype=np.single)
-    else:
-        initialA = reg * np.eye(embed_size, dtype=np.single)
     cdef float[:] initialB = np.zeros(embed_size, dtype=np.single)
     cdef float *A
     cdef float *b
@@ -73,6 +120,8 @@ cdef void _least_squares(const int[:] indices, const int[:] indptr,
         b = <float *> malloc(sizeof(float) * embed_size)
         try:
             for m in prange(n_x, schedule="guided"):
+                t = threadid()
+                thread_stats[t, N_ROWS] += 1
                 memcpy(A, &initialA[0, 0], sizeof(float) * embed_size * embed_size)
                 memcpy(b, &initialB[0], sizeof(float) * embed_size)
 
@@ -103,6 +152,11 @@ cdef void _least_squares(const int[:] indices, const int[:] indptr,
                 posv("U", &embed_size, &one, A, &embed_size, b, &embed_size, &err)
                 if not err:
                     memcpy(&X[m, 0], b, sizeof(float) * embed_size)
+                    if with_loss > 0:
+                        # A is no longer needed, use it as buffer
+                        thread_stats[t, LOSS] += _row_loss(indices, indptr, 
+                            data, Y, initialA, &X[m, 0], A, m, embed_size, 
+                            implicit)
                 else:
                     with gil:
                         raise ValueError(f"cython_lapack.posv failed (err={err}) on row {m}. "
@@ -117,19 +171,14 @@ cdef void _least_squares(const int[:] indices, const int[:] indptr,
 @cython.wraparound(False)
 @cython.cdivision(True)
 cdef void _least_squares_cg(const int[:] indices, const int[:] indptr, 
-    const float[:] data, float[:, ::1] X, float[:, ::1] Y, double reg, 
-    int num_threads, int implicit, int cg_steps):
+    const float[:] data, float[:, ::1] X, float[:, ::1] Y, 
+    float[:, ::1] initialA, double[:, ::1] thread_stats, int num_threads, 
+    int implicit, int cg_steps, int with_loss):
     cdef int n_x = X.shape[0], embed_size = X.shape[1]
-    cdef int m, i, j, index, err, one = 1
+    cdef int m, i, j, t, index, err, one = 1
     cdef float rating, confidence, temp, rsold, rsnew, ak
     cdef float zero = 0.0
 
-    cdef float[:, ::1] initialA
-    if implicit > 0:
-        initialA = YtY = np.dot(np.transpose(Y), Y) + reg * np.eye(embed_size, dtype=np.single)
-    else:
-        initialA = reg * np.eye(embed_size, dtype=np.single)
-
     cdef float *x
     cdef float *p
     cdef float *r
@@ -141,6 +190,8 @@ cdef void _least_squares_cg(const int[:] indices, const int[:] indptr,
         r = <float *> malloc(sizeof(float) * embed_size)
         try:
             for m in prange(n_x, schedule="guided"):
+                t = threadid()
+                thread_stats[t, N_ROWS] += 1
                 x = &X[m, 0]
 
                 temp = -1.0
@@ -163,45 +214,49 @@ cdef void _least_squares_cg(const int[:] indices, const int[:] indptr,
 
                 memcpy(p, r, sizeof(float) * embed_size)
                 rsold = dot(&embed_size, r, &one, r, &one)
-                if rsold < 1e-10:
-                    continue
-
-                for j in range(cg_steps):
-                    temp = 1.0
-                    # compute Ap
-                    # first step: Ap = -(YtY + lambdaI)^T @ p  or  -(lambdaI @ p)
-                    symv("U", &embed_size, &temp, &initialA[0, 0], &embed_size, p, &one, &zero, Ap, &one)
-                    for index in range(indptr[m], indptr[m+1]):
-                        if implicit > 0:
-                            i = indices[index]
-                            confidence = data[index]
-                            # second step: Ap += (c-1) * (y @ x) * y
-                            temp = (confidence - 1) * dot(&embed_size, &Y[i, 0], &one, p, &one)
-                            axpy(&embed_size, &temp, &Y[i, 0], &one, Ap, &one)
-                        else:
-                            i = indices[index]
-                            # second step: Ap += (y @ x) * y
-                            temp = dot(&embed_size, &Y[i, 0], &one, p, &one)
-                            axpy(&embed_size, &temp, &Y[i, 0], &one, Ap, &one)
-
-                    # ak = rsold / p.dot(Ap)
-                    ak = rsold / dot(&embed_size, p, &one, Ap, &one)
-                    # x += ak * p
-                    axpy(&embed_size, &ak, p, &one, x, &one)
-                    # r -= alpha * Ap
-                    temp = ak * -1
-                    axpy(&embed_size, &temp, Ap, &one, r, &one)
-
-                    rsnew = dot(&embed_size, r, &one, r, &one)
-                    if rsnew < 1e-10:
-                        break
-
-                    # p = r + (rsnew/rsold) * p
-                    temp = rsnew / rsold
-                    scal(&embed_size, &temp, p, &one)
-                    temp = 1.0
-                    axpy(&embed_size, &temp, r, &one, p, &one)
-                    rsold = rsnew
+                if rsold >= 1e-10:
+                    for j in range(cg_steps):
+                        thread_stats[t, N_CG_ITERS] += 1
+                        temp = 1.0
+                        # compute Ap
+                        # first step: Ap = -(YtY + lambdaI)^T @ p  or  -(lambdaI @ p)
+                        symv("U", &embed_size, &temp, &initialA[0, 0], &embed_size, p, &one, &zero, Ap, &one)
+                        for index in range(indptr[m], indptr[m+1]):
+                            if implicit > 0:
+                                i = indices[index]
+                                confidence = data[index]
+                                # second step: Ap += (c-1) * (y @ x) * y
+                                temp = (confidence - 1) * dot(&embed_size, &Y[i, 0], &one, p, &one)
+                                axpy(&embed_size, &temp, &Y[i, 0], &one, Ap, &one)
+                            else:
+                                i = indices[index]
+                                # second step: Ap += (y @ x) * y
+                                temp = dot(&embed_size, &Y[i, 0], &one, p, &one)
+                                axpy(&embed_size, &temp, &Y[i, 0], &one, Ap, &one)
+
+                        # ak = rsold / p.dot(Ap)
+                        ak = rsold / dot(&embed_size, p, &one, Ap, &one)
+                        # x += ak * p
+                        axpy(&embed_size, &ak, p, &one, x, &one)
+                        # r -= alpha * Ap
+                        temp = ak * -1
+                        axpy(&embed_size, &temp, Ap, &one, r, &one)
+
+                        rsnew = dot(&embed_size, r, &one, r, &one)
+                        if rsnew < 1e-10:
+                            break
+
+                        # p = r + (rsnew/rsold) * p
+                        temp = rsnew / rsold
+                        scal(&embed_size, &temp, p, &one)
+                        temp = 1.0
+                        axpy(&embed_size, &temp, r, &one, p, &one)
+                        rsold = rsnew
+
+                if with_loss > 0:
+                    # Ap is no longer needed, use it as buffer
+                    thread_stats[t, LOSS] += _row_loss(indices, indptr, data, 
+                        Y, initialA, x, Ap, m, embed_size, implicit)
 
         finally:
             free(Ap)
@@ -1,8 +1,8 @@
 import numpy as np
 cimport numpy as np
 cimport cython
-from cython.parallel import parallel, prange
-from libc.math cimport exp as cexp, pow as cpow, sqrt as csqrt
+from cython.parallel import parallel, prange, threadid
+from libc.math cimport exp as cexp, pow as cpow, sqrt as csqrt, log1p
 from libcpp cimport bool
 from libcpp.algorithm cimport binary_search
 from libcpp.vector cimport vector
@@ -23,20 +23,165 @@ cdef extern from "<random>" namespace "std" nogil:
 @cython.wraparound(False)
 @cython.cdivision(True)
 cdef bool check_consumed(const int[:] indices, const int[:] indptr, 
+                         const np.int64_t[:] bitmap_offsets, 
+                         const np.uint64_t[:] bitmap, 
                          int user, int item_neg) nogil:
+    cdef np.int64_t offset = bitmap_offsets[user]
+    if offset >= 0:
+        return (bitmap[offset + (item_neg >> 6)] >> (item_neg & 63)) & 1
     return binary_search(&indices[indptr[user]], 
                          &indices[indptr[user+1]], 
                          item_neg)
 
 
+# columns of per-thread statistics collected by the kernels
+cdef enum:
+    N_SAMPLES = 0
+    N_REJECTED = 1
+    N_SKIPPED = 2
+    LOSS = 3
+STAT_COLUMNS = ("samples", "rejected", "skipped", "loss")
+
+
+cdef inline double _neg_log_sigmoid(float x) nogil:
+    # numerically stable -log(sigmoid(x))
+    if x > 0:
+        return log1p(cexp(-x))
+    return -x + log1p(cexp(x))
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def build_consumed_bitmap(sparse_interaction, n_items, min_density=0.0625):
+    """Build consumed-item bitmaps for heavy users.
+
+    Similar to roaring bitmap, users whose consumed ratio is at least
+    `min_density` get a dense bitmap over all items, which makes the
+    membership check O(1). The remaining light users are checked by binary
+    search on their csr row, which costs O(log k) for k consumed items.
+
+    A bitmap takes n_items bits whereas a csr row takes 32 bits per item,
+    so with the default threshold of 1/16 every bitmap is at most half the
+    size of its csr row, and the extra memory is bounded by half of the csr
+    indices. Lowering `min_density` gives more users the O(1) check at the
+    cost of n_items / 8 bytes for each of them, 0 builds a bitmap for every
+    user with at least one item, and values above 1 disable bitmaps.
+
+    Parameters
+    ----------
+    sparse_interaction : scipy.sparse.csr_matrix
+        User-item interaction matrix.
+    n_items : int
+        Number of items.
+    min_density : float, default 0.0625
+        Minimum consumed ratio for a user to get a bitmap.
+
+    Returns
+    -------
+    bitmap_offsets : numpy.ndarray
+        Start word of each user's bitmap, -1 if the user has no bitmap.
+    bitmap : numpy.ndarray
+        Concatenated uint64 bitmaps of all heavy users.
+    """
+    cdef const int[:] indices = sparse_interaction.indices
+    cdef const int[:] indptr = sparse_interaction.indptr
+    cdef Py_ssize_t u, index, n_users = len(indptr) - 1
+    cdef np.int64_t offset
+    cdef int item
+
+    n_words = (n_items + 63) // 64
+    counts = np.diff(sparse_interaction.indptr)
+    heavy = counts >= max(1, min_density * n_items)
+    offsets = np.full(n_users, -1, dtype=np.int64)
+    offsets[heavy] = np.arange(np.count_nonzero(heavy)) * n_words
+    words = np.zeros(np.count_nonzero(heavy) * n_words, dtype=np.uint64)
+
+    cdef np.int64_t[:] offsets_view = offsets
+    cdef np.uint64_t[:] words_view = words
+    with nogil:
+        for u in range(n_users):
+            offset = offsets_view[u]
+            if offset < 0:
+                continue
+            for index in range(indptr[u], indptr[u+1]):
+                item = indices[index]
+                words_view[offset + (item >> 6)] |= (
+                    (<np.uint64_t> 1) << (item & 63))
+    return offsets, words
+
+
+def warp_rank_weights(n_items):
+    # L(k) = sum_{j=1}^{k} 1/j, normalized by the largest possible rank
+    # so that the step size stays comparable with uniform sampling.
+    weights = np.zeros(n_items, dtype=np.float32)
+    weights[1:] = np.cumsum(1.0 / np.arange(1, n_items))
+    if n_items > 1:
+        weights /= weights[-1]
+    return weights
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef float _warp_sample(const int[:] sparse_indices, 
+                        const int[:] sparse_indptr, 
+                        const np.int64_t[:] bitmap_offsets, 
+                        const np.uint64_t[:] bitmap, 
+                        float[:, ::1] item_embed, 
+                        const float[:] rank_weights, 
+                        float *user_embed_ptr, 
+                        float *item_pos_embed_ptr, 
+                        int user, 
+                        int n_items, 
+                        int embed_size, 
+                        int max_sampled, 
+                        mt19937 *rng, 
+                        uniform_int_distribution[long] *dist, 
+                        Py_ssize_t *item_neg, 
+                        int *n_trials) nogil:
+    # Sample until finding a negative item that violates the margin,
+    # i.e. score(u, j) > score(u, i) - 1. The rank of the positive item is
+    # estimated from the number of trials, and the rank-based weight is
+    # returned. Return 0 if no violating item is found in max_sampled trials.
+    cdef int j, trial
+    cdef Py_ssize_t neg
+    cdef float pos_score = 0.0, neg_score
+    cdef float *item_neg_embed_ptr
+
+    for j in range(embed_size + 1):
+        pos_score = pos_score + user_embed_ptr[j] * item_pos_embed_ptr[j]
+
+    n_trials[0] = max_sampled
+    for trial in range(1, max_sampled + 1):
+        neg = dist[0](rng[0])
+        if check_consumed(sparse_indices, sparse_indptr, 
+                          bitmap_offsets, bitmap, user, neg):
+            continue
+
+        item_neg_embed_ptr = &item_embed[neg, 0]
+        neg_score = 0.0
+        for j in range(embed_size + 1):
+            neg_score = neg_score + user_embed_ptr[j] * item_neg_embed_ptr[j]
+        if neg_score > pos_score - 1.0:
+            item_neg[0] = neg
+            n_trials[0] = trial
+            return rank_weights[(n_items - 1) / trial]
+    return 0.0
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
 cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg, 
                  n_users, n_items, shuffle, num_threads, seed, epoch, 
+                 consumed_bitmap=None, sampler="uniform", max_sampled=10, 
                  u_velocity=None, i_velocity=None, momentum=0.9, 
                  u_1st_mom=None, i_1st_mom=None, u_2nd_mom=None, 
-                 i_2nd_mom=None, rho1=0.9, rho2=0.999):
+                 i_2nd_mom=None, rho1=0.9, rho2=0.999, user_grad=None, 
+                 item_grad=None, batch_size=256, compute_loss=False):
+    # The loss costs an extra log and exp per sample, so it is only
+    # computed if `compute_loss` is True, otherwise it stays zero.
+    cdef int with_loss = 1 if compute_loss else 0
 
     if train_data.has_sampled:
         user_indices = train_data.user_indices_orig.astype(np.int32)
@@ -48,6 +193,14 @@ cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
     sparse_interaction = train_data.sparse_interaction
     sparse_indices = sparse_interaction.indices
     sparse_indptr = sparse_interaction.indptr
+    if consumed_bitmap is None:
+        consumed_bitmap = build_consumed_bitmap(sparse_interaction, n_items)
+    bitmap_offsets, bitmap = consumed_bitmap
+
+    if sampler not in ("uniform", "warp"):
+        raise ValueError("sampler must either be 'uniform' or 'warp'")
+    warp = 1 if sampler == "warp" else 0
+    rank_weights = warp_rank_weights(n_items)
 
     if not reg:
         reg = 0.0
@@ -56,17 +209,25 @@ cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
         user_indices, item_indices = shuffle_data(
             len(user_indices), user_indices, item_indices)
 
+    thread_stats = np.zeros((num_threads, len(STAT_COLUMNS)), dtype=np.float64)
     if optimizer == "sgd":
         _bpr_update_sgd(user_indices,
                         item_indices,
                         sparse_indices,
                         sparse_indptr,
+                        bitmap_offsets,
+                        bitmap,
                         user_embed,
                         item_embed,
                         lr,
                         reg,
                         n_users,
                         n_items,
+                        warp,
+                        max_sampled,
+                        rank_weights,
+                        thread_stats,
+                        with_loss,
                         num_threads,
                         seed)
 
@@ -75,6 +236,8 @@ cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
                              item_indices,
                              sparse_indices,
                              sparse_indptr,
+                             bitmap_offsets,
+                             bitmap,
                              user_embed,
                              item_embed,
                              lr,
@@ -84,6 +247,11 @@ cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
                              u_velocity, 
                              i_velocity,  
                              momentum, 
+                             warp,
+                             max_sampled,
+                             rank_weights,
+                             thread_stats,
+                             with_loss,
                              num_threads,
                              seed)
 
@@ -92,6 +260,8 @@ cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
                          item_indices,
                          sparse_indices,
                          sparse_indptr,
+                         bitmap_offsets,
+                         bitmap,
                          user_embed,
                          item_embed,
                          lr,
@@ -105,9 +275,50 @@ cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
                          rho1, 
                          rho2, 
                          epoch, 
+                         warp,
+                         max_sampled,
+                         rank_weights,
+                         thread_stats,
+                         with_loss,
                          num_threads,
                          seed)
 
+    elif optimizer == "minibatch_adam":
+        n_batches = (len(user_indices) + batch_size - 1) // batch_size
+        _bpr_update_minibatch_adam(user_indices,
+                                   item_indices,
+                                   sparse_indices,
+                                   sparse_indptr,
+                                   bitmap_offsets,
+                                   bitmap,
+                                   user_embed,
+                                   item_embed,
+                                   lr,
+                                   reg,
+                                   n_users,
+                                   n_items,
+                                   u_1st_mom,
+                                   i_1st_mom,
+                                   u_2nd_mom,
+                                   i_2nd_mom,
+                                   user_grad,
+                                   item_grad,
+                                   rho1,
+                                   rho2,
+                                   batch_size,
+                                   (epoch - 1) * n_batches,
+                                   warp,
+                                   max_sampled,
+                                   rank_weights,
+                                   thread_stats,
+                                   with_loss,
+                                   num_threads,
+                                   seed)
+
+    return {
+        col: thread_stats[:, i] for i, col in enumerate(STAT_COLUMNS)
+    }
+
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
@@ -116,18 +327,26 @@ cdef void _bpr_update_sgd(const int[:] user_indices,
                           const int[:] item_indices, 
                           const int[:] sparse_indices, 
                           const int[:] sparse_indptr, 
+                          const np.int64_t[:] bitmap_offsets, 
+                          const np.uint64_t[:] bitmap, 
                           float[:, ::1] user_embed, 
                           float[:, ::1] item_embed, 
                           double lr, 
                           double reg, 
                           int n_users, 
                           int n_items, 
+                          int warp, 
+                          int max_sampled, 
+                          const float[:] rank_weights, 
+                          double[:, ::1] thread_stats, 
+                          int with_loss, 
                           int num_threads, 
                           int seed):
 
     cdef Py_ssize_t i, j, t, random_seed, user, item_pos, item_neg
+    cdef int n_trials
     cdef int length = len(user_indices), embed_size = user_embed.shape[1] - 1
-    cdef float item_diff, log_sigmoid_grad
+    cdef float item_diff, log_sigmoid_grad, weight
     cdef float user_grad, item_pos_grad, item_neg_grad
     cdef long lower_bound = 0, upper_bound = n_items - 1
 
@@ -146,13 +365,31 @@ cdef void _bpr_update_sgd(const int[:] user_indices,
 
     with nogil, parallel(num_threads=num_threads):
         for i in prange(length):
-            t = i % num_threads
+            t = threadid()
             user = user_indices[i]
             item_pos = item_indices[i]
-            item_neg = dist[t](rng[t])
-            while check_consumed(sparse_indices, sparse_indptr, 
-                                 user, item_neg):
+            if warp:
+                # assigned here so that it is thread private in prange
+                n_trials = 0
+                weight = _warp_sample(sparse_indices, sparse_indptr, 
+                                      bitmap_offsets, bitmap, item_embed, 
+                                      rank_weights, &user_embed[user, 0], 
+                                      &item_embed[item_pos, 0], user, 
+                                      n_items, embed_size, max_sampled, 
+                                      &rng[t], &dist[t], &item_neg, 
+                                      &n_trials)
+                if weight <= 0.0:
+                    thread_stats[t, N_REJECTED] += n_trials
+                    thread_stats[t, N_SKIPPED] += 1
+                    continue
+                thread_stats[t, N_REJECTED] += n_trials - 1
+            else:
+                weight = 1.0
                 item_neg = dist[t](rng[t])
+                while check_consumed(sparse_indices, sparse_indptr, 
+                                     bitmap_offsets, bitmap, user, item_neg):
+                    thread_stats[t, N_REJECTED] += 1
+                    item_neg = dist[t](rng[t])
 
             user_embed_ptr = &user_embed[user, 0]
             item_pos_embed_ptr = &item_embed[item_pos, 0]
@@ -162,7 +399,10 @@ cdef void _bpr_update_sgd(const int[:] user_indices,
             for j in range(embed_size + 1):
                 item_diff = item_diff + user_embed_ptr[j] * (
                     item_pos_embed_ptr[j] - item_neg_embed_ptr[j])
-            log_sigmoid_grad = 1.0 / (1.0 + cexp(item_diff))
+            log_sigmoid_grad = weight / (1.0 + cexp(item_diff))
+            thread_stats[t, N_SAMPLES] += 1
+            if with_loss > 0:
+                thread_stats[t, LOSS] += _neg_log_sigmoid(item_diff)
 
             for j in range(embed_size):
                 user_grad = log_sigmoid_grad * (
@@ -194,6 +434,8 @@ cdef void _bpr_update_momentum(const int[:] user_indices,
                                const int[:] item_indices, 
                                const int[:] sparse_indices, 
                                const int[:] sparse_indptr, 
+                               const np.int64_t[:] bitmap_offsets, 
+                               const np.uint64_t[:] bitmap, 
                                float[:, ::1] user_embed, 
                                float[:, ::1] item_embed, 
                                double lr, 
@@ -203,12 +445,18 @@ cdef void _bpr_update_momentum(const int[:] user_indices,
                                float[:, ::1] u_velocity, 
                                float[:, ::1] i_velocity, 
                                double momentum, 
+                               int warp, 
+                               int max_sampled, 
+                               const float[:] rank_weights, 
+                               double[:, ::1] thread_stats, 
+                               int with_loss, 
                                int num_threads, 
                                int seed):
 
     cdef Py_ssize_t i, j, t, random_seed, user, item_pos, item_neg
+    cdef int n_trials
     cdef int length = len(user_indices), embed_size = user_embed.shape[1] - 1
-    cdef float item_diff, log_sigmoid_grad
+    cdef float item_diff, log_sigmoid_grad, weight
     cdef float user_grad, item_pos_grad, item_neg_grad
     cdef long lower_bound = 0, upper_bound = n_items - 1
 
@@ -231,13 +479,31 @@ cdef void _bpr_update_momentum(const int[:] user_indices,
 
     with nogil, parallel(num_threads=num_threads):
         for i in prange(length):
-            t = i % num_threads
+            t = threadid()
             user = user_indices[i]
             item_pos = item_indices[i]
-            item_neg = dist[t](rng[t])
-            while check_consumed(sparse_indices, sparse_indptr, 
-                                 user, item_neg):
+            if warp:
+                # assigned here so that it is thread private in prange
+                n_trials = 0
+                weight = _warp_sample(sparse_indices, sparse_indptr, 
+                                      bitmap_offsets, bitmap, item_embed, 
+                                      rank_weights, &user_embed[user, 0], 
+                                      &item_embed[item_pos, 0], user, 
+                                      n_items, embed_size, max_sampled, 
+                                      &rng[t], &dist[t], &item_neg, 
+                                      &n_trials)
+                if weight <= 0.0:
+                    thread_stats[t, N_REJECTED] += n_trials
+                    thread_stats[t, N_SKIPPED] += 1
+                    continue
+                thread_stats[t, N_REJECTED] += n_trials - 1
+            else:
+                weight = 1.0
                 item_neg = dist[t](rng[t])
+                while check_consumed(sparse_indices, sparse_indptr, 
+                                     bitmap_offsets, bitmap, user, item_neg):
+                    thread_stats[t, N_REJECTED] += 1
+                    item_neg = dist[t](rng[t])
 
             user_embed_ptr = &user_embed[user, 0]
             item_pos_embed_ptr = &item_embed[item_pos, 0]
@@ -251,7 +517,10 @@ cdef void _bpr_update_momentum(const int[:] user_indices,
             for j in range(embed_size + 1):
                 item_diff = item_diff + user_embed_ptr[j] * (
                     item_pos_embed_ptr[j] - item_neg_embed_ptr[j])
-            log_sigmoid_grad = 1.0 / (1.0 + cexp(item_diff))
+            log_sigmoid_grad = weight / (1.0 + cexp(item_diff))
+            thread_stats[t, N_SAMPLES] += 1
+            if with_loss > 0:
+                thread_stats[t, LOSS] += _neg_log_sigmoid(item_diff)
 
             for j in range(embed_size + 1):
                 if j < embed_size:
@@ -288,6 +557,8 @@ cdef void _bpr_update_adam(const int[:] user_indices,
                            const int[:] item_indices, 
                            const int[:] sparse_indices, 
                            const int[:] sparse_indptr, 
+                           const np.int64_t[:] bitmap_offsets, 
+                           const np.uint64_t[:] bitmap, 
                            float[:, ::1] user_embed, 
                            float[:, ::1] item_embed, 
                            double lr, 
@@ -301,12 +572,18 @@ cdef void _bpr_update_adam(const int[:] user_indices,
                            double rho1, 
                            double rho2, 
                            int epoch, 
+                           int warp, 
+                           int max_sampled, 
+                           const float[:] rank_weights, 
+                           double[:, ::1] thread_stats, 
+                           int with_loss, 
                            int num_threads, 
                            int seed):
 
     cdef Py_ssize_t i, j, t, random_seed, user, item_pos, item_neg
+    cdef int n_trials
     cdef int length = len(user_indices), embed_size = user_embed.shape[1] - 1
-    cdef float item_diff, log_sigmoid_grad
+    cdef float item_diff, log_sigmoid_grad, weight
     cdef float user_grad, item_pos_grad, item_neg_grad
     cdef float unbias_v_user, unbias_h_user
     cdef float unbias_v_pos_item, unbias_h_pos_item
@@ -335,13 +612,31 @@ cdef void _bpr_update_adam(const int[:] user_indices,
 
     with nogil, parallel(num_threads=num_threads):
         for i in prange(length):
-            t = i % num_threads
+            t = threadid()
             user = user_indices[i]
             item_pos = item_indices[i]
-            item_neg = dist[t](rng[t])
-            while check_consumed(sparse_indices, sparse_indptr, 
-                                 user, item_neg):
+            if warp:
+                # assigned here so that it is thread private in prange
+                n_trials = 0
+                weight = _warp_sample(sparse_indices, sparse_indptr, 
+                                      bitmap_offsets, bitmap, item_embed, 
+                                      rank_weights, &user_embed[user, 0], 
+                                      &item_embed[item_pos, 0], user, 
+                                      n_items, embed_size, max_sampled, 
+                                      &rng[t], &dist[t], &item_neg, 
+                                      &n_trials)
+                if weight <= 0.0:
+                    thread_stats[t, N_REJECTED] += n_trials
+                    thread_stats[t, N_SKIPPED] += 1
+                    continue
+                thread_stats[t, N_REJECTED] += n_trials - 1
+            else:
+                weight = 1.0
                 item_neg = dist[t](rng[t])
+                while check_consumed(sparse_indices, sparse_indptr, 
+                                     bitmap_offsets, bitmap, user, item_neg):
+                    thread_stats[t, N_REJECTED] += 1
+                    item_neg = dist[t](rng[t])
 
             user_embed_ptr = &user_embed[user, 0]
             item_pos_embed_ptr = &item_embed[item_pos, 0]
@@ -358,7 +653,10 @@ cdef void _bpr_update_adam(const int[:] user_indices,
             for j in range(embed_size + 1):
                 item_diff = item_diff + user_embed_ptr[j] * (
                     item_pos_embed_ptr[j] - item_neg_embed_ptr[j])
-            log_sigmoid_grad = 1.0 / (1.0 + cexp(item_diff))
+            log_sigmoid_grad = weight / (1.0 + cexp(item_diff))
+            thread_stats[t, N_SAMPLES] += 1
+            if with_loss > 0:
+                thread_stats[t, LOSS] += _neg_log_sigmoid(item_diff)
 
             for j in range(embed_size + 1):
                 if j < embed_size:
@@ -408,3 +706,193 @@ cdef void _bpr_update_adam(const int[:] user_indices,
                 item_neg_embed_ptr[j] = item_neg_embed_ptr[j] + (
                     lr * unbias_v_neg_item / (csqrt(unbias_h_neg_item) + 1e-8))
 
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef inline void _adam_row(float *embed_ptr, 
+                           float *grad_ptr, 
+                           float *v_ptr, 
+                           float *h_ptr, 
+                           int size, 
+                           double lr, 
+                           double reg, 
+                           double rho1, 
+                           double rho2, 
+                           double bias_correction1, 
+                           double bias_correction2, 
+                           double grad_scale) nogil:
+    # gradient ascent on log sigmoid, then clear the accumulated gradient
+    cdef int j
+    cdef float grad
+    for j in range(size):
+        grad = grad_ptr[j] * grad_scale - reg * embed_ptr[j]
+        v_ptr[j] = rho1 * v_ptr[j] + (1.0 - rho1) * grad
+        h_ptr[j] = rho2 * h_ptr[j] + (1.0 - rho2) * grad * grad
+        embed_ptr[j] = embed_ptr[j] + lr * (v_ptr[j] / bias_correction1) / (
+            csqrt(h_ptr[j] / bias_correction2) + 1e-8)
+        grad_ptr[j] = 0.0
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _bpr_update_minibatch_adam(const int[:] user_indices, 
+                                     const int[:] item_indices, 
+                                     const int[:] sparse_indices, 
+                                     const int[:] sparse_indptr, 
+                                     const np.int64_t[:] bitmap_offsets, 
+                                     const np.uint64_t[:] bitmap, 
+                                     float[:, ::1] user_embed, 
+                                     float[:, ::1] item_embed, 
+                                     double lr, 
+                                     double reg, 
+                                     int n_users, 
+                                     int n_items, 
+                                     float[:, ::1] u_1st_mom, 
+                                     float[:, ::1] i_1st_mom, 
+                                     float[:, ::1] u_2nd_mom, 
+                                     float[:, ::1] i_2nd_mom, 
+                                     float[:, ::1] user_grad, 
+                                     float[:, ::1] item_grad, 
+                                     double rho1, 
+                                     double rho2, 
+                                     int batch_size, 
+                                     long start_step, 
+                                     int warp, 
+                                     int max_sampled, 
+                                     const float[:] rank_weights, 
+                                     double[:, ::1] thread_stats, 
+                                     int with_loss, 
+                                     int num_threads, 
+                                     int seed):
+    # Unlike the Hogwild updates above, all samples in a mini-batch are
+    # computed with the same parameters, and each parameter row is updated
+    # by exactly one thread, i.e. the same semantics as tf AdamOptimizer.
+    cdef Py_ssize_t i, j, r, s, k, t, random_seed, user, item_pos, item_neg
+    cdef Py_ssize_t b, batch_start, bs, n_touched_users, n_touched_items
+    cdef int n_trials
+    cdef int length = len(user_indices), embed_size = user_embed.shape[1] - 1
+    cdef long step = start_step
+    cdef float item_diff, weight, coef
+    cdef double bias_correction1, bias_correction2, grad_scale
+    cdef long lower_bound = 0, upper_bound = n_items - 1
+
+    cdef int[::1] batch_neg = np.empty(batch_size, dtype=np.int32)
+    cdef float[::1] batch_coef = np.empty(batch_size, dtype=np.float32)
+    cdef int[::1] touched_users = np.empty(batch_size, dtype=np.int32)
+    cdef int[::1] touched_items = np.empty(2 * batch_size, dtype=np.int32)
+    cdef np.uint8_t[::1] user_flag = np.zeros(n_users, dtype=np.uint8)
+    cdef np.uint8_t[::1] item_flag = np.zeros(n_items, dtype=np.uint8)
+
+    cdef vector[mt19937] rng
+    cdef vector[uniform_int_distribution[long]] dist
+
+    for i in range(num_threads):
+        random_seed = (seed + i * 11) % 7
+        rng.push_back(mt19937(random_seed))
+        dist.push_back(uniform_int_distribution[long](
+            lower_bound, upper_bound))
+
+    with nogil:
+        for b in range((length + batch_size - 1) / batch_size):
+            batch_start = b * batch_size
+            bs = length - batch_start
+            if bs > batch_size:
+                bs = batch_size
+            step = step + 1
+
+            # 1. sample negative items and compute gradient coefficients
+            for s in prange(bs, num_threads=num_threads):
+                t = threadid()
+                user = user_indices[batch_start + s]
+                item_pos = item_indices[batch_start + s]
+                if warp:
+                    # assigned here so that it is thread private in prange
+                    n_trials = 0
+                    weight = _warp_sample(sparse_indices, sparse_indptr, 
+                                          bitmap_offsets, bitmap, item_embed, 
+                                          rank_weights, &user_embed[user, 0], 
+                                          &item_embed[item_pos, 0], user, 
+                                          n_items, embed_size, max_sampled, 
+                                          &rng[t], &dist[t], &item_neg, 
+                                          &n_trials)
+                    if weight <= 0.0:
+                        thread_stats[t, N_REJECTED] += n_trials
+                        thread_stats[t, N_SKIPPED] += 1
+                        # zero coefficient, contributes no gradient
+                        batch_neg[s] = item_pos
+                        batch_coef[s] = 0.0
+                        continue
+                    thread_stats[t, N_REJECTED] += n_trials - 1
+                else:
+                    weight = 1.0
+                    item_neg = dist[t](rng[t])
+                    while check_consumed(sparse_indices, sparse_indptr, 
+                                         bitmap_offsets, bitmap, user, item_neg):
+                        thread_stats[t, N_REJECTED] += 1
+                        item_neg = dist[t](rng[t])
+
+                item_diff = 0
+                for j in range(embed_size + 1):
+                    item_diff = item_diff + user_embed[user, j] * (
+                        item_embed[item_pos, j] - item_embed[item_neg, j])
+                batch_neg[s] = item_neg
+                batch_coef[s] = weight / (1.0 + cexp(item_diff))
+                thread_stats[t, N_SAMPLES] += 1
+                if with_loss > 0:
+                    thread_stats[t, LOSS] += _neg_log_sigmoid(item_diff)
+
+            # 2. collect distinct rows touched by this batch
+            n_touched_users = 0
+            n_touched_items = 0
+            for k in range(bs):
+                user = user_indices[batch_start + k]
+                if not user_flag[user]:
+                    user_flag[user] = 1
+                    touched_users[n_touched_users] = user
+                    n_touched_users = n_touched_users + 1
+                item_pos = item_indices[batch_start + k]
+                if not item_flag[item_pos]:
+                    item_flag[item_pos] = 1
+                    touched_items[n_touched_items] = item_pos
+                    n_touched_items = n_touched_items + 1
+                item_neg = batch_neg[k]
+                if not item_flag[item_neg]:
+                    item_flag[item_neg] = 1
+                    touched_items[n_touched_items] = item_neg
+                    n_touched_items = n_touched_items + 1
+
+            # 3. accumulate gradients, parallel on embedding dimension
+            # so that different threads never write to the same element
+            for j in prange(embed_size + 1, num_threads=num_threads):
+                for r in range(bs):
+                    user = user_indices[batch_start + r]
+                    item_pos = item_indices[batch_start + r]
+                    item_neg = batch_neg[r]
+                    coef = batch_coef[r]
+                    if j < embed_size:
+                        user_grad[user, j] += coef * (
+                            item_embed[item_pos, j] - item_embed[item_neg, j])
+                    item_grad[item_pos, j] += coef * user_embed[user, j]
+                    item_grad[item_neg, j] -= coef * user_embed[user, j]
+
+            # 4. apply adam to every touched row, last dimension of user
+            # is fixed to 1.0 to be multiplied by item bias
+            bias_correction1 = 1.0 - cpow(rho1, step)
+            bias_correction2 = 1.0 - cpow(rho2, step)
+            grad_scale = 1.0 / bs
+            for k in prange(n_touched_users, num_threads=num_threads):
+                user = touched_users[k]
+                _adam_row(&user_embed[user, 0], &user_grad[user, 0], 
+                          &u_1st_mom[user, 0], &u_2nd_mom[user, 0], 
+                          embed_size, lr, reg, rho1, rho2, bias_correction1, 
+                          bias_correction2, grad_scale)
+                user_flag[user] = 0
+            for k in prange(n_touched_items, num_threads=num_threads):
+                item_pos = touched_items[k]
+                _adam_row(&item_embed[item_pos, 0], &item_grad[item_pos, 0], 
+                          &i_1st_mom[item_pos, 0], &i_2nd_mom[item_pos, 0], 
+                          embed_size + 1, lr, reg, rho1, rho2, 
+                          bias_correction1, bias_correction2, grad_scale)
+                item_flag[item_pos] = 0
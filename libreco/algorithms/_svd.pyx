@@ -0,0 +1,229 @@
+import numpy as np
+cimport numpy as np
+cimport cython
+from cython.parallel import parallel, prange, threadid
+from libc.math cimport exp as cexp, sqrt as csqrt, log1p
+from libc.stdlib cimport malloc, free
+
+from ..utils.misc import shuffle_data
+
+
+# columns of per-thread statistics collected by the kernels
+cdef enum:
+    N_SAMPLES = 0
+    LOSS = 1
+STAT_COLUMNS = ("samples", "loss")
+
+
+def svd_update(optimizer, train_data, bu, bi, pu, qi, global_mean, lr, reg,
+               task, shuffle, num_threads, epoch, yj=None,
+               implicit_interaction=None, moments=None, rho1=0.9,
+               rho2=0.999):
+    """Run one epoch of Hogwild-style SGD or Adam for SVD and SVD++.
+
+    Parameters are updated in place after every sample. If `yj` and
+    `implicit_interaction` are provided, the user factor becomes
+    pu + |N(u)|^-1/2 * sum(yj) as in SVD++.
+
+    `moments` is only used by "adam", which maps each parameter name to its
+    (first moment, second moment) arrays, e.g. {"bu": (bu_v, bu_h), ...}.
+    """
+    # contains negative items if the data has been sampled for ranking task
+    user_indices = train_data.user_indices.astype(np.int32)
+    item_indices = train_data.item_indices.astype(np.int32)
+    labels = train_data.labels.astype(np.float32)
+
+    if shuffle:
+        user_indices, item_indices, labels = shuffle_data(
+            len(user_indices), user_indices, item_indices, labels)
+
+    if optimizer not in ("sgd", "adam"):
+        raise ValueError("optimizer must either be 'sgd' or 'adam'")
+    if not reg:
+        reg = 0.0
+
+    # biases are viewed as one-column factors, so that all parameters
+    # share the same update routine.
+    params = [bu.reshape(-1, 1), bi.reshape(-1, 1), pu, qi]
+    svdpp = yj is not None
+    if svdpp:
+        params.append(yj)
+        implicit_indices = implicit_interaction.indices
+        implicit_indptr = implicit_interaction.indptr
+    else:
+        # placeholders, never accessed when svdpp is 0
+        params.append(np.zeros((1, 1), dtype=np.float32))
+        implicit_indices = np.zeros(1, dtype=np.int32)
+        implicit_indptr = np.zeros(1, dtype=np.int32)
+
+    adam = 1 if optimizer == "adam" else 0
+    names = ("bu", "bi", "pu", "qi", "yj")
+    first_moments, second_moments = [], []
+    for name, param in zip(names, params):
+        if adam and (name != "yj" or svdpp):
+            v, h = moments[name]
+            first_moments.append(v.reshape(param.shape))
+            second_moments.append(h.reshape(param.shape))
+        else:
+            first_moments.append(param)
+            second_moments.append(param)
+
+    thread_stats = np.zeros((num_threads, len(STAT_COLUMNS)), dtype=np.float64)
+    _svd_update(user_indices,
+                item_indices,
+                labels,
+                implicit_indices,
+                implicit_indptr,
+                params[0], params[1], params[2], params[3], params[4],
+                first_moments[0], first_moments[1], first_moments[2],
+                first_moments[3], first_moments[4],
+                second_moments[0], second_moments[1], second_moments[2],
+                second_moments[3], second_moments[4],
+                global_mean,
+                lr,
+                reg,
+                1 if task == "rating" else 0,
+                1 if svdpp else 0,
+                adam,
+                rho1,
+                rho2,
+                1.0 - rho1 ** epoch,
+                1.0 - rho2 ** epoch,
+                thread_stats,
+                num_threads)
+
+    return {
+        col: thread_stats[:, i] for i, col in enumerate(STAT_COLUMNS)
+    }
+
+
+@cython.cdivision(True)
+cdef inline void _step(float *param, float *v, float *h, float grad,
+                       double lr, int adam, double rho1, double rho2,
+                       double bias_correction1,
+                       double bias_correction2) nogil:
+    # gradient descent on a single parameter
+    if adam:
+        v[0] = rho1 * v[0] + (1.0 - rho1) * grad
+        h[0] = rho2 * h[0] + (1.0 - rho2) * grad * grad
+        param[0] -= lr * (v[0] / bias_correction1) / (
+            csqrt(h[0] / bias_correction2) + 1e-8)
+    else:
+        param[0] -= lr * grad
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _svd_update(const int[:] user_indices,
+                      const int[:] item_indices,
+                      const float[:] labels,
+                      const int[:] implicit_indices,
+                      const int[:] implicit_indptr,
+                      float[:, ::1] bu,
+                      float[:, ::1] bi,
+                      float[:, ::1] pu,
+                      float[:, ::1] qi,
+                      float[:, ::1] yj,
+                      float[:, ::1] bu_v,
+                      float[:, ::1] bi_v,
+                      float[:, ::1] pu_v,
+                      float[:, ::1] qi_v,
+                      float[:, ::1] yj_v,
+                      float[:, ::1] bu_h,
+                      float[:, ::1] bi_h,
+                      float[:, ::1] pu_h,
+                      float[:, ::1] qi_h,
+                      float[:, ::1] yj_h,
+                      double global_mean,
+                      double lr,
+                      double reg,
+                      int rating,
+                      int svdpp,
+                      int adam,
+                      double rho1,
+                      double rho2,
+                      double bias_correction1,
+                      double bias_correction2,
+                      double[:, ::1] thread_stats,
+                      int num_threads):
+
+    cdef Py_ssize_t i, j, t, user, item, index, imp
+    cdef int length = len(user_indices), embed_size = pu.shape[1]
+    cdef float label, pred, err, norm, grad
+
+    cdef float *z
+    cdef float *q
+
+    with nogil, parallel(num_threads=num_threads):
+        # z: user factor (with implicit part), q: item factor before update
+        z = <float *> malloc(sizeof(float) * embed_size)
+        q = <float *> malloc(sizeof(float) * embed_size)
+        try:
+            for i in prange(length):
+                t = threadid()
+                user = user_indices[i]
+                item = item_indices[i]
+                label = labels[i]
+
+                norm = 0.0
+                for j in range(embed_size):
+                    z[j] = pu[user, j]
+                    q[j] = qi[item, j]
+                if svdpp and implicit_indptr[user+1] > implicit_indptr[user]:
+                    norm = 1.0 / csqrt(
+                        implicit_indptr[user+1] - implicit_indptr[user])
+                    for index in range(implicit_indptr[user],
+                                       implicit_indptr[user+1]):
+                        imp = implicit_indices[index]
+                        for j in range(embed_size):
+                            z[j] += norm * yj[imp, j]
+
+                pred = bu[user, 0] + bi[item, 0]
+                for j in range(embed_size):
+                    pred = pred + z[j] * q[j]
+
+                thread_stats[t, N_SAMPLES] += 1
+                if rating:
+                    err = pred + global_mean - label
+                    thread_stats[t, LOSS] += err * err
+                else:
+                    # sigmoid cross entropy, err is the gradient of logit
+                    err = 1.0 / (1.0 + cexp(-pred)) - label
+                    if pred > 0:
+                        thread_stats[t, LOSS] += (
+                            log1p(cexp(-pred)) + (1.0 - label) * pred)
+                    else:
+                        thread_stats[t, LOSS] += (
+                            log1p(cexp(pred)) - label * pred)
+
+                _step(&bu[user, 0], &bu_v[user, 0], &bu_h[user, 0],
+                      err + reg * bu[user, 0], lr, adam, rho1, rho2,
+                      bias_correction1, bias_correction2)
+                _step(&bi[item, 0], &bi_v[item, 0], &bi_h[item, 0],
+                      err + reg * bi[item, 0], lr, adam, rho1, rho2,
+                      bias_correction1, bias_correction2)
+                for j in range(embed_size):
+                    grad = err * q[j] + reg * pu[user, j]
+                    _step(&pu[user, j], &pu_v[user, j], &pu_h[user, j],
+                          grad, lr, adam, rho1, rho2,
+                          bias_correction1, bias_correction2)
+                    grad = err * z[j] + reg * qi[item, j]
+                    _step(&qi[item, j], &qi_v[item, j], &qi_h[item, j],
+                          grad, lr, adam, rho1, rho2,
+                          bias_correction1, bias_correction2)
+
+                if svdpp and norm > 0.0:
+                    for index in range(implicit_indptr[user],
+                                       implicit_indptr[user+1]):
+                        imp = implicit_indices[index]
+                        for j in range(embed_size):
+                            grad = err * norm * q[j] + reg * yj[imp, j]
+                            _step(&yj[imp, j], &yj_v[imp, j], &yj_h[imp, j],
+                                  grad, lr, adam, rho1, rho2,
+                                  bias_correction1, bias_correction2)
+
+        finally:
+            free(z)
+            free(q)
+
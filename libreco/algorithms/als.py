@@ -15,12 +15,12 @@ author: massquantity
 """
 import time
 import logging
-from itertools import islice
 from functools import partial
 import numpy as np
+from scipy.sparse import csr_matrix
 from .base import Base
 from ..evaluate.evaluate import EvalMixin
-from ..utils.misc import time_block
+from ..utils.misc import time_block, colorize
 from ..utils.initializers import truncated_normal
 try:
     from ._als import als_update
@@ -63,6 +63,10 @@ class ALS(Base, EvalMixin):
         self.user_consumed = data_info.user_consumed
         self.user_embed = None
         self.item_embed = None
+        # cached Gram matrix of user_embed and item_embed,
+        # reset to None whenever the corresponding embedding changes.
+        self._user_gram = None
+        self._item_gram = None
 
         self._build_model()
     #    print("Als init end..")
@@ -73,9 +77,32 @@ class ALS(Base, EvalMixin):
             shape=[self.n_users, self.embed_size], mean=0.0, scale=0.03)
         self.item_embed = truncated_normal(
             shape=[self.n_items, self.embed_size], mean=0.0, scale=0.03)
+        self._user_gram = None
+        self._item_gram = None
+
+    @property
+    def user_gram(self):
+        """Gram matrix of user factors, i.e. XᵀX, computed lazily."""
+        if self._user_gram is None:
+            self._user_gram = self.user_embed.T @ self.user_embed
+        return self._user_gram
+
+    @property
+    def item_gram(self):
+        """Gram matrix of item factors, i.e. YᵀY, computed lazily."""
+        if self._item_gram is None:
+            self._item_gram = self.item_embed.T @ self.item_embed
+        return self._item_gram
 
     def fit(self, train_data, verbose=1, shuffle=True, use_cg=True,
-            n_threads=1, eval_data=None, metrics=None):
+            n_threads=1, eval_data=None, metrics=None, cg_steps=3,
+            compute_loss=False):
+        """Train with alternating least squares.
+
+        The training loss costs another pass over all interactions in each
+        epoch, so it is only computed if `compute_loss` is True or
+        `verbose` > 1, otherwise "loss" in `train_stats_` is None.
+        """
         self.show_start_time()
         user_interaction = train_data.sparse_interaction  # sparse.csr_matrix
         item_interaction = user_interaction.T.tocsr()
@@ -83,38 +110,134 @@ class ALS(Base, EvalMixin):
             self._check_has_sampled(train_data, verbose)
             user_interaction.data = user_interaction.data * self.alpha + 1
             item_interaction.data = item_interaction.data * self.alpha + 1
-        trainer = self._choose_algo(use_cg)
+        trainer = self._choose_algo(use_cg, cg_steps)
+        compute_loss = compute_loss or verbose > 1
 
+        self.train_stats_ = []
         for epoch in range(1, self.n_epochs + 1):
             with time_block(f"Epoch {epoch}", verbose):
-                trainer(interaction=user_interaction,
-                        X=self.user_embed,
-                        Y=self.item_embed,
-                        reg=self.reg,
-                        num_threads=n_threads)
-                trainer(interaction=item_interaction,
-                        X=self.item_embed,
-                        Y=self.user_embed,
-                        reg=self.reg,
-                        num_threads=n_threads)
-
+                start = time.perf_counter()
+                user_stats = trainer(interaction=user_interaction,
+                                     X=self.user_embed,
+                                     Y=self.item_embed,
+                                     reg=self.reg,
+                                     num_threads=n_threads,
+                                     YtY=self._gram_for_update("item"))
+                self._user_gram = None
+                item_stats = trainer(interaction=item_interaction,
+                                     X=self.item_embed,
+                                     Y=self.user_embed,
+                                     reg=self.reg,
+                                     num_threads=n_threads,
+                                     YtY=self._gram_for_update("user"),
+                                     compute_loss=compute_loss)
+                self._item_gram = None
+                elapsed = time.perf_counter() - start
+
+            epoch_stats = self._epoch_stats(
+                epoch, elapsed, user_stats, item_stats, use_cg, compute_loss)
+            self.train_stats_.append(epoch_stats)
             if verbose > 1:
+                train_loss_str = "train_loss: " + str(
+                    round(epoch_stats["loss"], 4)
+                )
+                print(f"\t {colorize(train_loss_str, 'green')}")
                 self.print_metrics(eval_data=eval_data, metrics=metrics)
                 print("="*30)
 
-    def _choose_algo(self, use_cg):
+    def _choose_algo(self, use_cg, cg_steps=3):
         if self.task == "rating":
             if use_cg:
-                trainer = partial(als_update, task="rating", use_cg=True)
+                trainer = partial(als_update, task="rating", use_cg=True,
+                                  cg_steps=cg_steps)
             else:
                 trainer = partial(als_update, task="rating", use_cg=False)
         elif self.task == "ranking":
             if use_cg:
-                trainer = partial(als_update, task="ranking", use_cg=True)
+                trainer = partial(als_update, task="ranking", use_cg=True,
+                                  cg_steps=cg_steps)
             else:
                 trainer = partial(als_update, task="ranking", use_cg=False)
         return trainer
 
+    @staticmethod
+    def _epoch_stats(epoch, elapsed, user_stats, item_stats, use_cg,
+                     compute_loss):
+        # loss is the objective after the item step, which includes
+        # the regularization of item factors only.
+        thread_rows = user_stats["rows"] + item_stats["rows"]
+        n_rows = int(np.sum(thread_rows))
+        cg_iters = np.sum(user_stats["cg_iters"] + item_stats["cg_iters"])
+        return {
+            "epoch": epoch,
+            "time": elapsed,
+            "rows": n_rows,
+            "rows_per_sec": n_rows / elapsed if elapsed > 0 else 0.0,
+            "thread_rows": thread_rows.astype(int).tolist(),
+            "avg_cg_iters": (
+                float(cg_iters / max(n_rows, 1)) if use_cg else None),
+            "loss": (float(np.sum(item_stats["loss"]))
+                     if compute_loss else None)
+        }
+
+    def _gram_for_update(self, fixed):
+        # only implicit least squares makes use of the whole YᵀY
+        if self.task != "ranking":
+            return None
+        return self.user_gram if fixed == "user" else self.item_gram
+
+    def fold_in_user(self, items, labels=None, use_cg=False, cg_steps=3):
+        """Compute the factor of a user from given interactions.
+
+        The item factors are fixed, so the cached item Gram matrix is
+        reused, which makes it suitable for real-time fold-in of new users
+        or users with fresh interactions.
+
+        Parameters
+        ----------
+        items : array_like
+            Item ids the user has interacted with.
+        labels : array_like, optional
+            Corresponding labels, required for rating task. For ranking
+            task the default is 1.0 for every item.
+        use_cg : bool, optional
+            Whether to use conjugate gradient method.
+        cg_steps : int, optional
+            Number of conjugate gradient steps.
+
+        Returns
+        -------
+        user_vector : numpy.ndarray
+            Factor of the user, shape: (embed_size,)
+        """
+        items = np.asarray(items, dtype=np.int32)
+        if labels is None:
+            if self.task == "rating":
+                raise ValueError("labels must be provided for rating task")
+            labels = np.ones(len(items), dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.float32)
+        if self.task == "ranking":
+            labels = labels * self.alpha + 1
+            mode = "implicit"
+        else:
+            mode = "explicit"
+
+        interaction = csr_matrix(
+            (labels, (np.zeros_like(items), items)),
+            shape=(1, self.n_items),
+            dtype=np.float32
+        )
+        user_vector = np.zeros((1, self.embed_size), dtype=np.float32)
+        gram = self.item_gram if mode == "implicit" else None
+        if use_cg:
+            _least_squares_cg(interaction, user_vector, self.item_embed,
+                              self.reg, self.embed_size, 1, mode,
+                              cg_steps, gram=gram)
+        else:
+            _least_squares(interaction, user_vector, self.item_embed,
+                           self.reg, self.embed_size, 1, mode, gram=gram)
+        return user_vector[0]
+
     def predict(self, user, item):
         user = np.asarray(
             [user]) if isinstance(user, int) else np.asarray(user)
@@ -148,22 +271,20 @@ class ALS(Base, EvalMixin):
         if not user:
             return   # popular ?
 
-        consumed = self.user_consumed[user]
-        count = n_rec + len(consumed)
+        consumed_index = self.data_info.consumed_index
+        count = n_rec + consumed_index.n_consumed(user)
         recos = self.user_embed[user] @ self.item_embed.T
         if self.task == "ranking":
             recos = 1 / (1 + np.exp(-recos))
 
         ids = np.argpartition(recos, -count)[-count:]
+        ids = ids[~consumed_index.contains(user, ids)]
         rank = sorted(zip(ids, recos[ids]), key=lambda x: -x[1])
-        return list(
-            islice(
-                (rec for rec in rank if rec[0] not in consumed), n_rec
-            )
-        )
+        return rank[:n_rec]
 
 
-def _least_squares(sparse_interaction, X, Y, reg, embed_size, num, mode):
+def _least_squares(sparse_interaction, X, Y, reg, embed_size, num, mode,
+                   gram=None):
     indices = sparse_interaction.indices
     indptr = sparse_interaction.indptr
     data = sparse_interaction.data
@@ -176,7 +297,9 @@ def _least_squares(sparse_interaction, X, Y, reg, embed_size, num, mode):
             b = interacted.T @ labels
             X[m] = np.linalg.solve(A, b)
     elif mode == "implicit":
-        init_A = Y.T @ Y + reg * np.eye(embed_size, dtype=np.float32)
+        if gram is None:
+            gram = Y.T @ Y
+        init_A = gram + reg * np.eye(embed_size, dtype=np.float32)
         for m in range(num):
             A = init_A.copy()
             b = np.zeros(embed_size, dtype=np.float32)
@@ -193,7 +316,7 @@ def _least_squares(sparse_interaction, X, Y, reg, embed_size, num, mode):
 
 # O(f^3) * m
 def _least_squares_cg(sparse_interaction, X, Y, reg, embed_size, num,
-                      mode, cg_steps=3):
+                      mode, cg_steps=3, gram=None):
     indices = sparse_interaction.indices
     indptr = sparse_interaction.indptr
     data = sparse_interaction.data
@@ -206,7 +329,9 @@ def _least_squares_cg(sparse_interaction, X, Y, reg, embed_size, num,
             b = interacted.T @ labels
             X[m] = np.linalg.solve(A, b)
     elif mode == "implicit":
-        init_A = Y.T @ Y + reg * np.eye(embed_size, dtype=np.float32)
+        if gram is None:
+            gram = Y.T @ Y
+        init_A = gram + reg * np.eye(embed_size, dtype=np.float32)
         for m in range(num):
             x = X[m]
             r = -init_A @ x
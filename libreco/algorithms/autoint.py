@@ -7,7 +7,6 @@ author: massquantity
 
 """
 import time
-from itertools import islice
 import numpy as np
 import tensorflow as tf2
 from tensorflow.keras.initializers import truncated_normal
@@ -16,7 +15,8 @@ from ..evaluate.evaluate import EvalMixin
 from ..utils.tf_ops import (
     reg_config,
     dropout_config,
-    lr_decay_config
+    lr_decay_config,
+    multi_sparse_embedding
 )
 from ..data.data_generator import DataGenFeat
 from ..utils.sampling import NegativeSampling
@@ -87,10 +87,19 @@ class AutoInt(Base, TfMixin, EvalMixin):
             self.sparse_field_size = self._sparse_field_size(data_info)
         if self.dense:
             self.dense_field_size = self._dense_field_size(data_info)
-
-    def _build_model(self):
+        self.multi_sparse = self._decide_multi_sparse(data_info)
+        if self.multi_sparse:
+            self.multi_sparse_feature_size = (
+                data_info.multi_sparse_feat_size)
+            self.multi_sparse_field_size = self._multi_sparse_field_size(
+                data_info)
+
+    def _build_model(self, input_pipeline="feed_dict"):
         tf.set_random_seed(self.seed)
-        self.labels = tf.placeholder(tf.float32, shape=[None])
+        if input_pipeline == "tf_data":
+            self._build_input_pipeline()
+        self.labels = self._input_placeholder(
+            "labels", tf.float32, [None])
         self.is_training = tf.placeholder_with_default(False, shape=[])
         self.concat_embed = []
 
@@ -99,6 +108,8 @@ class AutoInt(Base, TfMixin, EvalMixin):
             self._build_sparse()
         if self.dense:
             self._build_dense()
+        if self.multi_sparse:
+            self._build_multi_sparse()
 
         attention_layer = tf.concat(self.concat_embed, axis=1)
         for i in range(self.att_layer_num):
@@ -108,8 +119,10 @@ class AutoInt(Base, TfMixin, EvalMixin):
         self.output = tf.squeeze(tf.layers.dense(attention_layer, units=1))
 
     def _build_user_item(self):
-        self.user_indices = tf.placeholder(tf.int32, shape=[None])
-        self.item_indices = tf.placeholder(tf.int32, shape=[None])
+        self.user_indices = self._input_placeholder(
+            "user_indices", tf.int32, [None])
+        self.item_indices = self._input_placeholder(
+            "item_indices", tf.int32, [None])
 
         user_feat = tf.get_variable(
             name="user_feat",
@@ -133,8 +146,8 @@ class AutoInt(Base, TfMixin, EvalMixin):
         self.concat_embed.extend([user_embed, item_embed])
 
     def _build_sparse(self):
-        self.sparse_indices = tf.placeholder(
-            tf.int32, shape=[None, self.sparse_field_size])
+        self.sparse_indices = self._input_placeholder(
+            "sparse_indices", tf.int32, [None, self.sparse_field_size])
 
         sparse_feat = tf.get_variable(
             name="sparse_feat",
@@ -145,9 +158,27 @@ class AutoInt(Base, TfMixin, EvalMixin):
         sparse_embed = tf.nn.embedding_lookup(sparse_feat, self.sparse_indices)
         self.concat_embed.append(sparse_embed)
 
+    def _build_multi_sparse(self):
+        self.multi_sparse_indices = self._input_placeholder(
+            "multi_sparse_indices", tf.int32, [None])
+        self.multi_sparse_indptr = self._input_placeholder(
+            "multi_sparse_indptr", tf.int64, [None])
+
+        multi_sparse_feat = tf.get_variable(
+            name="multi_sparse_feat",
+            shape=[self.multi_sparse_feature_size, self.embed_size],
+            initializer=truncated_normal(0.0, 0.01),
+            regularizer=self.reg)
+
+        # B * F_multi * K
+        multi_sparse_embed = multi_sparse_embedding(
+            multi_sparse_feat, self.multi_sparse_indices,
+            self.multi_sparse_indptr, self.multi_sparse_field_size)
+        self.concat_embed.append(multi_sparse_embed)
+
     def _build_dense(self):
-        self.dense_values = tf.placeholder(
-            tf.float32, shape=[None, self.dense_field_size]
+        self.dense_values = self._input_placeholder(
+            "dense_values", tf.float32, [None, self.dense_field_size]
         )
         dense_values_reshape = tf.reshape(
             self.dense_values, [-1, self.dense_field_size, 1]
@@ -241,8 +272,10 @@ class AutoInt(Base, TfMixin, EvalMixin):
         self.sess.run(tf.global_variables_initializer())
 
     def fit(self, train_data, verbose=1, shuffle=True,
-            eval_data=None, metrics=None, **kwargs):
+            eval_data=None, metrics=None, input_pipeline="feed_dict",
+            prefetch_batches=0, num_workers=1, **kwargs):
         self.show_start_time()
+        self._check_input_pipeline(input_pipeline)
         if self.lr_decay:
             n_batches = int(len(train_data) / self.batch_size)
             self.lr, global_steps = lr_decay_config(self.lr, n_batches,
@@ -250,24 +283,37 @@ class AutoInt(Base, TfMixin, EvalMixin):
         else:
             global_steps = None
 
-        self._build_model()
+        self._build_model(input_pipeline)
         self._build_train_ops(global_steps)
 
-        if self.task == "ranking" and self.batch_sampling:
-            self._check_has_sampled(train_data, verbose)
-            data_generator = NegativeSampling(train_data,
-                                              self.data_info,
-                                              self.num_neg,
-                                              self.sparse,
-                                              self.dense,
-                                              batch_sampling=True)
-
+        if input_pipeline == "tf_data":
+            neg_sampling = self.task == "ranking" and self.batch_sampling
+            if neg_sampling:
+                self._check_has_sampled(train_data, verbose)
+            self.train_tf_data(train_data, verbose, shuffle, eval_data,
+                               metrics, neg_sampling)
         else:
-            data_generator = DataGenFeat(train_data,
-                                         self.sparse,
-                                         self.dense)
-
-        self.train_feat(data_generator, verbose, shuffle, eval_data, metrics)
+            if self.task == "ranking" and self.batch_sampling:
+                self._check_has_sampled(train_data, verbose)
+                data_generator = NegativeSampling(train_data,
+                                                  self.data_info,
+                                                  self.num_neg,
+                                                  self.sparse,
+                                                  self.dense,
+                                                  batch_sampling=True,
+                                                  prefetch_batches=(
+                                                      prefetch_batches),
+                                                  num_workers=num_workers)
+
+            else:
+                data_generator = DataGenFeat(train_data,
+                                             self.sparse,
+                                             self.dense,
+                                             prefetch_batches=prefetch_batches,
+                                             num_workers=num_workers)
+
+            self.train_feat(data_generator, verbose, shuffle,
+                            eval_data, metrics)
 
     def predict(self, user, item):
         user = np.asarray(
@@ -316,15 +362,12 @@ class AutoInt(Base, TfMixin, EvalMixin):
         if self.task == "ranking":
             recos = 1 / (1 + np.exp(-recos))
 
-        consumed = self.user_consumed[user]
-        count = n_rec + len(consumed)
+        consumed_index = self.data_info.consumed_index
+        count = n_rec + consumed_index.n_consumed(user)
         ids = np.argpartition(recos, -count)[-count:]
+        ids = ids[~consumed_index.contains(user, ids)]
         rank = sorted(zip(ids, recos[ids]), key=lambda x: -x[1])
-        return list(
-            islice(
-                (rec for rec in rank if rec[0] not in consumed), n_rec
-            )
-        )
+        return rank[:n_rec]
 
     @staticmethod
     def _att_config(att_embed_size):
@@ -3,11 +3,9 @@ import os
 import multiprocessing
 import time
 import numpy as np
-import tensorflow as tf2
-from ..utils.misc import time_block, colorize
+from ..utils.misc import time_block, colorize, import_tf
 from ..utils.exception import NotSamplingError
-tf = tf2.compat.v1
-tf.disable_v2_behavior()
+from ..utils.unique_features import get_multi_sparse_indices
 
 
 class Base(abc.ABC):
@@ -25,6 +23,7 @@ class Base(abc.ABC):
 
     def __init__(self, task, data_info, lower_upper_bound=None):
         self.task = task
+        self.data_info = data_info
         if task == "rating":
             if lower_upper_bound is not None:
                 assert isinstance(lower_upper_bound, (list, tuple)), (
@@ -88,6 +87,60 @@ class Base(abc.ABC):
         """
         raise NotImplementedError
 
+    def predict_raw(self, user, item):
+        """Predict score for raw user and item ids.
+
+        Ids are translated into indices by `data_info` in a vectorized way,
+        unknown ids are handled as default prediction.
+
+        Parameters
+        ----------
+        user : int, str or array_like
+            Raw user id or batch of raw user ids.
+        item : int, str or array_like
+            Raw item id or batch of raw item ids.
+
+        Returns
+        -------
+        prediction : float or array_like
+            Predicted scores for each user-item pair.
+        """
+        data_info = self._check_data_info()
+        user_indices = data_info.map_users(np.atleast_1d(user))
+        item_indices = data_info.map_items(np.atleast_1d(item))
+        return self.predict(user_indices, item_indices)
+
+    def recommend_raw(self, user, n_rec, **kwargs):
+        """Recommend a list of items for raw user id.
+
+        Parameters
+        ----------
+        user : int or str
+            Raw user id to recommend.
+        n_rec : int
+            number of recommendations to return.
+
+        Returns
+        -------
+        result : list of tuples
+            A recommendation list, each recommendation
+            contains a (raw_item_id, score) tuple.
+        """
+        data_info = self._check_data_info()
+        user_index = int(data_info.map_users(np.atleast_1d(user))[0])
+        rank = self.recommend_user(user_index, n_rec, **kwargs)
+        if not isinstance(rank, list) or not rank:
+            return rank
+        item_indices, scores = zip(*rank)
+        raw_items = data_info.decode_items(np.asarray(item_indices))
+        return list(zip(raw_items.tolist(), scores))
+
+    def _check_data_info(self):
+        if self.data_info is None:
+            raise ValueError(f"{self.__class__.__name__} has no data_info, "
+                             f"raw ids can't be translated")
+        return self.data_info
+
     def _check_unknown(self, user, item):
         unknown_user_indices = list(
             np.where(np.logical_or(user >= self.n_users, user < 0))[0])
@@ -156,8 +209,14 @@ class Base(abc.ABC):
     def _decide_dense_values(data_info):
         return False if not data_info.dense_col.name else True
 
+    @staticmethod
+    def _decide_multi_sparse(data_info):
+        return False if not data_info.multi_sparse_col.name else True
+
     @staticmethod
     def _sparse_feat_size(data_info):
+        if data_info.sparse_feat_size is not None:
+            return data_info.sparse_feat_size
         if (data_info.user_sparse_unique is not None
                 and data_info.item_sparse_unique is not None):
             return max(np.max(data_info.user_sparse_unique),
@@ -175,6 +234,10 @@ class Base(abc.ABC):
     def _dense_field_size(data_info):
         return len(data_info.dense_col.name)
 
+    @staticmethod
+    def _multi_sparse_field_size(data_info):
+        return len(data_info.multi_sparse_col.name)
+
     @staticmethod
     def show_start_time():
         start_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
@@ -184,9 +247,25 @@ class Base(abc.ABC):
 class TfMixin(object):
     def __init__(self, tf_sess_config=None):
         self.cpu_num = multiprocessing.cpu_count()
-        self.sess = self._sess_config(tf_sess_config)
+        self.tf_sess_config = tf_sess_config
+        self._sess = None
+        # batches of the tf.data pipeline, only built for "tf_data" input
+        self.pipeline_batch = None
+
+    @property
+    def sess(self):
+        # session is created when the model first uses it,
+        # i.e. when building its graph.
+        if self._sess is None:
+            self._sess = self._sess_config(self.tf_sess_config)
+        return self._sess
+
+    @sess.setter
+    def sess(self, sess):
+        self._sess = sess
 
     def _sess_config(self, tf_sess_config=None):
+        tf = import_tf()
         if not tf_sess_config:
             # Session config based on:
             # https://software.intel.com/content/www/us/en/develop/articles/tips-to-improve-performance-for-popular-deep-learning-frameworks-on-multi-core-cpus.html
@@ -201,23 +280,219 @@ class TfMixin(object):
         config = tf.ConfigProto(**tf_sess_config)
         return tf.Session(config=config)
 
-    def train_pure(self, data_generator, verbose, shuffle, eval_data, metrics):
-        for epoch in range(1, self.n_epochs + 1):
-            with time_block(f"Epoch {epoch}", verbose):
-                train_total_loss = []
-                for user, item, label, _, _ in data_generator(
-                        shuffle, self.batch_size
-                ):
-                    feed_dict = {self.user_indices: user,
-                                 self.item_indices: item,
-                                 self.labels: label}
-                    if hasattr(self, "is_training"):
-                        feed_dict.update({self.is_training: True})
+    def _build_input_pipeline(self, implicit=False):
+        """Build a tf.data pipeline that produces training batches in graph.
 
-                    train_loss, _ = self.sess.run(
-                        [self.loss, self.training_op], feed_dict=feed_dict)
+        Arrays of the whole training data are loaded into graph variables
+        only once by `train_tf_data`, then each epoch only feeds the order of
+        data indices. Gathering batches, negative sampling and prefetching
+        all run inside tensorflow, in parallel with the training step.
+        Batches become the default values of model inputs, see
+        `_input_placeholder`, so feeding inputs directly still works.
 
-                    train_total_loss.append(train_loss)
+        Negative sampling rejects consumed items exactly as
+        `sample_negatives`, but raises `InvalidArgumentError` if some are still
+        left after 100 rounds, i.e. users who consumed almost all items.
+
+        Parameters
+        ----------
+        implicit : bool, optional
+            Whether to also produce implicit interactions of batch users,
+            i.e. N(u) in SVD++, as a SparseTensor.
+        """
+        tf = import_tf()
+        sparse = getattr(self, "sparse", False)
+        dense = getattr(self, "dense", False)
+        num_neg = getattr(self, "num_neg", 1) or 1
+        n_items = self.n_items
+        data_info = self.data_info
+        # cap of rejection rounds in negative sampling
+        max_trials = 100
+
+        def _data_variable(dtype, shape):
+            # kept out of global variables, so they are neither initialized
+            # by `global_variables_initializer` nor saved with model weights
+            return tf.Variable(tf.placeholder(dtype, shape=shape),
+                               trainable=False, collections=[],
+                               validate_shape=False, use_resource=True)
+
+        with tf.name_scope("input_pipeline"):
+            columns = {
+                "user_indices": _data_variable(tf.int32, [None]),
+                "item_indices": _data_variable(tf.int32, [None]),
+                "labels": _data_variable(tf.float32, [None])
+            }
+            if sparse:
+                columns["sparse_indices"] = _data_variable(
+                    tf.int32, [None, self.sparse_field_size])
+            if dense:
+                columns["dense_values"] = _data_variable(
+                    tf.float32, [None, self.dense_field_size])
+
+            # data only used in the map functions, also loaded once
+            side = {
+                # sorted user * n_items + item of all consumed pairs
+                "consumed_keys": _data_variable(tf.int64, [None])
+            }
+            if sparse and data_info.item_sparse_col.index:
+                side["item_sparse_unique"] = _data_variable(
+                    tf.int32, [None, len(data_info.item_sparse_col.index)])
+            if dense and data_info.item_dense_col.index:
+                side["item_dense_unique"] = _data_variable(
+                    tf.float32, [None, len(data_info.item_dense_col.index)])
+            if implicit:
+                side["implicit_indices"] = _data_variable(tf.int64, [None])
+                side["implicit_indptr"] = _data_variable(tf.int64, [None])
+
+            # fed at every initialization of the iterator
+            epoch_feed = {
+                "order": tf.placeholder(tf.int64, shape=[None]),
+                "batch_size": tf.placeholder(tf.int64, shape=[]),
+                "neg_sampling": tf.placeholder_with_default(False, shape=[])
+            }
+
+            def _sample_negatives(batch):
+                users = batch["user_indices"]
+                items = batch["item_indices"]
+                n = tf.shape(users)[0]
+                keys_table = side["consumed_keys"].read_value()
+
+                def _consumed(neg):
+                    keys = (tf.cast(users[:, None], tf.int64) * n_items
+                            + tf.cast(neg, tf.int64))
+                    keys = tf.reshape(keys, [-1])
+                    pos = tf.minimum(
+                        tf.searchsorted(keys_table, keys, out_type=tf.int64),
+                        tf.size(keys_table, out_type=tf.int64) - 1)
+                    found = tf.equal(tf.gather(keys_table, pos), keys)
+                    return tf.reshape(found, [n, num_neg])
+
+                def _resample(trial, neg):
+                    new = tf.random.uniform([n, num_neg], maxval=n_items,
+                                            dtype=tf.int32)
+                    return trial + 1, tf.where(_consumed(neg), new, neg)
+
+                neg = tf.random.uniform([n, num_neg], maxval=n_items,
+                                        dtype=tf.int32)
+                # consumed items are drawn again until none is left, the cap
+                # only stops users who consumed almost all items from
+                # looping forever.
+                trials, neg = tf.while_loop(
+                    lambda trial, neg: tf.logical_and(
+                        trial < max_trials, tf.reduce_any(_consumed(neg))),
+                    _resample, [tf.constant(0), neg])
+                check = tf.debugging.Assert(
+                    tf.logical_not(tf.reduce_any(_consumed(neg))),
+                    [f"negative sampling still finds consumed items after "
+                     f"{max_trials} trials, some users may have consumed "
+                     f"almost all items"])
+                with tf.control_dependencies([check]):
+                    neg = tf.identity(neg)
+
+                factor = num_neg + 1
+                items_sampled = tf.reshape(
+                    tf.concat([items[:, None], neg], axis=1), [-1])
+                sampled = {
+                    "user_indices": tf.reshape(
+                        tf.tile(users[:, None], [1, factor]), [-1]),
+                    "item_indices": items_sampled,
+                    "labels": tf.reshape(
+                        tf.concat([tf.ones([n, 1]), tf.zeros([n, num_neg])],
+                                  axis=1), [-1])
+                }
+                if sparse:
+                    sampled["sparse_indices"] = _features_sampled(
+                        batch["sparse_indices"], items_sampled, factor,
+                        data_info.user_sparse_col.index,
+                        data_info.item_sparse_col.index,
+                        side.get("item_sparse_unique"))
+                if dense:
+                    sampled["dense_values"] = _features_sampled(
+                        batch["dense_values"], items_sampled, factor,
+                        data_info.user_dense_col.index,
+                        data_info.item_dense_col.index,
+                        side.get("item_dense_unique"))
+                return sampled
+
+            def _features_sampled(features, items_sampled, factor,
+                                  user_col, item_col, item_unique):
+                # same as `NegativeSampling._features_sampled`
+                parts = []
+                if user_col:
+                    user_features = tf.gather(features, user_col, axis=1)
+                    parts.append(tf.reshape(
+                        tf.tile(user_features, [1, factor]),
+                        [-1, len(user_col)]))
+                if item_col:
+                    parts.append(tf.gather(item_unique, items_sampled))
+                if user_col and item_col:
+                    orig_cols = user_col + item_col
+                    col_reindex = np.arange(
+                        len(orig_cols))[np.argsort(orig_cols)]
+                    return tf.gather(tf.concat(parts, axis=1), col_reindex,
+                                     axis=1)
+                return parts[0]
+
+            def _map_batch(batch_index):
+                # only indices are shuffled, rows are gathered per batch
+                batch = {k: tf.gather(v, batch_index)
+                         for k, v in columns.items()}
+                batch = tf.cond(epoch_feed["neg_sampling"],
+                                lambda: _sample_negatives(batch),
+                                lambda: batch)
+                if implicit:
+                    interaction = tf.RaggedTensor.from_row_splits(
+                        side["implicit_indices"].read_value(),
+                        side["implicit_indptr"].read_value())
+                    batch["user_implicit"] = tf.gather(
+                        interaction, batch["user_indices"]).to_sparse()
+                return batch
+
+            dataset = tf.data.Dataset.from_tensor_slices(epoch_feed["order"])
+            dataset = dataset.batch(epoch_feed["batch_size"])
+            autotune = tf.data.experimental.AUTOTUNE
+            dataset = dataset.map(_map_batch, num_parallel_calls=autotune)
+            dataset = dataset.prefetch(autotune)
+
+            self.pipeline_data = dict(columns, **side)
+            self.pipeline_feed = epoch_feed
+            self.pipeline_iterator = tf.data.make_initializable_iterator(
+                dataset)
+            self.pipeline_batch = self.pipeline_iterator.get_next()
+
+    def _check_input_pipeline(self, input_pipeline):
+        if input_pipeline not in ("feed_dict", "tf_data"):
+            raise ValueError("input_pipeline must either be 'feed_dict' "
+                             "or 'tf_data'")
+        if input_pipeline == "tf_data" and getattr(self, "multi_sparse",
+                                                   False):
+            raise ValueError("multi-hot sparse features are only supported "
+                             "by 'feed_dict' input_pipeline")
+
+    def _input_placeholder(self, name, dtype, shape):
+        """Placeholder of model input, which defaults to the batch produced by
+        the tf.data pipeline if it has been built."""
+        tf = import_tf()
+        batch = self.pipeline_batch
+        if batch is not None and name in batch:
+            return tf.placeholder_with_default(batch[name], shape=shape)
+        return tf.placeholder(dtype, shape=shape)
+
+    def _load_pipeline_data(self, arrays):
+        # run initializers of data variables, an empty array frees the
+        # memory of a variable
+        for name, var in self.pipeline_data.items():
+            self.sess.run(var.initializer, {var.initial_value: arrays[name]})
+
+    def _train_epochs(self, run_epoch, verbose, eval_data, metrics):
+        """Epoch loop shared by all input modes, `run_epoch(epoch)` runs the
+        training steps of one epoch and returns the loss of each batch."""
+        for epoch in range(1, self.n_epochs + 1):
+            if getattr(self, "lr_decay", False):
+                print(f"With lr_decay, epoch {epoch} learning rate: "
+                      f"{self.sess.run(self.lr)}")
+            with time_block(f"Epoch {epoch}", verbose):
+                train_total_loss = run_epoch(epoch)
 
             if verbose > 1:
                 train_loss_str = "train_loss: " + str(
@@ -233,28 +508,113 @@ class TfMixin(object):
                 self.print_metrics(eval_data=eval_data, metrics=metrics)
                 print("="*30)
 
-    def train_feat(self, data_generator, verbose, shuffle, eval_data, metrics):
-        for epoch in range(1, self.n_epochs + 1):
-            if self.lr_decay:
-                print(f"With lr_decay, epoch {epoch} learning rate: "
-                      f"{self.sess.run(self.lr)}")
-            with time_block(f"Epoch {epoch}", verbose):
-                train_total_loss = []
-                for u, i, label, si, dv in data_generator(
-                        shuffle, self.batch_size
-                ):
-                    feed_dict = self._get_feed_dict(u, i, si, dv, label, True)
+    def _pipeline_arrays(self, train_data, neg_sampling):
+        """Arrays of all data variables in the tf.data pipeline."""
+        if neg_sampling and train_data.has_sampled:
+            arrays = {
+                "user_indices": train_data.user_indices_orig,
+                "item_indices": train_data.item_indices_orig,
+                "labels": train_data.labels_orig,
+                "sparse_indices": train_data.sparse_indices_orig,
+                "dense_values": train_data.dense_values_orig
+            }
+        else:
+            arrays = {
+                "user_indices": train_data.user_indices,
+                "item_indices": train_data.item_indices,
+                "labels": train_data.labels,
+                "sparse_indices": train_data.sparse_indices,
+                "dense_values": train_data.dense_values
+            }
+        # placeholder values of side data which are not used
+        arrays["consumed_keys"] = np.zeros(1, dtype=np.int64)
+        if neg_sampling:
+            consumed = train_data.sparse_interaction.tocoo()
+            arrays["consumed_keys"] = np.sort(
+                consumed.row.astype(np.int64) * self.n_items + consumed.col)
+        arrays["item_sparse_unique"] = self.data_info.item_sparse_unique
+        arrays["item_dense_unique"] = self.data_info.item_dense_unique
+        if "implicit_indices" in self.pipeline_data:
+            arrays["implicit_indices"] = self.implicit_interaction.indices
+            arrays["implicit_indptr"] = self.implicit_interaction.indptr
+        return {k: arrays[k] for k in self.pipeline_data}
+
+    def train_tf_data(self, train_data, verbose, shuffle, eval_data,
+                      metrics, neg_sampling=False):
+        """Train with the tf.data pipeline built by `_build_input_pipeline`.
+
+        Unlike `train_pure` and `train_feat`, no batch is fed from python,
+        so the training steps don't wait for python batching.
+        """
+        tf = import_tf()
+        arrays = self._pipeline_arrays(train_data, neg_sampling)
+        data_size = len(arrays["user_indices"])
+        self._load_pipeline_data(arrays)
+
+        pipeline_feed = self.pipeline_feed
+        train_feed = ({self.is_training: True}
+                      if hasattr(self, "is_training") else None)
+
+        def _run_epoch(epoch):
+            order = (np.random.permutation(data_size) if shuffle
+                     else np.arange(data_size))
+            self.sess.run(self.pipeline_iterator.initializer,
+                          {pipeline_feed["order"]: order,
+                           pipeline_feed["batch_size"]: self.batch_size,
+                           pipeline_feed["neg_sampling"]: neg_sampling})
+            train_total_loss = []
+            while True:
+                try:
                     train_loss, _ = self.sess.run(
-                        [self.loss, self.training_op], feed_dict)
-                    train_total_loss.append(train_loss)
+                        [self.loss, self.training_op], train_feed)
+                except tf.errors.OutOfRangeError:
+                    break
+                train_total_loss.append(train_loss)
+            return train_total_loss
+
+        try:
+            self._train_epochs(_run_epoch, verbose, eval_data, metrics)
+        finally:
+            # data are only needed during training
+            self._load_pipeline_data(
+                {k: v[:0] for k, v in arrays.items()})
 
-            if verbose > 1:
-                train_loss_str = "train_loss: " + str(
-                    round(float(np.mean(train_total_loss)), 4)
-                )
-                print(f"\t {colorize(train_loss_str, 'green')}")
-                self.print_metrics(eval_data=eval_data, metrics=metrics)
-                print("="*30)
+    def train_pure(self, data_generator, verbose, shuffle, eval_data, metrics):
+        def _run_epoch(epoch):
+            train_total_loss = []
+            for user, item, label, _, _ in data_generator(
+                    shuffle, self.batch_size
+            ):
+                feed_dict = {self.user_indices: user,
+                             self.item_indices: item,
+                             self.labels: label}
+                if hasattr(self, "is_training"):
+                    feed_dict.update({self.is_training: True})
+                if hasattr(self, "user_implicit"):
+                    # svdpp, only implicit interactions of batch users
+                    feed_dict.update(self._get_implicit_feed_dict(user))
+
+                train_loss, _ = self.sess.run(
+                    [self.loss, self.training_op], feed_dict=feed_dict)
+
+                train_total_loss.append(train_loss)
+            return train_total_loss
+
+        self._train_epochs(_run_epoch, verbose, eval_data, metrics)
+
+    def train_feat(self, data_generator, verbose, shuffle, eval_data, metrics):
+        def _run_epoch(epoch):
+            train_total_loss = []
+            for u, i, label, si, dv in data_generator(
+                    shuffle, self.batch_size
+            ):
+                feed_dict = self._get_feed_dict(u, i, si, dv, label, True)
+                train_loss, _ = self.sess.run(
+                    [self.loss, self.training_op], feed_dict)
+                train_total_loss.append(train_loss)
+            return train_total_loss
+
+        self._train_epochs(_run_epoch, verbose, eval_data, metrics)
 
     def train_seq(self):
         pass  # TODO: combine train_feat and train_seq
@@ -270,6 +630,15 @@ class TfMixin(object):
             feed_dict.update({self.sparse_indices: sparse_indices})
         if self.dense:
             feed_dict.update({self.dense_values: dense_values})
+        if getattr(self, "multi_sparse", False):
+            # multi-hot features of batch users and items, which also
+            # covers sampled negative items without touching the samplers
+            multi_sparse = get_multi_sparse_indices(
+                self.data_info, user_indices, item_indices)
+            feed_dict.update({
+                self.multi_sparse_indices: multi_sparse.indices,
+                self.multi_sparse_indptr: multi_sparse.indptr
+            })
         if label is not None:
             feed_dict.update({self.labels: label})
         return feed_dict
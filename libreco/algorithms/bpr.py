@@ -8,28 +8,20 @@ author: massquantity
 """
 import time
 import logging
-from itertools import islice
 from functools import partial
 import numpy as np
-import tensorflow as tf2
-from tensorflow.keras.initializers import (
-    zeros as tf_zeros,
-    truncated_normal as tf_truncated_normal
-)
 from .base import Base, TfMixin
 from ..evaluate.evaluate import EvalMixin
 from ..utils.sampling import PairwiseSampling
-from ..utils.misc import time_block, colorize
+from ..utils.misc import time_block, colorize, import_tf
 from ..utils.initializers import truncated_normal
 try:
-    from ._bpr import bpr_update
+    from ._bpr import bpr_update, build_consumed_bitmap
 except (ImportError, ModuleNotFoundError):
     LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
     logging.basicConfig(format=LOG_FORMAT)
     logging.warning("BPR cython version is not available")
     pass  # may use tf version, then raise error will fail
-tf = tf2.compat.v1
-tf.disable_v2_behavior()
 
 
 class BPR(Base, TfMixin, EvalMixin):
@@ -89,6 +81,11 @@ class BPR(Base, TfMixin, EvalMixin):
         self.item_embed[:, self.embed_size] = 0.0
 
     def _build_model_tf(self):
+        tf = import_tf()
+        from tensorflow.keras.initializers import (
+            zeros as tf_zeros,
+            truncated_normal as tf_truncated_normal
+        )
         if isinstance(self.reg, float) and self.reg > 0.0:
             tf_reg = tf.keras.regularizers.l2(self.reg)
         else:
@@ -135,6 +132,7 @@ class BPR(Base, TfMixin, EvalMixin):
         self.log_sigmoid = tf.log_sigmoid(item_diff)
 
     def _build_train_ops(self):
+        tf = import_tf()
         self.loss = -self.log_sigmoid
         if self.reg is not None:
             reg_keys = tf.get_collection(tf.GraphKeys.REGULARIZATION_LOSSES)
@@ -147,20 +145,53 @@ class BPR(Base, TfMixin, EvalMixin):
         self.sess.run(tf.global_variables_initializer())
 
     def fit(self, train_data, verbose=1, shuffle=True, num_threads=1,
-            eval_data=None, metrics=None, optimizer="sgd"):
+            eval_data=None, metrics=None, optimizer="sgd", sampler="uniform",
+            max_sampled=10, compute_loss=False, bitmap_density=0.0625):
         self.show_start_time()
         self._check_has_sampled(train_data, verbose)
 
         if self.use_tf:
+            if sampler != "uniform":
+                raise ValueError(
+                    "only uniform sampler is supported when use_tf=True")
             self._fit_tf(train_data, verbose=verbose, shuffle=shuffle,
                          eval_data=eval_data, metrics=metrics)
         else:
             self._fit_cython(train_data, verbose=verbose, shuffle=shuffle,
                              num_threads=num_threads, eval_data=eval_data,
-                             metrics=metrics, optimizer=optimizer)
+                             metrics=metrics, optimizer=optimizer,
+                             sampler=sampler, max_sampled=max_sampled,
+                             compute_loss=compute_loss,
+                             bitmap_density=bitmap_density)
 
     def _fit_cython(self, train_data, verbose=1, shuffle=True, num_threads=1,
-                    eval_data=None, metrics=None, optimizer="sgd"):
+                    eval_data=None, metrics=None, optimizer="sgd",
+                    sampler="uniform", max_sampled=10, compute_loss=False,
+                    bitmap_density=0.0625):
+        """
+        optimizer "sgd", "momentum" and "adam" update parameters per sample
+        in Hogwild style, whereas "minibatch_adam" accumulates gradients of
+        `batch_size` samples before each update, which is the cython
+        counterpart of the tf version and allows large batches.
+
+        sampler "uniform" draws negative items uniformly, whereas "warp"
+        keeps drawing (at most `max_sampled` times) until finding an item
+        that violates the ranking margin, and weights the update by the
+        estimated rank of the positive item, as in WARP loss.
+
+        The training loss costs an extra log and exp per sample, so it is
+        only computed if `compute_loss` is True or `verbose` > 1, otherwise
+        "loss" in `train_stats_` is None.
+
+        Negative items are checked against a dense bitmap for users who
+        consumed at least `bitmap_density` of all items, and by binary
+        search for the others. Lowering it speeds up the check for more
+        users at the cost of n_items / 8 bytes per user, see
+        `build_consumed_bitmap`.
+        """
+        if sampler not in ("uniform", "warp"):
+            raise ValueError("sampler must either be 'uniform' or 'warp'")
+
         if optimizer == "sgd":
             trainer = partial(bpr_update)
 
@@ -189,29 +220,77 @@ class BPR(Base, TfMixin, EvalMixin):
                               rho1=rho1,
                               rho2=rho2)
 
+        elif optimizer == "minibatch_adam":
+            # all samples in a batch share the same parameters, and
+            # gradients are accumulated before updating, like the tf version
+            trainer = partial(bpr_update,
+                              u_1st_mom=np.zeros_like(self.user_embed),
+                              i_1st_mom=np.zeros_like(self.item_embed),
+                              u_2nd_mom=np.zeros_like(self.user_embed),
+                              i_2nd_mom=np.zeros_like(self.item_embed),
+                              user_grad=np.zeros_like(self.user_embed),
+                              item_grad=np.zeros_like(self.item_embed),
+                              rho1=0.9,
+                              rho2=0.999,
+                              batch_size=self.batch_size)
+
         else:
             raise ValueError("optimizer must be one of these: "
-                             "('sgd', 'momentum', 'adam')")
-
+                             "('sgd', 'momentum', 'adam', 'minibatch_adam')")
+
+        # consumed items of each user won't change during training,
+        # so build the index once and share it among all epochs.
+        consumed_bitmap = build_consumed_bitmap(train_data.sparse_interaction,
+                                                self.n_items, bitmap_density)
+        compute_loss = compute_loss or verbose > 1
+        self.train_stats_ = []
         for epoch in range(1, self.n_epochs + 1):
             with time_block(f"Epoch {epoch}", verbose):
-                trainer(optimizer=optimizer,
-                        train_data=train_data,
-                        user_embed=self.user_embed,
-                        item_embed=self.item_embed,
-                        lr=self.lr,
-                        reg=self.reg,
-                        n_users=self.n_users,
-                        n_items=self.n_items,
-                        shuffle=shuffle,
-                        num_threads=num_threads,
-                        seed=self.seed,
-                        epoch=epoch)
-
+                start = time.perf_counter()
+                thread_stats = trainer(optimizer=optimizer,
+                                       train_data=train_data,
+                                       user_embed=self.user_embed,
+                                       item_embed=self.item_embed,
+                                       lr=self.lr,
+                                       reg=self.reg,
+                                       n_users=self.n_users,
+                                       n_items=self.n_items,
+                                       shuffle=shuffle,
+                                       num_threads=num_threads,
+                                       seed=self.seed,
+                                       epoch=epoch,
+                                       consumed_bitmap=consumed_bitmap,
+                                       sampler=sampler,
+                                       max_sampled=max_sampled,
+                                       compute_loss=compute_loss)
+                elapsed = time.perf_counter() - start
+
+            epoch_stats = self._epoch_stats(
+                epoch, elapsed, thread_stats, compute_loss)
+            self.train_stats_.append(epoch_stats)
             if verbose > 1:
+                train_loss_str = "train_loss: " + str(
+                    round(epoch_stats["loss"], 4)
+                )
+                print(f"\t {colorize(train_loss_str, 'green')}")
                 self.print_metrics(eval_data=eval_data, metrics=metrics)
                 print("="*30)
 
+    @staticmethod
+    def _epoch_stats(epoch, elapsed, thread_stats, compute_loss):
+        n_samples = int(np.sum(thread_stats["samples"]))
+        return {
+            "epoch": epoch,
+            "time": elapsed,
+            "samples": n_samples,
+            "samples_per_sec": n_samples / elapsed if elapsed > 0 else 0.0,
+            "thread_samples": thread_stats["samples"].astype(int).tolist(),
+            "rejected_negatives": int(np.sum(thread_stats["rejected"])),
+            "skipped": int(np.sum(thread_stats["skipped"])),
+            "loss": (float(np.sum(thread_stats["loss"]) / max(n_samples, 1))
+                     if compute_loss else None)
+        }
+
     def _fit_tf(self, train_data, verbose=1, shuffle=True,
                 eval_data=None, metrics=None):
         data_generator = PairwiseSampling(train_data,
@@ -264,18 +343,15 @@ class BPR(Base, TfMixin, EvalMixin):
         if not user:
             return   # popular ?
 
-        consumed = self.user_consumed[user]
-        count = n_rec + len(consumed)
+        consumed_index = self.data_info.consumed_index
+        count = n_rec + consumed_index.n_consumed(user)
         recos = self.user_embed[user] @ self.item_embed.T
         recos = 1 / (1 + np.exp(-recos))
 
         ids = np.argpartition(recos, -count)[-count:]
+        ids = ids[~consumed_index.contains(user, ids)]
         rank = sorted(zip(ids, recos[ids]), key=lambda x: -x[1])
-        return list(
-            islice(
-                (rec for rec in rank if rec[0] not in consumed), n_rec
-            )
-        )
+        return rank[:n_rec]
 
     def _set_latent_factors(self):
         item_bias, user_embed, item_embed = self.sess.run(
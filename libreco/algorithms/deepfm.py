@@ -7,7 +7,6 @@ author: massquantity
 
 """
 import time
-from itertools import islice
 import numpy as np
 import tensorflow as tf2
 from tensorflow.keras.initializers import (
@@ -19,7 +18,8 @@ from ..utils.tf_ops import (
     reg_config,
     dropout_config,
     dense_nn,
-    lr_decay_config
+    lr_decay_config,
+    multi_sparse_embedding
 )
 from ..data.data_generator import DataGenFeat
 from ..utils.sampling import NegativeSampling
@@ -83,10 +83,19 @@ class DeepFM(Base, TfMixin, EvalMixin):
             self.sparse_field_size = self._sparse_field_size(data_info)
         if self.dense:
             self.dense_field_size = self._dense_field_size(data_info)
-
-    def _build_model(self):
+        self.multi_sparse = self._decide_multi_sparse(data_info)
+        if self.multi_sparse:
+            self.multi_sparse_feature_size = (
+                data_info.multi_sparse_feat_size)
+            self.multi_sparse_field_size = self._multi_sparse_field_size(
+                data_info)
+
+    def _build_model(self, input_pipeline="feed_dict"):
         tf.set_random_seed(self.seed)
-        self.labels = tf.placeholder(tf.float32, shape=[None])
+        if input_pipeline == "tf_data":
+            self._build_input_pipeline()
+        self.labels = self._input_placeholder(
+            "labels", tf.float32, [None])
         self.is_training = tf.placeholder_with_default(False, shape=[])
         self.linear_embed, self.pairwise_embed, self.deep_embed = [], [], []
 
@@ -95,6 +104,8 @@ class DeepFM(Base, TfMixin, EvalMixin):
             self._build_sparse()
         if self.dense:
             self._build_dense()
+        if self.multi_sparse:
+            self._build_multi_sparse()
 
         linear_embed = tf.concat(self.linear_embed, axis=1)
         pairwise_embed = tf.concat(self.pairwise_embed, axis=1)
@@ -117,8 +128,10 @@ class DeepFM(Base, TfMixin, EvalMixin):
             tf.layers.dense(concat_layer, units=1, activation=None))
 
     def _build_user_item(self):
-        self.user_indices = tf.placeholder(tf.int32, shape=[None])
-        self.item_indices = tf.placeholder(tf.int32, shape=[None])
+        self.user_indices = self._input_placeholder(
+            "user_indices", tf.int32, [None])
+        self.item_indices = self._input_placeholder(
+            "item_indices", tf.int32, [None])
 
         linear_user_feat = tf.get_variable(
             name="linear_user_feat",
@@ -162,8 +175,8 @@ class DeepFM(Base, TfMixin, EvalMixin):
         self.deep_embed.extend([deep_user_embed, deep_item_embed])
 
     def _build_sparse(self):
-        self.sparse_indices = tf.placeholder(
-            tf.int32, shape=[None, self.sparse_field_size])
+        self.sparse_indices = self._input_placeholder(
+            "sparse_indices", tf.int32, [None, self.sparse_field_size])
 
         linear_sparse_feat = tf.get_variable(
             name="linear_sparse_feat",
@@ -188,9 +201,42 @@ class DeepFM(Base, TfMixin, EvalMixin):
         self.pairwise_embed.append(pairwise_sparse_embed)
         self.deep_embed.append(deep_sparse_embed)
 
+    def _build_multi_sparse(self):
+        self.multi_sparse_indices = self._input_placeholder(
+            "multi_sparse_indices", tf.int32, [None])
+        self.multi_sparse_indptr = self._input_placeholder(
+            "multi_sparse_indptr", tf.int64, [None])
+
+        linear_multi_sparse_feat = tf.get_variable(
+            name="linear_multi_sparse_feat",
+            shape=[self.multi_sparse_feature_size, 1],
+            initializer=tf_truncated_normal(0.0, 0.01),
+            regularizer=self.reg)
+        embed_multi_sparse_feat = tf.get_variable(
+            name="embed_multi_sparse_feat",
+            shape=[self.multi_sparse_feature_size, self.embed_size],
+            initializer=tf_truncated_normal(0.0, 0.01),
+            regularizer=self.reg)
+
+        linear_multi_sparse_embed = tf.reshape(    # B * F3
+            multi_sparse_embedding(
+                linear_multi_sparse_feat, self.multi_sparse_indices,
+                self.multi_sparse_indptr, self.multi_sparse_field_size),
+            [-1, self.multi_sparse_field_size])
+        pairwise_multi_sparse_embed = multi_sparse_embedding(  # B * F3 * K
+            embed_multi_sparse_feat, self.multi_sparse_indices,
+            self.multi_sparse_indptr, self.multi_sparse_field_size)
+        deep_multi_sparse_embed = tf.reshape(
+            pairwise_multi_sparse_embed,
+            [-1, self.multi_sparse_field_size * self.embed_size]
+        )
+        self.linear_embed.append(linear_multi_sparse_embed)
+        self.pairwise_embed.append(pairwise_multi_sparse_embed)
+        self.deep_embed.append(deep_multi_sparse_embed)
+
     def _build_dense(self):
-        self.dense_values = tf.placeholder(
-            tf.float32, shape=[None, self.dense_field_size])
+        self.dense_values = self._input_placeholder(
+            "dense_values", tf.float32, [None, self.dense_field_size])
         dense_values_reshape = tf.reshape(
             self.dense_values, [-1, self.dense_field_size, 1])
         batch_size = tf.shape(self.dense_values)[0]
@@ -252,8 +298,10 @@ class DeepFM(Base, TfMixin, EvalMixin):
         self.sess.run(tf.global_variables_initializer())
 
     def fit(self, train_data, verbose=1, shuffle=True,
-            eval_data=None, metrics=None, **kwargs):
+            eval_data=None, metrics=None, input_pipeline="feed_dict",
+            prefetch_batches=0, num_workers=1, **kwargs):
         self.show_start_time()
+        self._check_input_pipeline(input_pipeline)
         if self.lr_decay:
             n_batches = int(len(train_data) / self.batch_size)
             self.lr, global_steps = lr_decay_config(self.lr, n_batches,
@@ -261,24 +309,37 @@ class DeepFM(Base, TfMixin, EvalMixin):
         else:
             global_steps = None
 
-        self._build_model()
+        self._build_model(input_pipeline)
         self._build_train_ops(global_steps)
 
-        if self.task == "ranking" and self.batch_sampling:
-            self._check_has_sampled(train_data, verbose)
-            data_generator = NegativeSampling(train_data,
-                                              self.data_info,
-                                              self.num_neg,
-                                              self.sparse,
-                                              self.dense,
-                                              batch_sampling=True)
-
+        if input_pipeline == "tf_data":
+            neg_sampling = self.task == "ranking" and self.batch_sampling
+            if neg_sampling:
+                self._check_has_sampled(train_data, verbose)
+            self.train_tf_data(train_data, verbose, shuffle, eval_data,
+                               metrics, neg_sampling)
         else:
-            data_generator = DataGenFeat(train_data,
-                                         self.sparse,
-                                         self.dense)
-
-        self.train_feat(data_generator, verbose, shuffle, eval_data, metrics)
+            if self.task == "ranking" and self.batch_sampling:
+                self._check_has_sampled(train_data, verbose)
+                data_generator = NegativeSampling(train_data,
+                                                  self.data_info,
+                                                  self.num_neg,
+                                                  self.sparse,
+                                                  self.dense,
+                                                  batch_sampling=True,
+                                                  prefetch_batches=(
+                                                      prefetch_batches),
+                                                  num_workers=num_workers)
+
+            else:
+                data_generator = DataGenFeat(train_data,
+                                             self.sparse,
+                                             self.dense,
+                                             prefetch_batches=prefetch_batches,
+                                             num_workers=num_workers)
+
+            self.train_feat(data_generator, verbose, shuffle,
+                            eval_data, metrics)
 
     def predict(self, user, item):
         user = np.asarray(
@@ -327,14 +388,11 @@ class DeepFM(Base, TfMixin, EvalMixin):
         if self.task == "ranking":
             recos = 1 / (1 + np.exp(-recos))
 
-        consumed = self.user_consumed[user]
-        count = n_rec + len(consumed)
+        consumed_index = self.data_info.consumed_index
+        count = n_rec + consumed_index.n_consumed(user)
         ids = np.argpartition(recos, -count)[-count:]
+        ids = ids[~consumed_index.contains(user, ids)]
         rank = sorted(zip(ids, recos[ids]), key=lambda x: -x[1])
-        return list(
-            islice(
-                (rec for rec in rank if rec[0] not in consumed), n_rec
-            )
-        )
+        return rank[:n_rec]
 
 
@@ -6,7 +6,6 @@ Reference: Guorui Zhou et al.  "Deep Interest Network for Click-Through Rate Pre
 author: massquantity
 
 """
-from itertools import islice
 import numpy as np
 import tensorflow as tf2
 from tensorflow.keras.initializers import (
@@ -335,7 +334,8 @@ class DIN(Base, TfMixin, EvalMixin):
         self.sess.run(tf.global_variables_initializer())
 
     def fit(self, train_data, verbose=1, shuffle=True,
-            eval_data=None, metrics=None, **kwargs):
+            eval_data=None, metrics=None, prefetch_batches=0,
+            num_workers=1, **kwargs):
         self.show_start_time()
         if self.lr_decay:
             n_batches = int(len(train_data) / self.batch_size)
@@ -351,7 +351,9 @@ class DIN(Base, TfMixin, EvalMixin):
                                          self.sparse, self.dense,
                                          mode=self.interaction_mode,
                                          num=self.max_seq_len,
-                                         padding_idx=0)
+                                         padding_idx=0,
+                                         prefetch_batches=prefetch_batches,
+                                         num_workers=num_workers)
         for epoch in range(1, self.n_epochs + 1):
             if self.lr_decay:
                 print(f"With lr_decay, epoch {epoch} learning rate: "
@@ -427,15 +429,12 @@ class DIN(Base, TfMixin, EvalMixin):
 
         recos = self.sess.run(self.output, feed_dict)
         recos = 1 / (1 + np.exp(-recos))
-        consumed = self.user_consumed[user]
-        count = n_rec + len(consumed)
+        consumed_index = self.data_info.consumed_index
+        count = n_rec + consumed_index.n_consumed(user)
         ids = np.argpartition(recos, -count)[-count:]
+        ids = ids[~consumed_index.contains(user, ids)]
         rank = sorted(zip(ids, recos[ids]), key=lambda x: -x[1])
-        return list(
-            islice(
-                (rec for rec in rank if rec[0] not in consumed), n_rec
-            )
-        )
+        return rank[:n_rec]
 
     def _set_last_interacted(self):
         user_indices = np.arange(self.n_users)
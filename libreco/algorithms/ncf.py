@@ -6,7 +6,6 @@ author: massquantity
 
 """
 import time
-from itertools import islice
 import numpy as np
 import tensorflow as tf2
 from tensorflow.keras.initializers import (
@@ -72,10 +71,15 @@ class NCF(Base, TfMixin, EvalMixin):
         self.seed = seed
         self.user_consumed = data_info.user_consumed
 
-    def _build_model(self):
-        self.user_indices = tf.placeholder(tf.int32, shape=[None])
-        self.item_indices = tf.placeholder(tf.int32, shape=[None])
-        self.labels = tf.placeholder(tf.float32, shape=[None])
+    def _build_model(self, input_pipeline="feed_dict"):
+        if input_pipeline == "tf_data":
+            self._build_input_pipeline()
+        self.user_indices = self._input_placeholder(
+            "user_indices", tf.int32, [None])
+        self.item_indices = self._input_placeholder(
+            "item_indices", tf.int32, [None])
+        self.labels = self._input_placeholder(
+            "labels", tf.float32, [None])
         self.is_training = tf.placeholder_with_default(False, shape=[])
 
         user_gmf = tf.get_variable(name="user_gmf",
@@ -135,8 +139,10 @@ class NCF(Base, TfMixin, EvalMixin):
         self.sess.run(tf.global_variables_initializer())
 
     def fit(self, train_data, verbose=1, shuffle=True,
-            eval_data=None, metrics=None, **kwargs):
+            eval_data=None, metrics=None, input_pipeline="feed_dict",
+            **kwargs):
         self.show_start_time()
+        self._check_input_pipeline(input_pipeline)
         if self.lr_decay:
             n_batches = int(len(train_data) / self.batch_size)
             self.lr, global_steps = lr_decay_config(self.lr, n_batches,
@@ -144,21 +150,29 @@ class NCF(Base, TfMixin, EvalMixin):
         else:
             global_steps = None
 
-        self._build_model()
+        self._build_model(input_pipeline)
         self._build_train_ops(global_steps)
 
-        if self.task == "ranking" and self.batch_sampling:
-            self._check_has_sampled(train_data, verbose)
-            data_generator = NegativeSampling(train_data,
-                                              self.data_info,
-                                              self.num_neg,
-                                              self.batch_size,
-                                              batch_sampling=True)
-
+        if input_pipeline == "tf_data":
+            neg_sampling = self.task == "ranking" and self.batch_sampling
+            if neg_sampling:
+                self._check_has_sampled(train_data, verbose)
+            self.train_tf_data(train_data, verbose, shuffle, eval_data,
+                               metrics, neg_sampling)
         else:
-            data_generator = DataGenPure(train_data)
+            if self.task == "ranking" and self.batch_sampling:
+                self._check_has_sampled(train_data, verbose)
+                data_generator = NegativeSampling(train_data,
+                                                  self.data_info,
+                                                  self.num_neg,
+                                                  self.batch_size,
+                                                  batch_sampling=True)
+
+            else:
+                data_generator = DataGenPure(train_data)
 
-        self.train_pure(data_generator, verbose, shuffle, eval_data, metrics)
+            self.train_pure(data_generator, verbose, shuffle,
+                            eval_data, metrics)
 
     def predict(self, user, item):
         user = np.asarray(
@@ -200,15 +214,12 @@ class NCF(Base, TfMixin, EvalMixin):
         if self.task == "ranking":
             recos = 1 / (1 + np.exp(-recos))
 
-        consumed = self.user_consumed[user]
-        count = n_rec + len(consumed)
+        consumed_index = self.data_info.consumed_index
+        count = n_rec + consumed_index.n_consumed(user)
         ids = np.argpartition(recos, -count)[-count:]
+        ids = ids[~consumed_index.contains(user, ids)]
         rank = sorted(zip(ids, recos[ids]), key=lambda x: -x[1])
-        return list(
-            islice(
-                (rec for rec in rank if rec[0] not in consumed), n_rec
-            )
-        )
+        return rank[:n_rec]
 
 
 
@@ -7,20 +7,21 @@ author: massquantity
 
 """
 import time
-from itertools import islice
+import logging
 import numpy as np
-import tensorflow as tf2
-from tensorflow.keras.initializers import (
-    zeros as tf_zeros,
-    truncated_normal as tf_truncated_normal
-)
 from .base import Base, TfMixin
 from ..evaluate.evaluate import EvalMixin
-from ..utils.tf_ops import reg_config
 from ..utils.sampling import NegativeSampling
 from ..data.data_generator import DataGenPure
-tf = tf2.compat.v1
-tf.disable_v2_behavior()
+from ..utils.misc import time_block, colorize, import_tf
+from ..utils.initializers import truncated_normal
+try:
+    from ._svd import svd_update
+except (ImportError, ModuleNotFoundError):
+    LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+    logging.basicConfig(format=LOG_FORMAT)
+    logging.warning("SVD cython version is not available")
+    pass
 
 
 class SVD(Base, TfMixin, EvalMixin):
@@ -37,10 +38,10 @@ class SVD(Base, TfMixin, EvalMixin):
             num_neg=1,
             seed=42,
             lower_upper_bound=None,
-            tf_sess_config=None
+            tf_sess_config=None,
+            use_tf=True
     ):
         Base.__init__(self, task, data_info, lower_upper_bound)
-        TfMixin.__init__(self, tf_sess_config)
         EvalMixin.__init__(self, task)
 
         self.task = task
@@ -48,7 +49,7 @@ class SVD(Base, TfMixin, EvalMixin):
         self.embed_size = embed_size
         self.n_epochs = n_epochs
         self.lr = lr
-        self.reg = reg_config(reg)
+        self.reg = reg
         self.batch_size = batch_size
         self.batch_sampling = batch_sampling
         self.num_neg = num_neg
@@ -58,36 +59,61 @@ class SVD(Base, TfMixin, EvalMixin):
         self.default_prediction = data_info.global_mean if (
                 task == "rating") else 0.0
         self.seed = seed
+        self.use_tf = use_tf
         self.user_consumed = data_info.user_consumed
         self.bu = None
         self.bi = None
         self.pu = None
         self.qi = None
 
-        self._build_model()
-        self._build_train_ops()
+        if use_tf:
+            TfMixin.__init__(self, tf_sess_config)
+        else:
+            self._build_model()
 
     def _build_model(self):
-        self.user_indices = tf.placeholder(tf.int32, shape=[None])
-        self.item_indices = tf.placeholder(tf.int32, shape=[None])
-        self.labels = tf.placeholder(tf.float32, shape=[None])
+        np.random.seed(self.seed)
+        self.bu = np.zeros(self.n_users, dtype=np.float32)
+        self.bi = np.zeros(self.n_items, dtype=np.float32)
+        self.pu = truncated_normal(
+            shape=(self.n_users, self.embed_size), mean=0.0, scale=0.05)
+        self.qi = truncated_normal(
+            shape=(self.n_items, self.embed_size), mean=0.0, scale=0.05)
+
+    def _build_model_tf(self, input_pipeline="feed_dict"):
+        tf = import_tf()
+        from tensorflow.keras.initializers import (
+            zeros as tf_zeros,
+            truncated_normal as tf_truncated_normal
+        )
+        from ..utils.tf_ops import reg_config
+        tf_reg = reg_config(self.reg)
+
+        if input_pipeline == "tf_data":
+            self._build_input_pipeline()
+        self.user_indices = self._input_placeholder(
+            "user_indices", tf.int32, [None])
+        self.item_indices = self._input_placeholder(
+            "item_indices", tf.int32, [None])
+        self.labels = self._input_placeholder(
+            "labels", tf.float32, [None])
 
         self.bu_var = tf.get_variable(name="bu_var", shape=[self.n_users],
                                       initializer=tf_zeros,
-                                      regularizer=self.reg)
+                                      regularizer=tf_reg)
         self.bi_var = tf.get_variable(name="bi_var", shape=[self.n_items],
                                       initializer=tf_zeros,
-                                      regularizer=self.reg)
+                                      regularizer=tf_reg)
         self.pu_var = tf.get_variable(name="pu_var",
                                       shape=[self.n_users, self.embed_size],
                                       initializer=tf_truncated_normal(
                                           0.0, 0.05),
-                                      regularizer=self.reg)
+                                      regularizer=tf_reg)
         self.qi_var = tf.get_variable(name="pi_var",
                                       shape=[self.n_items, self.embed_size],
                                       initializer=tf_truncated_normal(
                                           0.0, 0.05),
-                                      regularizer=self.reg)
+                                      regularizer=tf_reg)
 
         bias_user = tf.nn.embedding_lookup(self.bu_var, self.user_indices)
         bias_item = tf.nn.embedding_lookup(self.bi_var, self.item_indices)
@@ -98,6 +124,7 @@ class SVD(Base, TfMixin, EvalMixin):
             tf.multiply(embed_user, embed_item), axis=1)
 
     def _build_train_ops(self):
+        tf = import_tf()
         if self.task == "rating":
             pred = self.output + self.global_mean
             self.loss = tf.losses.mean_squared_error(labels=self.labels,
@@ -109,7 +136,7 @@ class SVD(Base, TfMixin, EvalMixin):
                                                         logits=self.output)
             )
 
-        if self.reg is not None:
+        if self.reg:
             reg_keys = tf.get_collection(tf.GraphKeys.REGULARIZATION_LOSSES)
             total_loss = self.loss + tf.add_n(reg_keys)
         else:
@@ -120,21 +147,102 @@ class SVD(Base, TfMixin, EvalMixin):
         self.sess.run(tf.global_variables_initializer())
 
     def fit(self, train_data, verbose=1, shuffle=True,
-            eval_data=None, metrics=None):
+            eval_data=None, metrics=None, num_threads=1, optimizer="sgd",
+            input_pipeline="feed_dict"):
         self.show_start_time()
-        if self.task == "ranking" and self.batch_sampling:
-            self._check_has_sampled(train_data, verbose)
-            data_generator = NegativeSampling(train_data,
-                                              self.data_info,
-                                              self.num_neg,
-                                              batch_sampling=True)
+        self._check_input_pipeline(input_pipeline)
+        if not self.use_tf:
+            self._fit_cython(train_data, verbose=verbose, shuffle=shuffle,
+                             num_threads=num_threads, eval_data=eval_data,
+                             metrics=metrics, optimizer=optimizer)
+            return
 
+        self._build_model_tf(input_pipeline)
+        self._build_train_ops()
+        if input_pipeline == "tf_data":
+            neg_sampling = self.task == "ranking" and self.batch_sampling
+            if neg_sampling:
+                self._check_has_sampled(train_data, verbose)
+            self.train_tf_data(train_data, verbose, shuffle, eval_data,
+                               metrics, neg_sampling)
         else:
-            data_generator = DataGenPure(train_data)
+            if self.task == "ranking" and self.batch_sampling:
+                self._check_has_sampled(train_data, verbose)
+                data_generator = NegativeSampling(train_data,
+                                                  self.data_info,
+                                                  self.num_neg,
+                                                  batch_sampling=True)
 
-        self.train_pure(data_generator, verbose, shuffle, eval_data, metrics)
+            else:
+                data_generator = DataGenPure(train_data)
+
+            self.train_pure(data_generator, verbose, shuffle,
+                            eval_data, metrics)
         self._set_latent_factors()
 
+    def _fit_cython(self, train_data, verbose=1, shuffle=True, num_threads=1,
+                    eval_data=None, metrics=None, optimizer="sgd"):
+        """
+        Parameters are updated per sample in Hogwild style with numpy arrays,
+        so no tensorflow session is involved. optimizer can be "sgd" or
+        "adam". For ranking task, negative samples should be drawn in advance.
+        """
+        if self.task == "ranking":
+            self._check_has_sampled(train_data, verbose)
+
+        if optimizer == "sgd":
+            moments = None
+        elif optimizer == "adam":
+            moments = {
+                name: (np.zeros_like(param), np.zeros_like(param))
+                for name, param in (("bu", self.bu), ("bi", self.bi),
+                                    ("pu", self.pu), ("qi", self.qi))
+            }
+        else:
+            raise ValueError("optimizer must either be 'sgd' or 'adam'")
+
+        self.train_stats_ = []
+        for epoch in range(1, self.n_epochs + 1):
+            with time_block(f"Epoch {epoch}", verbose):
+                start = time.perf_counter()
+                thread_stats = svd_update(optimizer=optimizer,
+                                          train_data=train_data,
+                                          bu=self.bu,
+                                          bi=self.bi,
+                                          pu=self.pu,
+                                          qi=self.qi,
+                                          global_mean=self.global_mean,
+                                          lr=self.lr,
+                                          reg=self.reg,
+                                          task=self.task,
+                                          shuffle=shuffle,
+                                          num_threads=num_threads,
+                                          epoch=epoch,
+                                          moments=moments)
+                elapsed = time.perf_counter() - start
+
+            epoch_stats = self._epoch_stats(epoch, elapsed, thread_stats)
+            self.train_stats_.append(epoch_stats)
+            if verbose > 1:
+                train_loss_str = "train_loss: " + str(
+                    round(epoch_stats["loss"], 4)
+                )
+                print(f"\t {colorize(train_loss_str, 'green')}")
+                self.print_metrics(eval_data=eval_data, metrics=metrics)
+                print("="*30)
+
+    @staticmethod
+    def _epoch_stats(epoch, elapsed, thread_stats):
+        n_samples = int(np.sum(thread_stats["samples"]))
+        return {
+            "epoch": epoch,
+            "time": elapsed,
+            "samples": n_samples,
+            "samples_per_sec": n_samples / elapsed if elapsed > 0 else 0.0,
+            "thread_samples": thread_stats["samples"].astype(int).tolist(),
+            "loss": float(np.sum(thread_stats["loss"]) / max(n_samples, 1))
+        }
+
     def predict(self, user, item):
         user = np.asarray(
             [user]) if isinstance(user, int) else np.asarray(user)
@@ -163,8 +271,8 @@ class SVD(Base, TfMixin, EvalMixin):
         if not user:
             return   # popular ?
 
-        consumed = self.user_consumed[user]
-        count = n_rec + len(consumed)
+        consumed_index = self.data_info.consumed_index
+        count = n_rec + consumed_index.n_consumed(user)
         recos = self.bu[user] + self.bi + self.pu[user] @ self.qi.T
 
         if self.task == "rating":
@@ -172,12 +280,9 @@ class SVD(Base, TfMixin, EvalMixin):
         elif self.task == "ranking":
             recos = 1 / (1 + np.exp(-recos))
         ids = np.argpartition(recos, -count)[-count:]
+        ids = ids[~consumed_index.contains(user, ids)]
         rank = sorted(zip(ids, recos[ids]), key=lambda x: -x[1])
-        return list(
-            islice(
-                (rec for rec in rank if rec[0] not in consumed), n_rec
-            )
-        )
+        return rank[:n_rec]
 
     def _set_latent_factors(self):
         self.bu, self.bi, self.pu, self.qi = self.sess.run(
@@ -0,0 +1,176 @@
+"""
+
+Pure numpy inference with the factors of a trained embedding model.
+
+author: massquantity
+
+"""
+import numpy as np
+from .base import Base
+from ..data.data_info import ConsumedIndex
+from ..utils.serialization import save_arrays, load_arrays
+
+
+class VectorModel(object):
+    """Inference model built from user and item vectors.
+
+    The score of a user-item pair is the dot product of their vectors plus
+    a constant offset, with biases folded into the vectors. Tensorflow is
+    not needed, so it can be used in light serving processes.
+
+    It only serves vectors of an already trained model, so unlike the models
+    derived from `Base` there is no `fit` method. Use `from_model` to build
+    it from a trained model, or `load` to restore a saved one.
+
+    Parameters
+    ----------
+    task : str
+        Specific task, either rating or ranking.
+    user_vector : numpy.ndarray
+        User vectors, shape: (n_users, vector_size).
+    item_vector : numpy.ndarray
+        Item vectors, shape: (n_items, vector_size).
+    user_consumed : dict, list or ConsumedIndex, optional
+        Consumed items of each user, which are filtered in recommendation.
+    offset : float, optional
+        Constant added to every score, e.g. global mean in rating task.
+    lower_upper_bound : list or tuple, optional
+        Lower and upper score bound, must be provided in rating task.
+    """
+
+    def __init__(self, task, user_vector, item_vector, user_consumed=None,
+                 offset=0.0, lower_upper_bound=None):
+        if task == "rating":
+            if lower_upper_bound is None:
+                raise ValueError("lower_upper_bound must be provided "
+                                 "for rating task")
+            self.lower_bound, self.upper_bound = lower_upper_bound
+        elif task != "ranking":
+            raise ValueError("task must either be rating or ranking")
+        self.task = task
+        self.user_vector = np.ascontiguousarray(user_vector, dtype=np.float32)
+        self.item_vector = np.ascontiguousarray(item_vector, dtype=np.float32)
+        assert self.user_vector.shape[1] == self.item_vector.shape[1], (
+            "user and item vectors must have the same size")
+        self.n_users = len(self.user_vector)
+        self.n_items = len(self.item_vector)
+        if isinstance(user_consumed, ConsumedIndex):
+            self.consumed_index = user_consumed
+        else:
+            if user_consumed is None:
+                user_consumed = dict()
+            elif not isinstance(user_consumed, dict):
+                user_consumed = dict(enumerate(user_consumed))
+            self.consumed_index = ConsumedIndex.from_user_consumed(
+                user_consumed, self.n_users, self.n_items)
+        self.offset = offset
+        self.default_prediction = offset if task == "rating" else 0.0
+
+    @classmethod
+    def from_model(cls, model):
+        """Extract vectors from a trained SVD, SVDpp, ALS, BPR or
+        YouTubeMatch model."""
+        model_name = model.__class__.__name__.lower()
+        offset = 0.0
+        if model_name in ("svd", "svdpp"):
+            pu = model.pu if model_name == "svd" else model.puj
+            # [pu, bu, 1] @ [qi, 1, bi] = pu @ qi + bu + bi
+            user_vector = np.hstack(
+                [pu, model.bu[:, None], np.ones((len(pu), 1))])
+            item_vector = np.hstack(
+                [model.qi, np.ones((len(model.qi), 1)), model.bi[:, None]])
+            if model.task == "rating":
+                offset = model.global_mean
+        elif model_name in ("als", "bpr"):
+            user_vector = model.user_embed
+            item_vector = model.item_embed
+        elif model_name == "youtubematch":
+            user_vector = model.user_vector
+            item_vector = model.item_weights
+        else:
+            raise ValueError(f"{model.__class__.__name__} is not suitable "
+                             f"for vector model")
+
+        lower_upper_bound = (
+            (model.lower_bound, model.upper_bound)
+            if model.task == "rating"
+            else None
+        )
+        return cls(model.task, user_vector, item_vector,
+                   model.data_info.consumed_index, offset, lower_upper_bound)
+
+    def predict(self, user, item):
+        user = np.asarray(
+            [user]) if isinstance(user, int) else np.asarray(user)
+        item = np.asarray(
+            [item]) if isinstance(item, int) else np.asarray(item)
+
+        unknown_num, unknown_index, user, item = self._check_unknown(
+            user, item)
+
+        preds = np.sum(
+            np.multiply(self.user_vector[user], self.item_vector[item]),
+            axis=1) + self.offset
+
+        if self.task == "rating":
+            preds = np.clip(preds, self.lower_bound, self.upper_bound)
+        elif self.task == "ranking":
+            preds = 1 / (1 + np.exp(-preds))
+
+        if unknown_num > 0:
+            preds[unknown_index] = self.default_prediction
+
+        return preds[0] if len(user) == 1 else preds
+
+    def recommend_user(self, user, n_rec, **kwargs):
+        user = self._check_unknown_user(user)
+        if user is None:
+            return   # popular ?
+
+        count = min(n_rec + self.consumed_index.n_consumed(user),
+                    self.n_items)
+        recos = self.user_vector[user] @ self.item_vector.T + self.offset
+        if self.task == "ranking":
+            recos = 1 / (1 + np.exp(-recos))
+
+        ids = np.argpartition(recos, -count)[-count:]
+        ids = ids[~self.consumed_index.contains(user, ids)]
+        rank = sorted(zip(ids, recos[ids]), key=lambda x: -x[1])
+        return rank[:n_rec]
+
+    # same index checks as trained models, which only need `n_users`
+    # and `n_items`
+    _check_unknown = Base._check_unknown
+    _check_unknown_user = Base._check_unknown_user
+
+    def save(self, path):
+        """Save vectors and consumed items into directory `path`, in the
+        same format as `DataInfo.save`."""
+        arrays = {
+            "user_vector": self.user_vector,
+            "item_vector": self.item_vector,
+            "consumed_indptr": self.consumed_index.indptr,
+            "consumed_indices": self.consumed_index.indices
+        }
+        meta = {
+            "task": self.task,
+            "offset": float(self.offset),
+            "lower_upper_bound": ([float(self.lower_bound),
+                                   float(self.upper_bound)]
+                                  if self.task == "rating" else None)
+        }
+        save_arrays(path, arrays, meta)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a model saved by `save`, arrays are memory-mapped read-only
+        if `mmap` is True, so serving processes can share them."""
+        arrays, meta = load_arrays(
+            path, ["user_vector", "item_vector", "consumed_indptr",
+                   "consumed_indices"], mmap)
+        consumed_index = ConsumedIndex(arrays["consumed_indptr"],
+                                       arrays["consumed_indices"],
+                                       len(arrays["item_vector"]))
+        return cls(meta["task"], arrays["user_vector"],
+                   arrays["item_vector"], consumed_index, meta["offset"],
+                   meta["lower_upper_bound"])
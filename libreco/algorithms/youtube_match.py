@@ -6,7 +6,6 @@ Reference: Paul Covington et al.  "Deep Neural Networks for YouTube Recommendati
 author: massquantity
 
 """
-from itertools import islice
 import numpy as np
 import tensorflow as tf2
 from tensorflow.keras.initializers import (
@@ -234,7 +233,7 @@ class YouTubeMatch(Base, TfMixin, EvalMixin):
         self.sess.run(tf.global_variables_initializer())
 
     def fit(self, train_data, verbose=1, shuffle=True, eval_data=None,
-            metrics=None, **kwargs):
+            metrics=None, prefetch_batches=0, num_workers=1, **kwargs):
         assert self.task == "ranking", (
             "YouTube models is only suitable for ranking"
         )
@@ -253,7 +252,8 @@ class YouTubeMatch(Base, TfMixin, EvalMixin):
         data_generator = DataGenSequence(
             train_data, self.data_info, self.sparse, self.dense,
             mode=self.interaction_mode, num=self.interaction_num,
-            class_name="YoutubeMatch", padding_idx=self.n_items
+            class_name="YoutubeMatch", padding_idx=self.n_items,
+            prefetch_batches=prefetch_batches, num_workers=num_workers
         )
         for epoch in range(1, self.n_epochs + 1):
             with time_block(f"Epoch {epoch}", verbose):
@@ -311,18 +311,15 @@ class YouTubeMatch(Base, TfMixin, EvalMixin):
         if not user:
             return   # popular ?
 
-        consumed = self.user_consumed[user]
-        count = n_rec + len(consumed)
+        consumed_index = self.data_info.consumed_index
+        count = n_rec + consumed_index.n_consumed(user)
         recos = self.user_vector[user] @ self.item_weights.T
         recos = 1 / (1 + np.exp(-recos))
 
         ids = np.argpartition(recos, -count)[-count:]
+        ids = ids[~consumed_index.contains(user, ids)]
         rank = sorted(zip(ids, recos[ids]), key=lambda x: -x[1])
-        return list(
-            islice(
-                (rec for rec in rank if rec[0] not in consumed), n_rec
-            )
-        )
+        return rank[:n_rec]
 
     def _set_latent_vectors(self):
         user_indices = np.arange(self.n_users)
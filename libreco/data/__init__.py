@@ -1,4 +1,5 @@
 from .dataset import DatasetPure, DatasetFeat
+from .encoder import FeatureEncoder
 from .preprocessing import preprocess_data
 from .split import (
     split_by_num,
@@ -1,6 +1,6 @@
 import numpy as np
-import tqdm
 from .sequence import sparse_user_interacted, user_interacted_seq
+from ..utils.batching import iter_batches, split_batches
 
 
 class DataGenPure(object):
@@ -9,29 +9,31 @@ class DataGenPure(object):
         self.user_indices = data.user_indices
         self.item_indices = data.item_indices
         self.labels = data.labels
+        self.order = None
 
     def __iter__(self, batch_size):
-        for i in tqdm.trange(0, self.data_size, batch_size, desc="train"):
-            batch_slice = slice(i, i + batch_size)
-            yield (
-                self.user_indices[batch_slice],
-                self.item_indices[batch_slice],
-                self.labels[batch_slice],
-                None,
-                None
-            )
+        return iter_batches(
+            self._get_batch,
+            split_batches(self.data_size, batch_size, self.order))
+
+    def _get_batch(self, batch_index):
+        return (
+            self.user_indices[batch_index],
+            self.item_indices[batch_index],
+            self.labels[batch_index],
+            None,
+            None
+        )
 
     def __call__(self, shuffle=True, batch_size=None):
-        if shuffle:
-            mask = np.random.permutation(range(self.data_size))
-            self.user_indices = self.user_indices[mask]
-            self.item_indices = self.item_indices[mask]
-            self.labels = self.labels[mask]
+        self.order = (np.random.permutation(self.data_size)
+                      if shuffle else None)
         return self.__iter__(batch_size)
 
 
 class DataGenFeat(object):
-    def __init__(self, data, sparse, dense, class_name=None):
+    def __init__(self, data, sparse, dense, class_name=None,
+                 prefetch_batches=0, num_workers=1):
         self.user_indices = data.user_indices
         self.item_indices = data.item_indices
         self.labels = data.labels
@@ -41,55 +43,36 @@ class DataGenFeat(object):
         self.dense = dense
         self.data_size = len(data)
         self.class_name = class_name
+        self.prefetch_batches = prefetch_batches
+        self.num_workers = num_workers
+        self.order = None
 
     def __iter__(self, batch_size):
-        for i in tqdm.trange(0, self.data_size, batch_size, desc="train"):
-            batch_slice = slice(i, i + batch_size)
-            res = (
-                self.user_indices[batch_slice],
-                self.item_indices[batch_slice],
-                self.labels[batch_slice]
-            )
-            if self.sparse and self.dense:
-                res_other = (
-                    self.sparse_indices[batch_slice],
-                    self.dense_values[batch_slice]
-                )
-            elif self.sparse:
-                res_other =  (
-                    self.sparse_indices[batch_slice],
-                    None,
-                    None
-                )
-            elif self.dense:
-                res_other = (
-                    None,
-                    self.dense_values[batch_slice]
-                )
-            else:
-                res_other = (
-                    None,
-                    None
-                )
-            yield res + res_other
+        return iter_batches(
+            self._get_batch,
+            split_batches(self.data_size, batch_size, self.order),
+            prefetch_batches=self.prefetch_batches,
+            num_workers=self.num_workers)
+
+    def _get_batch(self, batch_index):
+        return (
+            self.user_indices[batch_index],
+            self.item_indices[batch_index],
+            self.labels[batch_index],
+            self.sparse_indices[batch_index] if self.sparse else None,
+            self.dense_values[batch_index] if self.dense else None
+        )
 
     def __call__(self, shuffle=True, batch_size=None):
-        if shuffle:
-            mask = np.random.permutation(range(self.data_size))
-            if self.sparse:
-                self.sparse_indices = self.sparse_indices[mask]
-            if self.dense:
-                self.dense_values = self.dense_values[mask]
-            self.user_indices = self.user_indices[mask]
-            self.item_indices = self.item_indices[mask]
-            self.labels = self.labels[mask]
-
+        self.order = (np.random.permutation(self.data_size)
+                      if shuffle else None)
         return self.__iter__(batch_size)
 
 
 class DataGenSequence(object):
     def __init__(self, data, data_info, sparse, dense, mode=None, num=None,
-                 class_name=None, padding_idx=None):
+                 class_name=None, padding_idx=None, prefetch_batches=0,
+                 num_workers=1):
         self.user_consumed = data_info.user_consumed
         self.padding_idx = padding_idx
         self.class_name = class_name
@@ -105,91 +88,74 @@ class DataGenSequence(object):
             self.labels = data.labels
             self.sparse_indices = data.sparse_indices
             self.dense_values = data.dense_values
-            self.user_consumed_set = {
-                u: set(items) for u, items in self.user_consumed.items()
-            }
+            self.consumed_index = data_info.consumed_index
         self.data_size = len(self.user_indices)
         self.sparse = sparse
         self.dense = dense
         self.mode = mode
         self.num = num
+        self.prefetch_batches = prefetch_batches
+        self.num_workers = num_workers
+        self.order = None
 
     def __iter__(self, batch_size):
-        for i in tqdm.trange(0, self.data_size, batch_size, desc="train"):
-            batch_slice = slice(i, i + batch_size)
-            if self.class_name == "YoutubeMatch":
-                (
-                    interacted_indices,
-                    interacted_values,
-                    modified_batch_size
-                ) = sparse_user_interacted(
-                    self.user_indices[batch_slice],
-                    self.item_indices[batch_slice],
-                    self.user_consumed,
-                    self.mode,
-                    self.num
-                )
-                res = (
-                    modified_batch_size,
-                    interacted_indices,
-                    interacted_values,
-                    self.user_indices[batch_slice],
-                    self.item_indices[batch_slice],
-                    self.labels[batch_slice]
-                )
-            else:
-                (
-                    batch_interacted,
-                    batch_interacted_len
-                ) = user_interacted_seq(
-                    self.user_indices[batch_slice],
-                    self.item_indices[batch_slice],
-                    self.user_consumed,
-                    self.padding_idx,
-                    self.mode,
-                    self.num,
-                    self.user_consumed_set
-                )
-                res = (
-                    batch_interacted,
-                    batch_interacted_len,
-                    self.user_indices[batch_slice],
-                    self.item_indices[batch_slice],
-                    self.labels[batch_slice]
-                )
-
-            if self.sparse and self.dense:
-                res_other = (
-                    self.sparse_indices[batch_slice],
-                    self.dense_values[batch_slice]
-                )
-            elif self.sparse:
-                res_other = (
-                    self.sparse_indices[batch_slice],
-                    None
-                )
-            elif self.dense:
-                res_other = (
-                    None,
-                    self.dense_values[batch_slice]
-                )
-            else:
-                res_other = (
-                    None,
-                    None
-                )
-            yield res + res_other
+        # sequence construction is done in python per batch, which is the
+        # part worth prefetching.
+        return iter_batches(
+            self._get_batch,
+            split_batches(self.data_size, batch_size, self.order),
+            prefetch_batches=self.prefetch_batches,
+            num_workers=self.num_workers)
+
+    def _get_batch(self, batch_index):
+        if self.class_name == "YoutubeMatch":
+            (
+                interacted_indices,
+                interacted_values,
+                modified_batch_size
+            ) = sparse_user_interacted(
+                self.user_indices[batch_index],
+                self.item_indices[batch_index],
+                self.user_consumed,
+                self.mode,
+                self.num
+            )
+            res = (
+                modified_batch_size,
+                interacted_indices,
+                interacted_values,
+                self.user_indices[batch_index],
+                self.item_indices[batch_index],
+                self.labels[batch_index]
+            )
+        else:
+            (
+                batch_interacted,
+                batch_interacted_len
+            ) = user_interacted_seq(
+                self.user_indices[batch_index],
+                self.item_indices[batch_index],
+                self.user_consumed,
+                self.padding_idx,
+                self.mode,
+                self.num,
+                self.consumed_index
+            )
+            res = (
+                batch_interacted,
+                batch_interacted_len,
+                self.user_indices[batch_index],
+                self.item_indices[batch_index],
+                self.labels[batch_index]
+            )
 
-    def __call__(self, shuffle=True, batch_size=None):
-        if shuffle:
-            mask = np.random.permutation(range(self.data_size))
-            if self.sparse:
-                self.sparse_indices = self.sparse_indices[mask]
-            if self.dense:
-                self.dense_values = self.dense_values[mask]
-            self.user_indices = self.user_indices[mask]
-            self.item_indices = self.item_indices[mask]
-            self.labels = self.labels[mask]
+        return res + (
+            self.sparse_indices[batch_index] if self.sparse else None,
+            self.dense_values[batch_index] if self.dense else None
+        )
 
+    def __call__(self, shuffle=True, batch_size=None):
+        self.order = (np.random.permutation(self.data_size)
+                      if shuffle else None)
         return self.__iter__(batch_size)
 
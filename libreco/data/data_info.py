@@ -1,10 +1,163 @@
-from array import array
-from collections import defaultdict, namedtuple
+from collections import defaultdict, namedtuple, OrderedDict
+import os
+from collections.abc import Mapping
+from itertools import chain
 import numpy as np
+from .encoder import encode_values, FeatureEncoder
+from ..utils.serialization import save_arrays, load_arrays
+from ..utils.unique_features import MultiSparse
 
 
 Feature = namedtuple("Feature", ["name", "index"])
 Empty_Feature = Feature(name=[], index=[])
+LabelStats = namedtuple("LabelStats", ["count", "mean", "min", "max"])
+
+
+class ConsumedMapping(Mapping):
+    """Read-only mapping view of consumed items stored in csr arrays.
+
+    It behaves like the former `defaultdict` of arrays, i.e. `mapping[u]`
+    returns the items of u in original (time) order, and an empty array for
+    u without any interaction. Rows are numpy views, so no per-user python
+    object is created.
+
+    Parameters
+    ----------
+    indptr : numpy.ndarray
+        Row pointers, values of key k are indices[indptr[k]: indptr[k+1]].
+    indices : numpy.ndarray
+        Consumed values of all keys.
+    """
+
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+        self.indptr.setflags(write=False)
+        self.indices.setflags(write=False)
+
+    @classmethod
+    def from_pairs(cls, keys, values):
+        """Group `values` by `keys` with a stable sort, so the original order
+        inside each group is preserved."""
+        keys = np.asarray(keys, dtype=np.int64)
+        values = np.asarray(values)
+        n_rows = int(keys.max()) + 1 if len(keys) > 0 else 0
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=n_rows), out=indptr[1:])
+        order = np.argsort(keys, kind="stable")
+        return cls(indptr, values[order].astype(np.int32))
+
+    @property
+    def counts(self):
+        return np.diff(self.indptr)
+
+    def __getitem__(self, key):
+        if 0 <= key < len(self.indptr) - 1:
+            return self.indices[self.indptr[key]: self.indptr[key + 1]]
+        return self.indices[:0]
+
+    def __contains__(self, key):
+        return (0 <= key < len(self.indptr) - 1
+                and self.indptr[key + 1] > self.indptr[key])
+
+    def __iter__(self):
+        return iter(np.flatnonzero(self.counts).tolist())
+
+    def __len__(self):
+        return int(np.count_nonzero(self.counts))
+
+
+class ConsumedIndex(object):
+    """Immutable csr index of consumed items of all users.
+
+    Items in each row are sorted, so membership is checked with binary
+    search in numpy, and many pairs can be checked at once without any
+    python set.
+
+    Parameters
+    ----------
+    indptr : numpy.ndarray
+        Row pointers, items of user u are indices[indptr[u]: indptr[u+1]].
+    indices : numpy.ndarray
+        Consumed items, sorted in each row.
+    n_items : int
+        Number of items.
+    """
+
+    def __init__(self, indptr, indices, n_items):
+        self.indptr = indptr
+        self.indices = indices
+        self.n_items = n_items
+        self.indptr.setflags(write=False)
+        self.indices.setflags(write=False)
+        self._keys = None
+
+    @classmethod
+    def from_user_consumed(cls, user_consumed, n_users, n_items):
+        if isinstance(user_consumed, ConsumedMapping):
+            return cls.from_csr(user_consumed.indptr, user_consumed.indices,
+                                n_users, n_items)
+        users = np.fromiter(user_consumed.keys(), dtype=np.int64,
+                            count=len(user_consumed))
+        user_counts = np.fromiter(map(len, user_consumed.values()),
+                                  dtype=np.int64, count=len(user_consumed))
+        counts = np.zeros(n_users, dtype=np.int64)
+        counts[users] = user_counts
+        indptr = np.zeros(n_users + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        items = np.fromiter(chain.from_iterable(user_consumed.values()),
+                            dtype=np.int64, count=int(indptr[-1]))
+        # group by user and sort items inside each row
+        rows = np.repeat(users, user_counts)
+        order = np.lexsort((items, rows))
+        return cls(indptr, items[order].astype(np.int32), n_items)
+
+    @classmethod
+    def from_csr(cls, indptr, indices, n_users, n_items):
+        """Build from csr arrays whose rows are not sorted."""
+        counts = np.zeros(n_users, dtype=np.int64)
+        row_counts = np.diff(indptr)[:n_users]
+        counts[:len(row_counts)] = row_counts
+        new_indptr = np.zeros(n_users + 1, dtype=np.int64)
+        np.cumsum(counts, out=new_indptr[1:])
+        items = np.asarray(indices[:new_indptr[-1]])
+        rows = np.repeat(np.arange(n_users, dtype=np.int64), counts)
+        order = np.lexsort((items, rows))
+        return cls(new_indptr, items[order].astype(np.int32), n_items)
+
+    @property
+    def keys(self):
+        """Sorted `user * n_items + item` keys of all consumed pairs."""
+        if self._keys is None:
+            users = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64),
+                              np.diff(self.indptr))
+            keys = users * self.n_items + self.indices
+            keys.setflags(write=False)
+            self._keys = keys
+        return self._keys
+
+    def items_of(self, user):
+        return self.indices[self.indptr[user]: self.indptr[user + 1]]
+
+    def n_consumed(self, user):
+        return int(self.indptr[user + 1] - self.indptr[user])
+
+    def contains(self, user, items):
+        """Whether `items` have been consumed by a single `user`."""
+        row = self.items_of(user)
+        if len(row) == 0:
+            return np.zeros(np.shape(items), dtype=bool)
+        pos = np.minimum(np.searchsorted(row, items), len(row) - 1)
+        return row[pos] == items
+
+    def is_consumed(self, users, items):
+        """Element-wise membership of many (user, item) pairs."""
+        keys = self.keys
+        query = np.asarray(users, dtype=np.int64) * self.n_items + items
+        if len(keys) == 0:
+            return np.zeros(query.shape, dtype=bool)
+        pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        return keys[pos] == query
 
 
 class DataInfo(object):
@@ -17,7 +170,15 @@ class DataInfo(object):
             item_sparse_unique=None,
             item_dense_unique=None,
             user_indices=None,
-            item_indices=None
+            item_indices=None,
+            user_unique_vals=None,
+            item_unique_vals=None,
+            label_stats=None,
+            sparse_feat_size=None,
+            encoder=None,
+            user_multi_sparse_unique=None,
+            item_multi_sparse_unique=None,
+            multi_sparse_feat_size=None
     ):
         self.col_name_mapping = col_name_mapping
         self.interaction_data = interaction_data
@@ -25,29 +186,68 @@ class DataInfo(object):
         self.user_dense_unique = user_dense_unique
         self.item_sparse_unique = item_sparse_unique
         self.item_dense_unique = item_dense_unique
-        self.user_consumed, self.item_consumed = DataInfo.interaction_consumed(
-            user_indices, item_indices
-        )
+        # `MultiSparse` of multi-hot features, row j * n_users + u is the
+        # j-th user multi-hot column of user u, same for items.
+        self.user_multi_sparse_unique = user_multi_sparse_unique
+        self.item_multi_sparse_unique = item_multi_sparse_unique
+        if user_indices is not None:
+            (self.user_consumed,
+             self.item_consumed) = DataInfo.interaction_consumed(
+                user_indices, item_indices)
+        else:
+            # assigned in `load`
+            self.user_consumed = self.item_consumed = None
+        self._consumed_index = None
+        # sorted unique raw ids, the position of a raw id is its index.
+        # They can be provided along with `label_stats` if the data is too
+        # large to keep in memory as `interaction_data`.
+        self.encoder = encoder
+        if encoder is not None:
+            user_unique_vals = encoder.user_unique_vals
+            item_unique_vals = encoder.item_unique_vals
+        if interaction_data is not None:
+            if user_unique_vals is None:
+                user_unique_vals = np.unique(interaction_data["user"])
+                item_unique_vals = np.unique(interaction_data["item"])
+            label = interaction_data.label
+            label_stats = LabelStats(len(label), label.mean(),
+                                     label.min(), label.max())
+        self.user_unique_vals = user_unique_vals
+        self.item_unique_vals = item_unique_vals
+        self.label_stats = label_stats
+        # total size of sparse features, including unseen values
+        self.sparse_feat_size = sparse_feat_size
+        # multi-hot columns have their own feature space
+        self.multi_sparse_feat_size = multi_sparse_feat_size
+        self._user2id = None
+        self._item2id = None
+        self._id2user = None
+        self._id2item = None
 
     @staticmethod
     def interaction_consumed(user_indices, item_indices):
-        user_consumed = defaultdict(lambda: array("I"))
-        item_consumed = defaultdict(lambda: array("I"))
-        for u, i in zip(user_indices, item_indices):
-            user_consumed[u].append(i)
-            item_consumed[i].append(u)
+        """Consumed items of every user and consuming users of every item,
+        as `ConsumedMapping` in the original order of interactions."""
+        user_consumed = ConsumedMapping.from_pairs(user_indices, item_indices)
+        item_consumed = ConsumedMapping.from_pairs(item_indices, user_indices)
         return user_consumed, item_consumed
 
+    @property
+    def consumed_index(self):
+        """`ConsumedIndex` of `user_consumed`, built on first access and
+        shared by samplers, data generators and recommendation."""
+        if self._consumed_index is None:
+            self._consumed_index = ConsumedIndex.from_user_consumed(
+                self.user_consumed, self.n_users, self.n_items)
+        return self._consumed_index
+
     @property
     def global_mean(self):
-        return self.interaction_data.label.mean()
+        return self.label_stats.mean
 
     @property
     def min_max_rating(self):
-        return (
-            self.interaction_data.label.min(),
-            self.interaction_data.label.max()
-        )
+        return self.label_stats.min, self.label_stats.max
 
     @property
     def sparse_col(self):
@@ -103,69 +303,208 @@ class DataInfo(object):
             index=list(self.col_name_mapping["item_dense_col"].values())
         )
 
+    @property
+    def multi_sparse_col(self):
+        if not self.col_name_mapping["multi_sparse_col"]:
+            return Empty_Feature
+        return Feature(
+            name=list(self.col_name_mapping["multi_sparse_col"].keys()),
+            index=list(self.col_name_mapping["multi_sparse_col"].values())
+        )
+
+    @property
+    def user_multi_sparse_col(self):
+        if not self.col_name_mapping["user_multi_sparse_col"]:
+            return Empty_Feature
+        return Feature(
+            name=list(self.col_name_mapping["user_multi_sparse_col"].keys()),
+            index=list(
+                self.col_name_mapping["user_multi_sparse_col"].values())
+        )
+
+    @property
+    def item_multi_sparse_col(self):
+        if not self.col_name_mapping["item_multi_sparse_col"]:
+            return Empty_Feature
+        return Feature(
+            name=list(self.col_name_mapping["item_multi_sparse_col"].keys()),
+            index=list(
+                self.col_name_mapping["item_multi_sparse_col"].values())
+        )
+
     @property
     def user_col(self):
         # will be sorted by key
         return (
-            self.col_name_mapping["user_sparse_col"].keys().__or__(
-                self.col_name_mapping["user_dense_col"].keys())
+            self.col_name_mapping["user_sparse_col"].keys()
+            | self.col_name_mapping["user_dense_col"].keys()
+            | self.col_name_mapping["user_multi_sparse_col"].keys()
         )
 
     @property
     def item_col(self):
         # will be sorted by key
         return (
-            self.col_name_mapping["item_sparse_col"].keys().__or__(
-                self.col_name_mapping["item_dense_col"].keys())
+            self.col_name_mapping["item_sparse_col"].keys()
+            | self.col_name_mapping["item_dense_col"].keys()
+            | self.col_name_mapping["item_multi_sparse_col"].keys()
         )
 
     @property
     def n_users(self):
-        return self.interaction_data.user.nunique()
+        return len(self.user_unique_vals)
 
     @property
     def n_items(self):
-        return self.interaction_data.item.nunique()
+        return len(self.item_unique_vals)
+
+    def map_users(self, raw_ids):
+        """Vectorized mapping from raw user ids to user indices, unknown
+        users are mapped to `n_users`."""
+        return encode_values(raw_ids, self.user_unique_vals)
+
+    def map_items(self, raw_ids):
+        """Vectorized mapping from raw item ids to item indices, unknown
+        items are mapped to `n_items`."""
+        return encode_values(raw_ids, self.item_unique_vals)
+
+    def decode_users(self, indices):
+        """User indices back to raw user ids."""
+        return self.user_unique_vals[indices]
+
+    def decode_items(self, indices):
+        """Item indices back to raw item ids, e.g. of recommended items."""
+        return self.item_unique_vals[indices]
 
     @property
     def user2id(self):
-        unique = np.unique(self.interaction_data["user"])
-        u2id = dict(zip(unique, range(self.n_users)))
-        u2id[-1] = len(unique)   # -1 represent new user
-        return u2id
+        if self._user2id is None:
+            u2id = dict(zip(self.user_unique_vals, range(self.n_users)))
+            u2id[-1] = self.n_users   # -1 represent new user
+            self._user2id = u2id
+        return self._user2id
 
     @property
     def item2id(self):
-        unique = np.unique(self.interaction_data["item"])
-        i2id = dict(zip(unique, range(self.n_items)))
-        i2id[-1] = len(unique)  # -1 represent new item
-        return i2id
+        if self._item2id is None:
+            i2id = dict(zip(self.item_unique_vals, range(self.n_items)))
+            i2id[-1] = self.n_items  # -1 represent new item
+            self._item2id = i2id
+        return self._item2id
 
     @property
     def id2user(self):
-        return {j: user for user, j in self.user2id.items()}
+        if self._id2user is None:
+            self._id2user = {j: user for user, j in self.user2id.items()}
+        return self._id2user
 
     @property
     def id2item(self):
-        return {j: item for item, j in self.item2id.items()}
+        if self._id2item is None:
+            self._id2item = {j: item for item, j in self.item2id.items()}
+        return self._id2item
 
     def __repr__(self):
         n_users = self.n_users
         n_items = self.n_items
-        n_labels = len(self.interaction_data)
+        n_labels = self.label_stats.count
         return "n_users: %d, n_items: %d, data sparsity: %.4f %%" % (
             n_users, n_items, 100 * n_labels / (n_users*n_items)
         )
 
+    def save(self, path):
+        """Save into directory `path`, one `.npy` file per array and other
+        information in `meta.json`. `interaction_data` is not saved."""
+        arrays = {
+            "user_sparse_unique": self.user_sparse_unique,
+            "user_dense_unique": self.user_dense_unique,
+            "item_sparse_unique": self.item_sparse_unique,
+            "item_dense_unique": self.item_dense_unique,
+            "user_unique_vals": self.user_unique_vals,
+            "item_unique_vals": self.item_unique_vals,
+            "user_consumed_indptr": self.user_consumed.indptr,
+            "user_consumed_indices": self.user_consumed.indices,
+            "item_consumed_indptr": self.item_consumed.indptr,
+            "item_consumed_indices": self.item_consumed.indices
+        }
+        for name in ("user_multi_sparse_unique", "item_multi_sparse_unique"):
+            multi_sparse = getattr(self, name)
+            arrays[name + "_indptr"] = (multi_sparse.indptr
+                                        if multi_sparse is not None else None)
+            arrays[name + "_indices"] = (multi_sparse.indices
+                                         if multi_sparse is not None else None)
+        count, mean, min_label, max_label = self.label_stats
+        meta = {
+            "col_name_mapping": self.col_name_mapping,
+            "label_stats": [int(count), float(mean),
+                            float(min_label), float(max_label)],
+            "sparse_feat_size": (int(self.sparse_feat_size)
+                                 if self.sparse_feat_size is not None
+                                 else None),
+            "multi_sparse_feat_size": (int(self.multi_sparse_feat_size)
+                                       if self.multi_sparse_feat_size
+                                       is not None else None)
+        }
+        save_arrays(path, arrays, meta)
+        if self.encoder is not None:
+            self.encoder.save(os.path.join(path, "encoder"))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load `DataInfo` saved by `save`, arrays are memory-mapped
+        read-only if `mmap` is True."""
+        names = ["user_sparse_unique", "user_dense_unique",
+                 "item_sparse_unique", "item_dense_unique",
+                 "user_unique_vals", "item_unique_vals",
+                 "user_consumed_indptr", "user_consumed_indices",
+                 "item_consumed_indptr", "item_consumed_indices",
+                 "user_multi_sparse_unique_indptr",
+                 "user_multi_sparse_unique_indices",
+                 "item_multi_sparse_unique_indptr",
+                 "item_multi_sparse_unique_indices"]
+        arrays, meta = load_arrays(path, names, mmap)
+        multi_sparse_unique = {
+            name: (MultiSparse(arrays[name + "_indptr"],
+                               arrays[name + "_indices"])
+                   if arrays[name + "_indptr"] is not None else None)
+            for name in ("user_multi_sparse_unique",
+                         "item_multi_sparse_unique")
+        }
+        col_name_mapping = meta["col_name_mapping"]
+        if col_name_mapping is not None:
+            col_name_mapping = defaultdict(
+                OrderedDict,
+                {family: OrderedDict(cols)
+                 for family, cols in col_name_mapping.items()}
+            )
+        encoder_path = os.path.join(path, "encoder")
+        encoder = (FeatureEncoder.load(encoder_path, mmap)
+                   if os.path.exists(encoder_path) else None)
+        data_info = cls(col_name_mapping,
+                        None,
+                        arrays["user_sparse_unique"],
+                        arrays["user_dense_unique"],
+                        arrays["item_sparse_unique"],
+                        arrays["item_dense_unique"],
+                        user_unique_vals=arrays["user_unique_vals"],
+                        item_unique_vals=arrays["item_unique_vals"],
+                        label_stats=LabelStats(*meta["label_stats"]),
+                        sparse_feat_size=meta["sparse_feat_size"],
+                        encoder=encoder,
+                        multi_sparse_feat_size=meta.get(
+                            "multi_sparse_feat_size"),
+                        **multi_sparse_unique)
+        data_info.user_consumed = ConsumedMapping(
+            arrays["user_consumed_indptr"], arrays["user_consumed_indices"])
+        data_info.item_consumed = ConsumedMapping(
+            arrays["item_consumed_indptr"], arrays["item_consumed_indices"])
+        return data_info
+
     def get_indexed_interaction(self):
+        if self.interaction_data is None:
+            raise ValueError("interaction_data is not kept in this DataInfo")
         data = self.interaction_data.copy()
-        data.user = data.user.map(self.user2id)
-        data.item = data.item.map(self.item2id)
-        if data.user.isnull().any():
-            data["user"].fillna(self.n_users, inplace=True)
-            data["user"] = data["user"].astype("int")
-        if data.item.isnull().any():
-            data["item"].fillna(self.n_items, inplace=True)
-            data["item"] = data["item"].astype("int")
+        data["user"] = self.map_users(data["user"].to_numpy())
+        data["item"] = self.map_items(data["item"].to_numpy())
         return data
 
@@ -1,12 +1,53 @@
+import os
+import threading
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import OneHotEncoder, MultiLabelBinarizer
-from .data_info import DataInfo
+from sklearn.preprocessing import OneHotEncoder
+from .data_info import DataInfo, LabelStats, MultiSparse
+from .encoder import FeatureEncoder, map_columns
 from .transformed import TransformedSet
 from ..utils.column_mapping import col_name2index
-from ..utils.unique_features import construct_unique_feat
+from ..utils.unique_features import (
+    construct_unique_feat,
+    construct_multi_sparse_unique
+)
 import warnings
 warnings.filterwarnings("ignore")
+# except the deprecation notice of `build_testset` without encoder
+warnings.filterwarnings("always", message="build_testset without",
+                        category=FutureWarning)
+
+# encoder of the last train data built in each thread, only used by the
+# deprecated `build_testset` call without `encoder` or `data_info`
+_last_train = threading.local()
+
+
+def read_chunks(paths, chunksize, columns, **read_kwargs):
+    """Read csv or parquet files chunk by chunk as `pandas.DataFrame`.
+
+    Files ending with `.parquet` are read with pyarrow, others are read
+    with `pandas.read_csv`, to which `read_kwargs` are passed.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    for path in paths:
+        if str(path).endswith(".parquet"):
+            try:
+                import pyarrow.parquet as pq
+            except (ImportError, ModuleNotFoundError):
+                raise ImportError("pyarrow is needed to read parquet files")
+            parquet_file = pq.ParquetFile(path)
+            for batch in parquet_file.iter_batches(batch_size=chunksize,
+                                                   columns=columns):
+                yield batch.to_pandas()[columns]
+        else:
+            for chunk in pd.read_csv(path, chunksize=chunksize,
+                                     usecols=columns, **read_kwargs):
+                yield chunk[columns]
+
+
+def _merge_unique(parts):
+    return np.unique(np.concatenate(parts))
 
 
 class Dataset(object):
@@ -15,9 +56,6 @@ class Dataset(object):
     Warning: This class should not be used directly. Use derived class instead.
     """
 
-    sparse_unique_vals = dict()
-    user_unique_vals = None
-    item_unique_vals = None
 #    dense_col = None
 #    sparse_col = None
 #    multi_sparse_col = None
@@ -50,65 +88,212 @@ class Dataset(object):
             raise NameError(
                 "Please use 'DatasetPure' or 'DatasetFeat' to call method")
 
-    @classmethod
-    def _set_sparse_unique_vals(cls, train_data, sparse_col):
-        if sparse_col is not None:
-            for col in sparse_col:
-                cls.sparse_unique_vals[col] = np.unique(train_data[col])
-        cls.user_unique_vals = np.unique(train_data["user"])
-        cls.item_unique_vals = np.unique(train_data["item"])
-
-    @classmethod
-    def _get_feature_offset(cls, sparse_col):
-        if cls.__name__.lower().endswith("pure"):
-            unique_values = [
-                len(cls.sparse_unique_vals[col]) for col in sparse_col
-            ]
-        elif cls.__name__.lower().endswith("feat"):
-            # plus one for value only in test data
-            unique_values = [
-                len(cls.sparse_unique_vals[col]) + 1 for col in sparse_col
-            ]
-        return np.cumsum(np.array([0] + unique_values))
+    @staticmethod
+    def _set_last_encoder(encoder):
+        _last_train.encoder = encoder
 
     @staticmethod
-    def check_unknown(values, uniques):
-        diff = list(np.setdiff1d(values, uniques, assume_unique=True))
-        mask = np.in1d(values, uniques, invert=True)
-        return diff, mask
+    def _get_encoder(encoder, data_info):
+        if encoder is not None:
+            return encoder
+        if data_info is not None:
+            return data_info.encoder
+        encoder = getattr(_last_train, "encoder", None)
+        if encoder is None:
+            raise ValueError("encoder or data_info of train data must be "
+                             "provided")
+        warnings.warn("build_testset without `encoder` or `data_info` is "
+                      "deprecated and will be removed in a future version, "
+                      "it falls back to the last train data built in the "
+                      "current thread. Pass `data_info=data_info` instead.",
+                      FutureWarning, stacklevel=3)
+        return encoder
 
     @classmethod
-    def _sparse_indices(cls, values, unique, mode="train"):
-        if mode == "test":
-            diff, not_in_mask = cls.check_unknown(values, unique)
-            col_indices = np.searchsorted(unique, values)
-            col_indices[not_in_mask] = len(unique)
-        elif mode == "train":
-            col_indices = np.searchsorted(unique, values)
-        else:
-            raise ValueError("mode must either be \"train\" or \"test\" ")
-        return col_indices
+    def _build_trainset_from_files(cls, paths, output_dir, user_col=None,
+                                   item_col=None, sparse_col=None,
+                                   dense_col=None, hash_buckets=None,
+                                   chunksize=1000000, num_workers=1,
+                                   **read_kwargs):
+        """Two streaming passes over the files, the first one collects unique
+        values and label statistics, the second one encodes every chunk and
+        writes it into memory-mapped `.npy` files in `output_dir`."""
+        cls._check_subclass()
+        sparse_col = list(sparse_col) if sparse_col else []
+        dense_col = list(dense_col) if dense_col else []
+        hash_buckets = FeatureEncoder.check_hash_buckets(
+            sparse_col, hash_buckets)
+        other_sparse_col = [
+            col for col in sparse_col if col not in ("user", "item")]
+        vocab_col = ["user", "item"] + [
+            col for col in other_sparse_col if col not in hash_buckets]
+        columns = ["user", "item", "label"] + other_sparse_col + dense_col
+
+        unique_parts = {col: [] for col in vocab_col}
+        part_sizes = dict.fromkeys(vocab_col, 0)
+        size_limits = dict.fromkeys(vocab_col, 2 * chunksize)
+        n_rows, label_sum = 0, 0.0
+        label_min, label_max = np.inf, -np.inf
+        for chunk in read_chunks(paths, chunksize, columns, **read_kwargs):
+            if n_rows == 0:
+                cls._check_col_names(chunk, mode="train")
+            chunk_unique = map_columns(
+                lambda col: np.unique(chunk[col].to_numpy()),
+                vocab_col, num_workers)
+            for col, col_unique in zip(vocab_col, chunk_unique):
+                unique_parts[col].append(col_unique)
+                part_sizes[col] += len(col_unique)
+                # compact the collected parts so memory is bounded by the
+                # number of unique values rather than the number of chunks,
+                # the limit grows with them to keep merging amortized.
+                if part_sizes[col] > size_limits[col]:
+                    unique_parts[col] = [_merge_unique(unique_parts[col])]
+                    part_sizes[col] = len(unique_parts[col][0])
+                    size_limits[col] = 2 * max(part_sizes[col], chunksize)
+            label = chunk["label"].to_numpy(dtype=np.float64)
+            n_rows += len(label)
+            label_sum += label.sum()
+            label_min = min(label_min, label.min())
+            label_max = max(label_max, label.max())
+        if n_rows == 0:
+            raise ValueError("no data found in the provided files")
+
+        unique_vals = {col: _merge_unique(unique_parts[col])
+                       for col in vocab_col}
+        del unique_parts
+        encoder = FeatureEncoder(
+            unique_vals["user"],
+            unique_vals["item"],
+            {col: unique_vals[col] for col in sparse_col
+             if col not in hash_buckets},
+            hash_buckets
+        )
 
-    @classmethod
-    def _get_user_item_sparse_indices(cls, data, mode="train"):
-        user_indices = cls._sparse_indices(
-            data.user.to_numpy(), cls.user_unique_vals, mode)
-        item_indices = cls._sparse_indices(
-            data.item.to_numpy(), cls.item_unique_vals, mode)
-        return user_indices, item_indices
+        os.makedirs(output_dir, exist_ok=True)
 
-    @classmethod
-    def _get_sparse_indices_matrix(cls, data, sparse_col, mode="train"):
-        n_samples, n_features = len(data), len(sparse_col)
-        sparse_indices = np.zeros((n_samples, n_features), dtype=np.int32)
-        for i, col in enumerate(sparse_col):
-            col_values = data[col].to_numpy()
-            unique_values = cls.sparse_unique_vals[col]
-            sparse_indices[:, i] = cls._sparse_indices(
-                col_values, unique_values, mode)
-
-        feature_offset = cls._get_feature_offset(sparse_col)
-        return sparse_indices + feature_offset[:-1]
+        def _open_memmap(name, dtype, shape):
+            return np.lib.format.open_memmap(
+                os.path.join(output_dir, name + ".npy"), mode="w+",
+                dtype=dtype, shape=shape)
+
+        user_indices = _open_memmap("user_indices", np.int64, (n_rows,))
+        item_indices = _open_memmap("item_indices", np.int64, (n_rows,))
+        labels = _open_memmap("labels", np.float32, (n_rows,))
+        sparse_indices = (
+            _open_memmap("sparse_indices", np.int32,
+                         (n_rows, len(sparse_col)))
+            if sparse_col
+            else None
+        )
+        dense_values = (
+            _open_memmap("dense_values", np.float32, (n_rows, len(dense_col)))
+            if dense_col
+            else None
+        )
+
+        col_name_mapping = col_name2index(
+            user_col, item_col, sparse_col, dense_col)
+        user_sparse_col_indices = list(
+            col_name_mapping["user_sparse_col"].values())
+        user_dense_col_indices = list(
+            col_name_mapping["user_dense_col"].values())
+        item_sparse_col_indices = list(
+            col_name_mapping["item_sparse_col"].values())
+        item_dense_col_indices = list(
+            col_name_mapping["item_dense_col"].values())
+        n_users = encoder.n_users
+        n_items = encoder.n_items
+        # features are assumed to be constant for each user and item, so the
+        # unique feature rows are filled by scattering every chunk
+        user_sparse_unique = (
+            np.zeros((n_users, len(user_sparse_col_indices)), dtype=np.int32)
+            if user_sparse_col_indices
+            else None
+        )
+        user_dense_unique = (
+            np.zeros((n_users, len(user_dense_col_indices)), dtype=np.float32)
+            if user_dense_col_indices
+            else None
+        )
+        item_sparse_unique = (
+            np.zeros((n_items, len(item_sparse_col_indices)), dtype=np.int32)
+            if item_sparse_col_indices
+            else None
+        )
+        item_dense_unique = (
+            np.zeros((n_items, len(item_dense_col_indices)), dtype=np.float32)
+            if item_dense_col_indices
+            else None
+        )
+
+        start = 0
+        for chunk in read_chunks(paths, chunksize, columns, **read_kwargs):
+            end = start + len(chunk)
+            (user_indices[start: end],
+             item_indices[start: end]) = encoder.encode_user_item(chunk)
+            labels[start: end] = chunk["label"].to_numpy(dtype=np.float32)
+            chunk_users = user_indices[start: end]
+            chunk_items = item_indices[start: end]
+            if sparse_col:
+                chunk_sparse = encoder.encode_sparse(
+                    chunk, sparse_col, num_workers,
+                    out=sparse_indices[start: end])
+                if user_sparse_unique is not None:
+                    user_sparse_unique[chunk_users] = (
+                        chunk_sparse[:, user_sparse_col_indices])
+                if item_sparse_unique is not None:
+                    item_sparse_unique[chunk_items] = (
+                        chunk_sparse[:, item_sparse_col_indices])
+            if dense_col:
+                chunk_dense = chunk[dense_col].to_numpy(dtype=np.float32)
+                dense_values[start: end] = chunk_dense
+                if user_dense_unique is not None:
+                    user_dense_unique[chunk_users] = (
+                        chunk_dense[:, user_dense_col_indices])
+                if item_dense_unique is not None:
+                    item_dense_unique[chunk_items] = (
+                        chunk_dense[:, item_dense_col_indices])
+            start = end
+        if start != n_rows:
+            raise ValueError("files changed between the two passes")
+
+        # reopen read-only, so the arrays are backed by the page cache
+        arrays = [user_indices, item_indices, labels, sparse_indices,
+                  dense_values]
+        for i, array in enumerate(arrays):
+            if array is not None:
+                array.flush()
+                arrays[i] = np.load(array.filename, mmap_mode="r")
+        (user_indices,
+         item_indices,
+         labels,
+         sparse_indices,
+         dense_values) = arrays
+
+        train_transformed = TransformedSet(user_indices,
+                                           item_indices,
+                                           labels,
+                                           sparse_indices,
+                                           dense_values,
+                                           train=True)
+        label_stats = LabelStats(n_rows, label_sum / n_rows,
+                                 label_min, label_max)
+        data_info = DataInfo(col_name_mapping if sparse_col or dense_col
+                             else None,
+                             None,
+                             user_sparse_unique,
+                             user_dense_unique,
+                             item_sparse_unique,
+                             item_dense_unique,
+                             user_indices,
+                             item_indices,
+                             label_stats=label_stats,
+                             sparse_feat_size=(
+                                 encoder.feature_offset(sparse_col)[-1]
+                                 if sparse_col else None),
+                             encoder=encoder)
+        cls._set_last_encoder(encoder)
+        return train_transformed, data_info
 
     @classmethod
     def _get_dense_indices_matrix(cls, data, dense_col):
@@ -150,13 +335,12 @@ class DatasetPure(Dataset):
 
         cls._check_subclass()
         cls._check_col_names(train_data, mode="train")
-        cls._set_sparse_unique_vals(train_data, None)
+        encoder = FeatureEncoder.from_data(train_data)
         if shuffle:
             train_data = train_data.sample(
                 frac=1, random_state=seed).reset_index(drop=True)
 
-        user_indices, item_indices = cls._get_user_item_sparse_indices(
-            train_data, mode="train")
+        user_indices, item_indices = encoder.encode_user_item(train_data)
         labels = train_data["label"].to_numpy(dtype=np.float32)
 
         interaction_data = train_data[["user", "item", "label"]]
@@ -167,11 +351,48 @@ class DatasetPure(Dataset):
 
         data_info = DataInfo(interaction_data=interaction_data,
                              user_indices=user_indices,
-                             item_indices=item_indices)
+                             item_indices=item_indices,
+                             encoder=encoder)
+        cls._set_last_encoder(encoder)
         return train_transformed, data_info
 
     @classmethod
-    def build_testset(cls, test_data, shuffle=False, seed=42):
+    def build_trainset_from_files(cls, paths, output_dir, chunksize=1000000,
+                                  **read_kwargs):
+        """Build transformed pure train_data from files larger than memory.
+
+        The files are read twice in chunks. The first pass collects unique
+        users, items and label statistics, and the second pass encodes each
+        chunk into memory-mapped `.npy` files in `output_dir`, so only the
+        unique values and one chunk are held in memory. Unlike
+        `build_trainset`, the data can't be shuffled here.
+
+        Parameters
+        ----------
+        paths : str or list of str
+            Csv or parquet files, which must at least contain `user`,
+            `item`, `label` columns.
+        output_dir : str
+            Directory to write the encoded arrays.
+        chunksize : int, optional
+            Number of rows read in each chunk.
+        read_kwargs : dict, optional
+            Extra arguments passed to `pandas.read_csv`, e.g. `sep`.
+
+        Returns
+        -------
+        trainset : `TransformedSet` object
+            Data object used for training, backed by memory-mapped arrays.
+        data_info : `DataInfo` object
+            Object that contains some useful information
+            for training and predicting
+        """
+        return cls._build_trainset_from_files(
+            paths, output_dir, chunksize=chunksize, **read_kwargs)
+
+    @classmethod
+    def build_testset(cls, test_data, shuffle=False, seed=42, encoder=None,
+                      data_info=None):
         """Build transformed pure eval_data or test_data from original data.
 
         Normally, pure data only contains `user` and `item` columns,
@@ -185,6 +406,11 @@ class DatasetPure(Dataset):
             Whether to fully shuffle data.
         seed: int, optional
             random seed.
+        encoder : `FeatureEncoder` object, optional
+            Encoder of train data, i.e. `data_info.encoder`. Either `encoder`
+            or `data_info` should be provided, omitting both is deprecated.
+        data_info : `DataInfo` object, optional
+            `DataInfo` of train data, whose encoder is used.
 
         Returns
         -------
@@ -194,13 +420,13 @@ class DatasetPure(Dataset):
 
         cls._check_subclass()
         cls._check_col_names(test_data, mode="test")
+        encoder = cls._get_encoder(encoder, data_info)
         if shuffle:
             test_data = test_data.sample(
                 frac=1, random_state=seed).reset_index(drop=True)
 
         (test_user_indices,
-         test_item_indices) = cls._get_user_item_sparse_indices(
-            test_data, mode="test")
+         test_item_indices) = encoder.encode_user_item(test_data)
         if "label" in test_data.columns:
             labels = test_data["label"].to_numpy(dtype=np.float32)
         else:
@@ -247,7 +473,8 @@ class DatasetPure(Dataset):
         """
 
         trainset, data_info = cls.build_trainset(train_data, shuffle[0], seed)
-        testset = cls.build_testset(test_data, shuffle[1], seed)
+        testset = cls.build_testset(test_data, shuffle[1], seed,
+                                    data_info.encoder)
         return trainset, testset, data_info
 
 
@@ -259,7 +486,8 @@ class DatasetFeat(Dataset):
     @classmethod   # TODO: pseudo pure
     def build_trainset(cls, train_data, user_col=None, item_col=None,
                        sparse_col=None, dense_col=None, shuffle=False,
-                       seed=42):
+                       seed=42, hash_buckets=None, num_workers=1,
+                       multi_sparse_col=None):
         """Build transformed feat train_data from original data.
 
         Normally, `user` and `item` column will be transformed into
@@ -283,6 +511,20 @@ class DatasetFeat(Dataset):
             Whether to fully shuffle data.
         seed: int, optional
             random seed.
+        hash_buckets : dict, optional
+            Number of hash buckets of some sparse columns,
+            e.g. {"device_id": 100000}. These columns are encoded by hashing
+            values into buckets, so no vocabulary is built for them, which
+            suits columns of very high cardinality. Values only in test data
+            are hashed as well. `user` and `item` can't be hashed.
+        num_workers : int, optional
+            Number of threads to build vocabularies and encode sparse
+            columns concurrently, which is useful for many sparse columns.
+        multi_sparse_col : list of str, optional
+            List of multi-hot sparse feature column names, each value of
+            which is a list of values, e.g. tags or genres of an item. They
+            are stored as ragged arrays instead of padded columns, and must
+            be in `user_col` or `item_col`.
 
         Returns
         -------
@@ -295,15 +537,17 @@ class DatasetFeat(Dataset):
 
         cls._check_subclass()
         cls._check_col_names(train_data, mode="train")
-        cls._set_sparse_unique_vals(train_data, sparse_col)
+        cls._check_multi_sparse_col(user_col, item_col, sparse_col,
+                                    multi_sparse_col)
+        encoder = FeatureEncoder.from_data(train_data, sparse_col, hash_buckets,
+                                           num_workers, multi_sparse_col)
         if shuffle:
             train_data = train_data.sample(
                 frac=1, random_state=seed).reset_index(drop=True)
 
-        user_indices, item_indices = cls._get_user_item_sparse_indices(
-            train_data, mode="train")
+        user_indices, item_indices = encoder.encode_user_item(train_data)
         train_sparse_indices = (
-            cls._get_sparse_indices_matrix(train_data, sparse_col, mode="train")
+            encoder.encode_sparse(train_data, sparse_col, num_workers)
             if sparse_col
             else None
         )
@@ -312,6 +556,12 @@ class DatasetFeat(Dataset):
             if dense_col
             else None
         )
+        train_multi_sparse = (
+            MultiSparse(*encoder.encode_multi_sparse(
+                train_data, multi_sparse_col, num_workers))
+            if multi_sparse_col
+            else None
+        )
         labels = train_data["label"].to_numpy(dtype=np.float32)
 
         train_transformed = TransformedSet(user_indices,
@@ -319,10 +569,11 @@ class DatasetFeat(Dataset):
                                            labels,
                                            train_sparse_indices,
                                            train_dense_values,
+                                           train_multi_sparse,
                                            train=True)
 
         col_name_mapping = col_name2index(
-            user_col, item_col, sparse_col, dense_col)
+            user_col, item_col, sparse_col, dense_col, multi_sparse_col)
         user_sparse_col_indices = list(
             col_name_mapping["user_sparse_col"].values())
         user_dense_col_indices = list(
@@ -341,6 +592,12 @@ class DatasetFeat(Dataset):
             user_dense_col_indices, item_sparse_col_indices,
             item_dense_col_indices
         )
+        user_multi_sparse_unique = construct_multi_sparse_unique(
+            train_multi_sparse, user_indices, encoder.n_users,
+            list(col_name_mapping["user_multi_sparse_col"].values()))
+        item_multi_sparse_unique = construct_multi_sparse_unique(
+            train_multi_sparse, item_indices, encoder.n_items,
+            list(col_name_mapping["item_multi_sparse_col"].values()))
 
         interaction_data = train_data[["user", "item", "label"]]
         data_info = DataInfo(col_name_mapping,
@@ -350,13 +607,90 @@ class DatasetFeat(Dataset):
                              item_sparse_unique,
                              item_dense_unique,
                              user_indices,
-                             item_indices)
-
+                             item_indices,
+                             sparse_feat_size=(
+                                 encoder.feature_offset(sparse_col)[-1]
+                                 if sparse_col else None),
+                             encoder=encoder,
+                             user_multi_sparse_unique=(
+                                 user_multi_sparse_unique),
+                             item_multi_sparse_unique=(
+                                 item_multi_sparse_unique),
+                             multi_sparse_feat_size=(
+                                 encoder.feature_offset(multi_sparse_col)[-1]
+                                 if multi_sparse_col else None))
+
+        cls._set_last_encoder(encoder)
         return train_transformed, data_info
 
+    @staticmethod
+    def _check_multi_sparse_col(user_col, item_col, sparse_col,
+                                multi_sparse_col):
+        for col in multi_sparse_col or []:
+            if sparse_col and col in sparse_col:
+                raise ValueError(f"multi-hot column {col} can't be "
+                                 f"in sparse_col")
+            if not ((user_col and col in user_col)
+                    or (item_col and col in item_col)):
+                raise ValueError(f"multi-hot column {col} must be in "
+                                 f"user_col or item_col")
+
+    @classmethod
+    def build_trainset_from_files(cls, paths, output_dir, user_col=None,
+                                  item_col=None, sparse_col=None,
+                                  dense_col=None, hash_buckets=None,
+                                  chunksize=1000000, num_workers=1,
+                                  **read_kwargs):
+        """Build transformed feat train_data from files larger than memory.
+
+        The files are read twice in chunks. The first pass collects unique
+        values of sparse columns and label statistics, and the second pass
+        encodes each chunk into memory-mapped `.npy` files in `output_dir`,
+        so only the unique values and one chunk are held in memory. Unlike
+        `build_trainset`, the data can't be shuffled here.
+
+        Parameters
+        ----------
+        paths : str or list of str
+            Csv or parquet files, which must at least contain `user`,
+            `item`, `label` columns.
+        output_dir : str
+            Directory to write the encoded arrays.
+        user_col : list of str
+            List of user feature column names.
+        item_col : list of str
+            List of item feature column names.
+        sparse_col : list of str
+            List of sparse feature columns names,
+            usually include `user` and `item`, so it must be provided.
+        dense_col : list of str, optional
+            List of dense feature column names.
+        hash_buckets : dict, optional
+            Number of hash buckets of some sparse columns, which need no
+            vocabulary pass, see `build_trainset`.
+        chunksize : int, optional
+            Number of rows read in each chunk.
+        num_workers : int, optional
+            Number of threads to process sparse columns of each chunk.
+        read_kwargs : dict, optional
+            Extra arguments passed to `pandas.read_csv`, e.g. `sep`.
+
+        Returns
+        -------
+        trainset : `TransformedSet` object
+            Data object used for training, backed by memory-mapped arrays.
+        data_info : `DataInfo` object
+            Object that contains some useful information
+            for training and predicting
+        """
+        return cls._build_trainset_from_files(
+            paths, output_dir, user_col, item_col, sparse_col, dense_col,
+            hash_buckets, chunksize, num_workers, **read_kwargs)
+
     @classmethod
     def build_testset(cls, test_data, sparse_col=None, dense_col=None,
-                      shuffle=False, seed=42):
+                      shuffle=False, seed=42, encoder=None, num_workers=1,
+                      multi_sparse_col=None, data_info=None):
         """Build transformed feat eval_data or test_data from original data.
 
         Normally, `user` and `item` column will be transformed
@@ -375,6 +709,15 @@ class DatasetFeat(Dataset):
             Whether to fully shuffle data.
         seed: int, optional
             random seed.
+        encoder : `FeatureEncoder` object, optional
+            Encoder of train data, i.e. `data_info.encoder`. Either `encoder`
+            or `data_info` should be provided, omitting both is deprecated.
+        num_workers : int, optional
+            Number of threads to encode sparse columns concurrently.
+        multi_sparse_col : list of str, optional
+            List of multi-hot sparse feature column names.
+        data_info : `DataInfo` object, optional
+            `DataInfo` of train data, whose encoder is used.
 
         Returns
         -------
@@ -384,17 +727,20 @@ class DatasetFeat(Dataset):
 
         cls._check_subclass()
         cls._check_col_names(test_data, "test")
+        encoder = cls._get_encoder(encoder, data_info)
         if shuffle:
             test_data = test_data.sample(
                 frac=1, random_state=seed).reset_index(drop=True)
 
         (test_user_indices,
-         test_item_indices) = cls._get_user_item_sparse_indices(
-            test_data, mode="test")
-        test_sparse_indices = cls._get_sparse_indices_matrix(
-            test_data, sparse_col, mode="test") if sparse_col else None
+         test_item_indices) = encoder.encode_user_item(test_data)
+        test_sparse_indices = encoder.encode_sparse(
+            test_data, sparse_col, num_workers) if sparse_col else None
         test_dense_values = (
             test_data[dense_col].to_numpy() if dense_col else None)
+        test_multi_sparse = MultiSparse(*encoder.encode_multi_sparse(
+            test_data, multi_sparse_col, num_workers)
+        ) if multi_sparse_col else None
 
         if "label" in test_data.columns:
             labels = test_data["label"].to_numpy(dtype=np.float32)
@@ -408,6 +754,7 @@ class DatasetFeat(Dataset):
                                           labels,
                                           test_sparse_indices,
                                           test_dense_values,
+                                          test_multi_sparse,
                                           train=False)
 
         return test_transformed
@@ -415,7 +762,8 @@ class DatasetFeat(Dataset):
     @classmethod
     def build_train_test(cls, train_data, test_data, user_col=None,
                          item_col=None, sparse_col=None, dense_col=None,
-                         shuffle=(False, False), seed=42):
+                         shuffle=(False, False), seed=42, hash_buckets=None,
+                         num_workers=1, multi_sparse_col=None):
         """Build transformed feat train_data and test_data from original data.
 
         Normally, `user` and `item` column will be transformed into
@@ -442,6 +790,14 @@ class DatasetFeat(Dataset):
             Whether to fully shuffle data.
         seed: int, optional
             random seed.
+        hash_buckets : dict, optional
+            Number of hash buckets of some sparse columns,
+            see `build_trainset`.
+        num_workers : int, optional
+            Number of threads to encode sparse columns concurrently.
+        multi_sparse_col : list of str, optional
+            List of multi-hot sparse feature column names,
+            see `build_trainset`.
 
         Returns
         -------
@@ -455,8 +811,9 @@ class DatasetFeat(Dataset):
         """
         trainset, data_info = cls.build_trainset(
             train_data, user_col, item_col, sparse_col, dense_col,
-            shuffle[0], seed)
+            shuffle[0], seed, hash_buckets, num_workers, multi_sparse_col)
         testset = cls.build_testset(
-            test_data, sparse_col, dense_col, shuffle[1], seed)
+            test_data, sparse_col, dense_col, shuffle[1], seed,
+            data_info.encoder, num_workers, multi_sparse_col)
         return trainset, testset, data_info
 
@@ -0,0 +1,223 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_list_like
+from ..utils.serialization import save_arrays, load_arrays
+
+
+def encode_values(values, unique_vals):
+    """Indices of `values` in sorted `unique_vals`, unknown values are mapped
+    to `len(unique_vals)`."""
+    values = np.asarray(values)
+    n = len(unique_vals)
+    if n == 0:
+        return np.zeros(values.shape, dtype=np.int64)
+    indices = np.searchsorted(unique_vals, values)
+    unknown = unique_vals[np.minimum(indices, n - 1)] != values
+    indices[unknown] = n
+    return indices
+
+
+def hash_values(values, n_buckets):
+    """Map values into [0, n_buckets) with a vectorized hash, which is the
+    same across processes, so no vocabulary is needed."""
+    hashed = pd.util.hash_array(np.asarray(values), categorize=True)
+    return (hashed % np.uint64(n_buckets)).astype(np.int64)
+
+
+def flatten_lists(values):
+    """Lengths and concatenated values of a column of list-likes, e.g. tags
+    of items. Missing values are empty lists and scalars are lists of one
+    value."""
+    lists = [v if is_list_like(v) else ([] if pd.isna(v) else [v])
+             for v in values]
+    lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+    return lengths, np.array(list(chain.from_iterable(lists)))
+
+
+def map_columns(func, columns, num_workers=1):
+    """Apply `func` on every column, with `num_workers` threads if it is
+    larger than 1. Sorting and searching in numpy release the GIL, so
+    numeric columns are processed concurrently."""
+    if num_workers > 1 and len(columns) > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            return list(executor.map(func, columns))
+    return [func(col) for col in columns]
+
+
+class FeatureEncoder(object):
+    """Vocabularies which map raw users, items and sparse feature values
+    into indices.
+
+    An encoder is built from train data once, then it is used to encode test
+    data, other shards of data and raw features in serving. It is never
+    modified after being built, so one encoder can be shared by threads
+    encoding different data at the same time.
+
+    Parameters
+    ----------
+    user_unique_vals : numpy.ndarray
+        Sorted unique users.
+    item_unique_vals : numpy.ndarray
+        Sorted unique items.
+    sparse_unique_vals : dict of {str: numpy.ndarray}, optional
+        Sorted unique values of each sparse and multi-hot sparse column,
+        except hashed ones.
+    hash_buckets : dict of {str: int}, optional
+        Number of hash buckets of each hashed sparse column.
+    """
+
+    def __init__(self, user_unique_vals, item_unique_vals,
+                 sparse_unique_vals=None, hash_buckets=None):
+        self.user_unique_vals = user_unique_vals
+        self.item_unique_vals = item_unique_vals
+        self.sparse_unique_vals = (dict(sparse_unique_vals)
+                                   if sparse_unique_vals else dict())
+        self.hash_buckets = dict(hash_buckets) if hash_buckets else dict()
+
+    @classmethod
+    def from_data(cls, train_data, sparse_col=None, hash_buckets=None,
+                  num_workers=1, multi_sparse_col=None):
+        """Build vocabularies from train data, columns are processed by
+        `num_workers` threads."""
+        multi_sparse_col = list(multi_sparse_col or [])
+        all_sparse_col = list(sparse_col or []) + multi_sparse_col
+        hash_buckets = cls.check_hash_buckets(all_sparse_col, hash_buckets)
+        vocab_col = ["user", "item"] + [
+            col for col in all_sparse_col
+            if col not in ("user", "item") and col not in hash_buckets
+        ]
+
+        def _unique(col):
+            values = train_data[col].to_numpy()
+            if col in multi_sparse_col:
+                values = flatten_lists(values)[1]
+            return np.unique(values)
+
+        unique_vals = dict(zip(vocab_col, map_columns(
+            _unique, vocab_col, num_workers)))
+        sparse_unique_vals = {
+            col: unique_vals[col] for col in all_sparse_col
+            if col not in hash_buckets
+        }
+        return cls(unique_vals["user"], unique_vals["item"],
+                   sparse_unique_vals, hash_buckets)
+
+    @staticmethod
+    def check_hash_buckets(sparse_col, hash_buckets):
+        hash_buckets = dict(hash_buckets) if hash_buckets else dict()
+        for col, n_buckets in hash_buckets.items():
+            if not sparse_col or col not in sparse_col:
+                raise ValueError(f"hashed column {col} must be in sparse_col")
+            if col in ("user", "item"):
+                raise ValueError("user and item column can't be hashed")
+            if not isinstance(n_buckets, int) or n_buckets <= 0:
+                raise ValueError("number of hash buckets must be positive int")
+        return hash_buckets
+
+    @property
+    def n_users(self):
+        return len(self.user_unique_vals)
+
+    @property
+    def n_items(self):
+        return len(self.item_unique_vals)
+
+    def feature_offset(self, sparse_col):
+        """Start index of each sparse column in the shared feature space,
+        the last element is the total size."""
+        # plus one for value only in test data, hashed columns have no
+        # unknown values
+        sizes = [
+            self.hash_buckets[col] if col in self.hash_buckets
+            else len(self.sparse_unique_vals[col]) + 1
+            for col in sparse_col
+        ]
+        return np.cumsum(np.array([0] + sizes))
+
+    def encode_users(self, users):
+        return encode_values(users, self.user_unique_vals)
+
+    def encode_items(self, items):
+        return encode_values(items, self.item_unique_vals)
+
+    def encode_user_item(self, data):
+        return (self.encode_users(data["user"].to_numpy()),
+                self.encode_items(data["item"].to_numpy()))
+
+    def encode_column(self, col, values):
+        """Indices of a single sparse column, without offset."""
+        if col in self.hash_buckets:
+            return hash_values(values, self.hash_buckets[col])
+        return encode_values(values, self.sparse_unique_vals[col])
+
+    def encode_sparse(self, data, sparse_col, num_workers=1, out=None):
+        """Sparse indices matrix of `sparse_col`, with feature offsets.
+
+        Columns are encoded by `num_workers` threads, and each one is
+        written into its column of the int32 matrix with the offset added in
+        place. `out` can be a preallocated matrix, e.g. a memory-mapped one.
+        """
+        n_samples, n_features = len(data), len(sparse_col)
+        if out is None:
+            out = np.empty((n_samples, n_features), dtype=np.int32)
+        feature_offset = self.feature_offset(sparse_col)
+
+        def _encode(i):
+            col = sparse_col[i]
+            indices = self.encode_column(col, data[col].to_numpy())
+            np.add(indices, feature_offset[i], out=out[:, i],
+                   casting="unsafe")
+
+        map_columns(_encode, range(n_features), num_workers)
+        return out
+
+    def encode_multi_sparse(self, data, multi_sparse_col, num_workers=1):
+        """Ragged indices of multi-hot `multi_sparse_col`, with feature
+        offsets in their own feature space.
+
+        Rows are field-major, i.e. values of column j in sample i are
+        `indices[indptr[j * n + i]: indptr[j * n + i + 1]]`, so every
+        column is a contiguous block and no padding is stored.
+        """
+        feature_offset = self.feature_offset(multi_sparse_col)
+
+        def _encode(i):
+            col = multi_sparse_col[i]
+            lengths, values = flatten_lists(data[col].to_numpy())
+            indices = self.encode_column(col, values) + feature_offset[i]
+            return lengths, indices.astype(np.int32)
+
+        parts = map_columns(_encode, range(len(multi_sparse_col)),
+                            num_workers)
+        lengths = np.concatenate([lengths for lengths, _ in parts])
+        indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.concatenate([indices for _, indices in parts])
+        return indptr, indices
+
+    def save(self, path):
+        """Save vocabularies into directory `path`, one `.npy` file each."""
+        arrays = {"user_unique_vals": self.user_unique_vals,
+                  "item_unique_vals": self.item_unique_vals}
+        sparse_col = list(self.sparse_unique_vals)
+        for i, col in enumerate(sparse_col):
+            arrays[f"sparse_unique_vals_{i}"] = self.sparse_unique_vals[col]
+        meta = {"sparse_col": sparse_col, "hash_buckets": self.hash_buckets}
+        save_arrays(path, arrays, meta)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """Load an encoder saved by `save`."""
+        _, meta = load_arrays(path, [], mmap)
+        sparse_col = meta["sparse_col"]
+        names = ["user_unique_vals", "item_unique_vals"] + [
+            f"sparse_unique_vals_{i}" for i in range(len(sparse_col))]
+        arrays, _ = load_arrays(path, names, mmap)
+        sparse_unique_vals = {
+            col: arrays[f"sparse_unique_vals_{i}"]
+            for i, col in enumerate(sparse_col)
+        }
+        return cls(arrays["user_unique_vals"], arrays["item_unique_vals"],
+                   sparse_unique_vals, meta["hash_buckets"])
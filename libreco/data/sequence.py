@@ -1,6 +1,7 @@
 from math import floor
 from random import random
 import numpy as np
+from scipy.sparse import csr_matrix
 
 
 def sparse_user_interacted(user_indices, item_indices, user_consumed,
@@ -9,7 +10,7 @@ def sparse_user_interacted(user_indices, item_indices, user_consumed,
         consumed_items = user_consumed[u]
         interacted_indices = []
         interacted_items = []
-        position = consumed_items.index(i)
+        position = np.flatnonzero(consumed_items == i)[0]
         if position == 0:  # first item, no history interaction
             continue
         elif position < num:
@@ -72,17 +73,17 @@ def sample_item_with_tolerance(num, consumed_items, consumed_len, tolerance=5):
 
 
 def user_interacted_seq(user_indices, item_indices, user_consumed, pad_index,
-                        mode=None, num=None, user_consumed_set=None):
+                        mode=None, num=None, consumed_index=None):
     batch_size = len(user_indices)
     batch_interacted = np.full((batch_size, num), pad_index, dtype=np.int32)
     batch_interacted_len = []
+    consumed_flags = consumed_index.is_consumed(user_indices, item_indices)
     for j, (u, i) in enumerate(zip(user_indices, item_indices)):
         consumed_items = user_consumed[u]
         consumed_len = len(consumed_items)
-        consumed_set = user_consumed_set[u]
         # If i is a negative item, then random sample some items
         # from user's past interacted items.
-        if i not in consumed_set:
+        if not consumed_flags[j]:
             if consumed_len >= num:
                 # `np.random.choice` is too slow,
                 # so here we use a custom sample function with
@@ -95,7 +96,7 @@ def user_interacted_seq(user_indices, item_indices, user_consumed, pad_index,
                 batch_interacted[j, :consumed_len] = consumed_items
                 batch_interacted_len.append(float(consumed_len))
         else:
-            position = consumed_items.index(i)
+            position = np.flatnonzero(consumed_items == i)[0]
             if position == 0:
                 # first item, no historical interaction,
                 # assign to pad_index by default, and length is 1.
@@ -134,3 +135,78 @@ def user_last_interacted(user_indices, user_consumed, pad_index, recent_num=10):
     return u_last_interacted, np.asarray(interacted_len)
 
 
+def implicit_interaction(data, recent_num=None, random_sample_rate=None):
+    """csr matrix of user implicit interactions, i.e. N(u) in SVD++."""
+    sparse_data = data.sparse_interaction.tocoo()
+    row = sparse_data.row.reshape(-1, 1)
+    indices = np.concatenate([row, np.zeros_like(row)], axis=1)
+    values = sparse_data.col
+
+    if recent_num is not None:
+        indices, values = user_recent_interact(recent_num, indices, values)
+    elif random_sample_rate is not None:
+        indices, values = random_sample(random_sample_rate, indices, values)
+
+    return csr_matrix(
+        (np.ones(len(values), dtype=np.float32), (indices[:, 0], values)),
+        shape=sparse_data.shape
+    )
+
+
+def batch_sparse_interaction(interaction, user_indices):
+    """Gather implicit interactions of the batch users only.
+
+    The returned (indices, values, dense_shape) tuple can be fed into a
+    `tf.sparse_placeholder`, so the cost of each step is proportional to the
+    interactions of batch users.
+    """
+    user_indices = np.asarray(user_indices)
+    starts = interaction.indptr[user_indices]
+    lengths = interaction.indptr[user_indices + 1] - starts
+    total_length = np.sum(lengths)
+    # position of each interaction inside its row
+    row_offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    positions = np.arange(total_length) - row_offsets
+    rows = np.repeat(np.arange(len(user_indices)), lengths)
+    values = interaction.indices[np.repeat(starts, lengths) + positions]
+    max_length = np.max(lengths) if len(lengths) > 0 else 0
+    return (
+        np.stack([rows, positions], axis=1).astype(np.int64),
+        values.astype(np.int64),
+        np.array([len(user_indices), max(max_length, 1)], dtype=np.int64)
+    )
+
+
+def random_sample(sample_rate, indices, values):
+    assert 0.0 < sample_rate < 1.0, "sample_rate must be in (0.0, 1.0)"
+    total_length = len(values)
+    sample_num = int(total_length * sample_rate)
+    sampled_indices = np.random.choice(
+        range(total_length), size=sample_num, replace=False)
+    indices = indices[sampled_indices]
+    values = values[sampled_indices]
+    return indices, values
+
+
+def user_recent_interact(num, indices, values):
+    assert isinstance(num, int), "recent_interact_num must be int"
+    (users,
+     user_position,
+     user_counts) = np.unique(indices[:, 0],
+                              return_inverse=True,
+                              return_counts=True)
+
+    user_split_indices = np.split(
+        np.argsort(user_position, kind="mergesort"),
+        np.cumsum(user_counts)[:-1]
+    )
+
+    n_users = len(users)
+    recent_indices = list()
+    for u in range(n_users):
+        # assume user interactions have already been sorted by time.
+        u_data = user_split_indices[u][-num:]
+        recent_indices.extend(u_data)
+    indices = indices[recent_indices]
+    values = values[recent_indices]
+    return indices, values
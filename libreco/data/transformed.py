@@ -1,7 +1,11 @@
 import numpy as np
 from scipy.sparse import csr_matrix
-from .data_info import DataInfo
+from .data_info import ConsumedMapping, MultiSparse
 from ..utils.sampling import NegativeSampling
+from ..utils.serialization import save_arrays, load_arrays
+
+ARRAY_FIELDS = ["user_indices", "item_indices", "labels", "sparse_indices",
+                "dense_values"]
 
 
 class TransformedSet(object):
@@ -12,6 +16,7 @@ class TransformedSet(object):
             labels=None,
             sparse_indices=None,
             dense_values=None,
+            multi_sparse=None,
             train=True
     ):
         self._user_indices = user_indices
@@ -19,14 +24,17 @@ class TransformedSet(object):
         self._labels = labels
         self._sparse_indices = sparse_indices
         self._dense_values = dense_values
+        # `MultiSparse` of multi-hot columns in original samples, which is
+        # not affected by negative sampling, since models look up multi-hot
+        # features of users and items in `DataInfo`.
+        self.multi_sparse = multi_sparse
         self.has_sampled = False
-        if train:
-            self._sparse_interaction = csr_matrix(
-                (labels, (user_indices, item_indices)),
-                dtype=np.float32
-            )
+        self.train = train
+        # built on first access, since it is not needed by every model and
+        # costs a lot of memory on large data
+        self._sparse_interaction = None
         if not train:
-            self.user_consumed, _ = DataInfo.interaction_consumed(
+            self.user_consumed = ConsumedMapping.from_pairs(
                 user_indices, item_indices
             )
 
@@ -37,7 +45,8 @@ class TransformedSet(object):
         self.dense_values_orig = None
 
     def build_negative_samples(self, data_info, num_neg=1,
-                               item_gen_mode="random", seed=42):
+                               item_gen_mode="random", seed=42,
+                               popular_exponent=1.0):
         self.has_sampled = True
         self.user_indices_orig = self._user_indices
         self.item_indices_orig = self._item_indices
@@ -45,10 +54,12 @@ class TransformedSet(object):
         self.sparse_indices_orig = self._sparse_indices
         self.dense_values_orig = self._dense_values
 
-        self._build_negative_samples(data_info, num_neg, item_gen_mode, seed)
+        self._build_negative_samples(data_info, num_neg, item_gen_mode, seed,
+                                     popular_exponent)
 
     def _build_negative_samples(self, data_info, num_neg=1,
-                                item_gen_mode="random", seed=42):
+                                item_gen_mode="random", seed=42,
+                                popular_exponent=1.0):
 
         if self.sparse_indices is None and self.dense_values is None:
             neg = NegativeSampling(self, data_info, num_neg,
@@ -69,11 +80,94 @@ class TransformedSet(object):
             self._labels,
             self._sparse_indices,
             self._dense_values
-        ) = neg.generate_all(seed=seed, item_gen_mode=item_gen_mode)
+        ) = neg.generate_all(seed=seed, item_gen_mode=item_gen_mode,
+                             popular_exponent=popular_exponent)
 
     def __len__(self):
         return len(self.labels)
 
+    def save(self, path):
+        """Save data into directory `path`, one `.npy` file per field.
+
+        The csr parts of `sparse_interaction` in train data and
+        `user_consumed` in test data are saved too, so nothing needs to be
+        rebuilt in `load`.
+        """
+        arrays = {name: getattr(self, "_" + name) for name in ARRAY_FIELDS}
+        arrays.update({
+            name + "_orig": (getattr(self, name + "_orig")
+                             if self.has_sampled else None)
+            for name in ARRAY_FIELDS
+        })
+        arrays.update(
+            multi_sparse_indptr=(self.multi_sparse.indptr
+                                 if self.multi_sparse is not None else None),
+            multi_sparse_indices=(self.multi_sparse.indices
+                                  if self.multi_sparse is not None else None)
+        )
+        meta = {"train": self.train, "has_sampled": self.has_sampled}
+        interaction = self.sparse_interaction
+        if interaction is not None:
+            arrays.update(
+                sparse_interaction_indptr=interaction.indptr,
+                sparse_interaction_indices=interaction.indices,
+                sparse_interaction_data=interaction.data
+            )
+            meta["sparse_interaction_shape"] = list(interaction.shape)
+        if not self.train:
+            arrays.update(
+                user_consumed_indptr=self.user_consumed.indptr,
+                user_consumed_indices=self.user_consumed.indices
+            )
+        save_arrays(path, arrays, meta)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load data saved by `save`.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the saved data.
+        mmap : bool, optional
+            Whether to memory-map the arrays read-only instead of reading
+            them into memory, so loading is nearly instant and different
+            processes share the same pages.
+
+        Returns
+        -------
+        data : `TransformedSet` object
+        """
+        names = (ARRAY_FIELDS + [name + "_orig" for name in ARRAY_FIELDS] +
+                 ["sparse_interaction_indptr", "sparse_interaction_indices",
+                  "sparse_interaction_data", "user_consumed_indptr",
+                  "user_consumed_indices", "multi_sparse_indptr",
+                  "multi_sparse_indices"])
+        arrays, meta = load_arrays(path, names, mmap)
+        # train=True avoids rebuilding user_consumed of test data
+        data = cls(*[arrays[name] for name in ARRAY_FIELDS], train=True)
+        data.train = meta["train"]
+        if meta["has_sampled"]:
+            data.has_sampled = True
+            for name in ARRAY_FIELDS:
+                setattr(data, name + "_orig", arrays[name + "_orig"])
+        if arrays["multi_sparse_indptr"] is not None:
+            data.multi_sparse = MultiSparse(arrays["multi_sparse_indptr"],
+                                            arrays["multi_sparse_indices"])
+        if arrays["sparse_interaction_indptr"] is not None:
+            data._sparse_interaction = csr_matrix(
+                (arrays["sparse_interaction_data"],
+                 arrays["sparse_interaction_indices"],
+                 arrays["sparse_interaction_indptr"]),
+                shape=tuple(meta["sparse_interaction_shape"])
+            )
+        if not data.train:
+            data.user_consumed = ConsumedMapping(
+                arrays["user_consumed_indptr"],
+                arrays["user_consumed_indices"]
+            )
+        return data
+
     @property
     def user_indices(self):
         return self._user_indices
@@ -100,4 +194,18 @@ class TransformedSet(object):
 
     @property
     def sparse_interaction(self):
+        if self._sparse_interaction is None and self.train:
+            # only original interactions, without sampled negative items
+            if self.has_sampled:
+                user_indices = self.user_indices_orig
+                item_indices = self.item_indices_orig
+                labels = self.labels_orig
+            else:
+                user_indices = self._user_indices
+                item_indices = self._item_indices
+                labels = self._labels
+            self._sparse_interaction = csr_matrix(
+                (labels, (user_indices, item_indices)),
+                dtype=np.float32
+            )
         return self._sparse_interaction
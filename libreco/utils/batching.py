@@ -0,0 +1,43 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import tqdm
+
+
+def split_batches(data_size, batch_size, order=None):
+    """Indices of every batch, which are slices, or the corresponding parts of
+    `order` if it is provided, e.g. a shuffled permutation of data indices.
+    So shuffling never rewrites the whole data, only the gathered batches
+    are copied."""
+    batch_indices = [slice(i, i + batch_size)
+                     for i in range(0, data_size, batch_size)]
+    if order is not None:
+        batch_indices = [order[batch_index] for batch_index in batch_indices]
+    return batch_indices
+
+
+def iter_batches(make_batch, batch_indices, desc="train", prefetch_batches=0,
+                 num_workers=1):
+    """Yield `make_batch(batch_index)` for every batch in order.
+
+    If `prefetch_batches` > 0, up to that many following batches are prepared
+    by `num_workers` background threads while the current one is consumed,
+    e.g. during `sess.run`. The number of pending batches is bounded, so
+    memory usage doesn't grow with data size.
+    """
+    if prefetch_batches <= 0:
+        for batch_index in tqdm.tqdm(batch_indices, desc=desc):
+            yield make_batch(batch_index)
+        return
+
+    progress = tqdm.tqdm(total=len(batch_indices), desc=desc)
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque()
+        for batch_index in batch_indices:
+            pending.append(executor.submit(make_batch, batch_index))
+            if len(pending) > prefetch_batches:
+                progress.update()
+                yield pending.popleft().result()
+        while pending:
+            progress.update()
+            yield pending.popleft().result()
+    progress.close()
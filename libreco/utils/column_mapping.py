@@ -3,7 +3,7 @@ import numpy as np
 
 
 def col_name2index(user_col=None, item_col=None,
-                   sparse_col=None, dense_col=None):
+                   sparse_col=None, dense_col=None, multi_sparse_col=None):
     # format: {column_family_name: {column_name: index}}
     # if no such family, default format would be: {column_family_name: {[]: []}
     name_mapping = defaultdict(OrderedDict)
@@ -13,6 +13,10 @@ def col_name2index(user_col=None, item_col=None,
     if dense_col:
         dense_col_dict = {col: i for i, col in enumerate(dense_col)}
         name_mapping["dense_col"].update(dense_col_dict)
+    if multi_sparse_col:
+        multi_sparse_col_dict = {
+            col: i for i, col in enumerate(multi_sparse_col)}
+        name_mapping["multi_sparse_col"].update(multi_sparse_col_dict)
 
     if user_col and sparse_col:
         user_sparse_col = _extract_common_col(sparse_col, user_col)
@@ -40,6 +44,21 @@ def col_name2index(user_col=None, item_col=None,
                 {col: name_mapping["dense_col"][col]}
             )
 
+    if user_col and multi_sparse_col:
+        user_multi_sparse_col = _extract_common_col(multi_sparse_col,
+                                                    user_col)
+        for col in user_multi_sparse_col:
+            name_mapping["user_multi_sparse_col"].update(
+                {col: name_mapping["multi_sparse_col"][col]}
+            )
+    if item_col and multi_sparse_col:
+        item_multi_sparse_col = _extract_common_col(multi_sparse_col,
+                                                    item_col)
+        for col in item_multi_sparse_col:
+            name_mapping["item_multi_sparse_col"].update(
+                {col: name_mapping["multi_sparse_col"][col]}
+            )
+
     return name_mapping
 
 
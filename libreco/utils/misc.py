@@ -2,9 +2,19 @@ import functools
 import time
 from contextlib import contextmanager
 import numpy as np
-import tensorflow as tf2
-tf = tf2.compat.v1
-tf.disable_v2_behavior()
+
+
+@functools.lru_cache(maxsize=None)
+def import_tf():
+    """Import tensorflow on demand, in tf1 compatible mode.
+
+    Models that don't rely on tensorflow, e.g. ALS, ItemCF, can then be
+    used without paying the import time and memory of tensorflow.
+    """
+    import tensorflow as tf2
+    tf = tf2.compat.v1
+    tf.disable_v2_behavior()
+    return tf
 
 
 def shuffle_data(length, *args):
@@ -13,6 +23,7 @@ def shuffle_data(length, *args):
 
 
 def count_params():
+    tf = import_tf()
     total_params = np.sum(
         [
             np.prod(v.get_shape().as_list())
@@ -1,8 +1,95 @@
-from math import floor
-from random import random, seed as set_random_seed
 import numpy as np
-from tqdm import tqdm
 from ..utils.misc import time_block
+from ..utils.batching import iter_batches, split_batches
+
+
+def _is_consumed(keys, consumed_keys):
+    pos = np.searchsorted(consumed_keys, keys)
+    np.minimum(pos, len(consumed_keys) - 1, out=pos)
+    return consumed_keys[pos] == keys
+
+
+def sample_negatives(users, neg, n_items, consumed_keys, draw=None):
+    """Fill `neg` of shape (len(users), num_neg) in place with items not
+    consumed by the corresponding users.
+
+    All candidates are drawn at once by `draw(size)`, which defaults to
+    uniform sampling, then only the consumed ones are drawn again until
+    none is left.
+    """
+    if draw is None:
+        def draw(size):
+            return np.random.randint(n_items, size=size)
+
+    users = users.astype(np.int64)
+    neg[...] = draw(neg.shape)
+    rows, cols = np.nonzero(
+        _is_consumed(users[:, None] * n_items + neg, consumed_keys))
+    while len(rows) > 0:
+        candidates = draw(len(rows))
+        neg[rows, cols] = candidates
+        consumed = _is_consumed(users[rows] * n_items + candidates,
+                                consumed_keys)
+        rows, cols = rows[consumed], cols[consumed]
+    return neg
+
+
+def build_alias_table(weights):
+    """Build the alias table of a discrete distribution with Walker's method,
+    so that each sample afterwards only costs O(1).
+
+    Returns
+    -------
+    prob : numpy.ndarray
+        Probability of keeping the drawn column instead of its alias.
+    alias : numpy.ndarray
+        Alias of each column.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    n = len(weights)
+    # python lists are much faster than numpy for scalar access
+    prob = (weights * n / np.sum(weights)).tolist()
+    alias = list(range(n))
+    small = [i for i, p in enumerate(prob) if p < 1.0]
+    large = [i for i, p in enumerate(prob) if p >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        alias[s] = l
+        prob[l] = prob[l] + prob[s] - 1.0
+        if prob[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    # leftovers are only caused by floating point error
+    for i in small + large:
+        prob[i] = 1.0
+    return np.asarray(prob), np.asarray(alias, dtype=np.int64)
+
+
+def sample_alias(prob, alias, size):
+    column = np.random.randint(len(prob), size=size)
+    return np.where(np.random.random(size) < prob[column],
+                    column, alias[column])
+
+
+def _check_bounds(indices, size, name):
+    # "clip" mode below would silently map out-of-range indices to the
+    # boundary rows, so bad indices are rejected once per batch instead.
+    if len(indices) and (indices.min() < 0 or indices.max() >= size):
+        raise IndexError(
+            "%s out of range [0, %d), min: %d, max: %d" % (
+                name, size, indices.min(), indices.max()))
+
+
+def _take_rows(data, batch_index, out):
+    # gather rows into a preallocated buffer without intermediate copy,
+    # "clip" mode avoids the extra buffering of `np.take` with `out`,
+    # so `batch_index` must be checked with `_check_bounds` beforehand.
+    if isinstance(batch_index, slice):
+        out[...] = data[batch_index]
+    else:
+        np.take(data, batch_index, axis=0, out=out, mode="clip")
+    return out
 
 
 class SamplingBase(object):
@@ -12,54 +99,38 @@ class SamplingBase(object):
         self.num_neg = num_neg
 
     def sample_items_random(self, seed=42):
-        n_items = self.data_info.n_items
-        item_indices_sampled = list()
-        # set is much faster for search contains
-        user_consumed = {
-            u: set(items) for u, items in self.data_info.user_consumed.items()
-        }
-        # sample negative items for every user
         with time_block("random neg item sampling"):
-            for u, i in zip(self.dataset.user_indices,
-                            self.dataset.item_indices):
-                item_indices_sampled.append(i)
-                for _ in range(self.num_neg):
-                    item_neg = floor(n_items * random())
-                    while item_neg in user_consumed[u]:
-                        item_neg = floor(n_items * random())
-                    item_indices_sampled.append(item_neg)
-        return np.asarray(item_indices_sampled)
-
-    def sample_items_popular(self, seed=42):
-        data = self.data_info.get_indexed_interaction()
-        item_counts = data.item.value_counts().sort_index().to_numpy()
-        user_consumed = self.data_info.user_consumed
-        items = np.arange(self.data_info.n_items)
-
-        item_order = list()
-        item_indices_sampled = list()
+            return self._sample_items()
+
+    def sample_items_popular(self, seed=42, exponent=1.0):
+        """Sample negative items with probability proportional to
+        `item_count ** exponent`, through a global alias table and rejection
+        of consumed items."""
+        n_items = self.data_info.n_items
+        item_counts = np.zeros(n_items, dtype=np.float64)
+        consumed_counts = self.data_info.item_consumed.counts[:n_items]
+        item_counts[:len(consumed_counts)] = consumed_counts
         with time_block("popularity-based neg item sampling"):
-            for user, u_data in data.groupby("user", sort=False):
-                item_indices = u_data.index.to_list()
-                item_indices = item_indices * (self.num_neg + 1)
-                item_order.extend(item_indices)
-
-                # add positive items
-                item_indices_sampled.extend(u_data.item.tolist())
-                u_consumed = user_consumed[user]
-                u_item_counts = item_counts.copy()
-                u_item_counts[u_consumed] = 0
-                item_prob = u_item_counts / np.sum(u_item_counts)
-                neg_size = len(u_consumed) * self.num_neg
-
-                neg_sampled = np.random.choice(
-                    items, size=neg_size, p=item_prob, replace=True)
-                item_indices_sampled.extend(neg_sampled)
-
-        item_indices_sampled = np.asarray(item_indices_sampled)
-        # must be stable sort to keep relative order
-        item_order = np.argsort(item_order, kind="mergesort")
-        return item_indices_sampled[item_order]
+            prob, alias = build_alias_table(item_counts ** exponent)
+            return self._sample_items(
+                lambda size: sample_alias(prob, alias, size))
+
+    def _sample_items(self, draw=None, chunk_size=1 << 20):
+        n_items = self.data_info.n_items
+        user_indices = self.dataset.user_indices
+        item_indices_sampled = np.empty(
+            (len(user_indices), self.num_neg + 1),
+            dtype=self.dataset.item_indices.dtype)
+        item_indices_sampled[:, 0] = self.dataset.item_indices
+        consumed_keys = self.data_info.consumed_index.keys
+        # sample negative items for every user, in chunks to bound the
+        # temporary arrays of rejection sampling
+        for start in range(0, len(user_indices), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            sample_negatives(user_indices[chunk],
+                             item_indices_sampled[chunk, 1:],
+                             n_items, consumed_keys, draw)
+        return item_indices_sampled.reshape(-1)
 
     def _label_negative_sampling(self, size):
         factor = self.num_neg + 1
@@ -71,8 +142,11 @@ class SamplingBase(object):
 
 class NegativeSampling(SamplingBase):
     def __init__(self, dataset, data_info, num_neg, sparse=None, dense=None,
-                 batch_sampling=False):
+                 batch_sampling=False, prefetch_batches=0, num_workers=1):
         super(NegativeSampling, self).__init__(dataset, data_info, num_neg)
+        self.prefetch_batches = prefetch_batches
+        self.num_workers = num_workers
+        self.order = None
 
         if batch_sampling and dataset.has_sampled:
             self.user_indices = dataset.user_indices_orig
@@ -90,7 +164,8 @@ class NegativeSampling(SamplingBase):
         self.sparse = sparse
         self.dense = dense
 
-    def generate_all(self, seed=42, item_gen_mode="random"):
+    def generate_all(self, seed=42, item_gen_mode="random",
+                     popular_exponent=1.0):
         user_indices_sampled = np.repeat(
             self.user_indices, self.num_neg + 1, axis=0
         )
@@ -102,13 +177,29 @@ class NegativeSampling(SamplingBase):
         elif item_gen_mode == "random":
             item_indices_sampled = self.sample_items_random(seed=seed)
         elif item_gen_mode == "popular":
-            item_indices_sampled = self.sample_items_popular(seed=seed)
-
-        sparse_indices_sampled = self._sparse_indices_sampling(
-            self.sparse_indices, item_indices_sampled
+            item_indices_sampled = self.sample_items_popular(
+                seed=seed, exponent=popular_exponent)
+
+        # same gathering as batches, with buffers covering the whole data
+        sparse_indices_sampled = self._features_sampled(
+            self.sparse_indices, slice(None), item_indices_sampled,
+            self._allocate_feature_buffers(
+                self.sparse_indices, self.data_size,
+                self.data_info.user_sparse_col.index,
+                self.data_info.item_sparse_col.index, gather_rows=False),
+            self.data_info.user_sparse_col.index,
+            self.data_info.item_sparse_col.index,
+            self.data_info.item_sparse_unique
         ) if self.sparse else None
-        dense_values_sampled = self._dense_values_sampling(
-            self.dense_values, item_indices_sampled
+        dense_values_sampled = self._features_sampled(
+            self.dense_values, slice(None), item_indices_sampled,
+            self._allocate_feature_buffers(
+                self.dense_values, self.data_size,
+                self.data_info.user_dense_col.index,
+                self.data_info.item_dense_col.index, gather_rows=False),
+            self.data_info.user_dense_col.index,
+            self.data_info.item_dense_col.index,
+            self.data_info.item_dense_unique
         ) if self.dense else None
         label_sampled = self._label_negative_sampling(self.data_size)
 
@@ -121,132 +212,139 @@ class NegativeSampling(SamplingBase):
         )
 
     def __call__(self, shuffle=True, batch_size=None):
-        if shuffle:
-            mask = np.random.permutation(range(self.data_size))
-            self.sparse_indices = (
-                self.sparse_indices[mask] if self.sparse else None)
-            self.dense_values = (
-                self.dense_values[mask] if self.dense else None)
+        # only an index array is shuffled, data are gathered per batch
+        self.order = (np.random.permutation(self.data_size)
+                      if shuffle else None)
 
-        user_consumed = {
-            u: set(items) for u, items in self.data_info.user_consumed.items()
-        }
         n_items = self.data_info.n_items
-        return self.sample_batch(user_consumed, n_items, batch_size)
-
-    def sample_batch(self, user_consumed, n_items, batch_size):
-        for k in tqdm(range(0, self.data_size, batch_size),
-                      desc="batch_sampling train"):
-            batch_slice = slice(k, k + batch_size)
-            batch_user_indices = self.user_indices[batch_slice]
-            batch_item_indices = self.item_indices[batch_slice]
-            batch_sparse_indices = (
-                self.sparse_indices[batch_slice] if self.sparse else None)
-            batch_dense_values = (
-                self.dense_values[batch_slice] if self.dense else None)
-
-            user_indices_sampled = np.repeat(
-                batch_user_indices, self.num_neg + 1, axis=0
-            )
+        consumed_keys = self.data_info.consumed_index.keys
+        return self.sample_batch(consumed_keys, n_items, batch_size)
+
+    def sample_batch(self, consumed_keys, n_items, batch_size):
+        """Yield batches assembled in place into preallocated buffers.
+
+        Each pending batch and the one being consumed own a separate set of
+        buffers, which are reused by later batches. So the yielded arrays
+        are only valid until the next batch is requested.
+        """
+        n_buffers = self.prefetch_batches + 2
+        buffers = [self._allocate_batch_buffers(batch_size)
+                   for _ in range(n_buffers)]
+        labels = self._label_negative_sampling(batch_size)
+        factor = self.num_neg + 1
 
-            item_indices_sampled = list()
-            for u, i in zip(batch_user_indices, batch_item_indices):
-                item_indices_sampled.append(i)
-                for _ in range(self.num_neg):
-                    item_neg = floor(random() * n_items)
-                    while item_neg in user_consumed[u]:
-                        item_neg = floor(random() * n_items)
-                    item_indices_sampled.append(item_neg)
-            item_indices_sampled = np.array(item_indices_sampled)
-
-            sparse_indices_sampled = self._sparse_indices_sampling(
-                batch_sparse_indices, item_indices_sampled
+        def _sample_one_batch(numbered_index):
+            batch_no, batch_index = numbered_index
+            buffer = buffers[batch_no % n_buffers]
+            if isinstance(batch_index, slice):
+                n = len(range(*batch_index.indices(self.data_size)))
+            else:
+                n = len(batch_index)
+                _check_bounds(batch_index, self.data_size, "batch index")
+            size = n * factor
+            users = _take_rows(self.user_indices, batch_index,
+                               buffer["batch_user"][:n])
+
+            user_indices_sampled = buffer["user"][:size]
+            user_indices_sampled.reshape(n, factor)[...] = users[:, None]
+            item_indices_sampled = buffer["item"][:size]
+            items = item_indices_sampled.reshape(n, factor)
+            _take_rows(self.item_indices, batch_index, items[:, 0])
+            sample_negatives(users, items[:, 1:], n_items, consumed_keys)
+
+            sparse_indices_sampled = self._features_sampled(
+                self.sparse_indices, batch_index, item_indices_sampled,
+                buffer["sparse"], self.data_info.user_sparse_col.index,
+                self.data_info.item_sparse_col.index,
+                self.data_info.item_sparse_unique
             ) if self.sparse else None
-            dense_values_sampled = self._dense_values_sampling(
-                batch_dense_values, item_indices_sampled
+            dense_values_sampled = self._features_sampled(
+                self.dense_values, batch_index, item_indices_sampled,
+                buffer["dense"], self.data_info.user_dense_col.index,
+                self.data_info.item_dense_col.index,
+                self.data_info.item_dense_unique
             ) if self.dense else None
-            label_sampled = self._label_negative_sampling(
-                len(batch_user_indices)
-            )
 
-            yield (
+            return (
                 user_indices_sampled,
                 item_indices_sampled,
-                label_sampled,
+                labels[:size],
                 sparse_indices_sampled,
                 dense_values_sampled
             )
 
-    def _sparse_indices_sampling(self, sparse_indices, item_indices_sampled):
-        user_sparse_col = self.data_info.user_sparse_col.index
-        item_sparse_col = self.data_info.item_sparse_col.index
-
-        if user_sparse_col and item_sparse_col:
-            user_sparse_indices = np.take(
-                sparse_indices, user_sparse_col, axis=1)
-            user_sparse_sampled = np.repeat(
-                user_sparse_indices, self.num_neg + 1, axis=0)
-            item_sparse_sampled = self.data_info.item_sparse_unique[
-                item_indices_sampled]
-
-            assert len(user_sparse_sampled) == len(item_sparse_sampled), (
-                "num of user sampled must equal to num of item sampled")
-            # keep column names in original order
-            orig_cols = user_sparse_col + item_sparse_col
-            col_reindex = np.arange(len(orig_cols))[np.argsort(orig_cols)]
-            return np.concatenate(
-                [user_sparse_sampled, item_sparse_sampled], axis=-1
-            )[:, col_reindex]
-
-        elif user_sparse_col:
-            user_sparse_indices = np.take(
-                sparse_indices, user_sparse_col, axis=1)
-            user_sparse_sampled = np.repeat(
-                user_sparse_indices, self.num_neg + 1, axis=0)
-            return user_sparse_sampled
-
-        elif item_sparse_col:
-            item_sparse_sampled = self.data_info.item_sparse_unique[
-                item_indices_sampled]
-            return item_sparse_sampled
-
-    def _dense_indices_sampling(self, item_indices_sampled):
-        n_samples = len(item_indices_sampled)
-        user_dense_col = self.data_info.user_dense_col.index
-        item_dense_col = self.data_info.item_dense_col.index
-        total_dense_cols = len(user_dense_col) + len(item_dense_col)
-        return np.tile(np.arange(total_dense_cols), [n_samples, 1])
-
-    def _dense_values_sampling(self, dense_values, item_indices_sampled):
-        user_dense_col = self.data_info.user_dense_col.index
-        item_dense_col = self.data_info.item_dense_col.index
-
-        if user_dense_col and item_dense_col:
-            user_dense_values = np.take(dense_values, user_dense_col, axis=1)
-            user_dense_sampled = np.repeat(
-                user_dense_values, self.num_neg + 1, axis=0)
-            item_dense_sampled = self.data_info.item_dense_unique[
-                item_indices_sampled]
-
-            assert len(user_dense_sampled) == len(item_dense_sampled), (
-                "num of user sampled must equal to num of item sampled")
-            # keep column names in original order
-            orig_cols = user_dense_col + item_dense_col
-            col_reindex = np.arange(len(orig_cols))[np.argsort(orig_cols)]
-            return np.concatenate(
-                [user_dense_sampled, item_dense_sampled], axis=-1
-            )[:, col_reindex]
-
-        elif user_dense_col:
-            user_dense_values = np.take(dense_values, user_dense_col, axis=1)
-            user_dense_sampled = np.repeat(
-                user_dense_values, self.num_neg + 1, axis=0)
-            return user_dense_sampled
-
-        elif item_dense_col:
-            item_dense_sampled = self.data_info.item_dense_unique[
-                item_indices_sampled]
-            return item_dense_sampled
+        batch_indices = split_batches(self.data_size, batch_size, self.order)
+        return iter_batches(_sample_one_batch,
+                            list(enumerate(batch_indices)),
+                            desc="batch_sampling train",
+                            prefetch_batches=self.prefetch_batches,
+                            num_workers=self.num_workers)
+
+    def _allocate_batch_buffers(self, batch_size):
+        size = batch_size * (self.num_neg + 1)
+        buffers = {
+            "batch_user": np.empty(batch_size, dtype=self.user_indices.dtype),
+            "user": np.empty(size, dtype=self.user_indices.dtype),
+            "item": np.empty(size, dtype=self.item_indices.dtype)
+        }
+        if self.sparse:
+            buffers["sparse"] = self._allocate_feature_buffers(
+                self.sparse_indices, batch_size,
+                self.data_info.user_sparse_col.index,
+                self.data_info.item_sparse_col.index)
+        if self.dense:
+            buffers["dense"] = self._allocate_feature_buffers(
+                self.dense_values, batch_size,
+                self.data_info.user_dense_col.index,
+                self.data_info.item_dense_col.index)
+        return buffers
+
+    def _allocate_feature_buffers(self, features, batch_size, user_col,
+                                  item_col, gather_rows=True):
+        # rows are only gathered for index array batches, slices of
+        # `features` are views
+        size = batch_size * (self.num_neg + 1)
+        dtype = features.dtype
+        # output columns keep the original order of feature columns
+        orig_cols = sorted(user_col + item_col)
+        _check_bounds(np.asarray(orig_cols, dtype=np.int64),
+                      features.shape[1], "feature column")
+        buffers = {
+            "out": np.empty((size, len(orig_cols)), dtype=dtype),
+            "user_pos": [orig_cols.index(col) for col in user_col],
+            "item_pos": [orig_cols.index(col) for col in item_col]
+        }
+        if user_col and gather_rows:
+            buffers["rows"] = np.empty((batch_size, features.shape[1]),
+                                       dtype=dtype)
+        if user_col:
+            buffers["user"] = np.empty((batch_size, len(user_col)),
+                                       dtype=dtype)
+        if item_col:
+            buffers["item"] = np.empty((size, len(item_col)), dtype=dtype)
+        return buffers
+
+    def _features_sampled(self, features, batch_index, item_indices_sampled,
+                          buffers, user_col, item_col, item_unique):
+        size = len(item_indices_sampled)
+        n = size // (self.num_neg + 1)
+        out = buffers["out"][:size]
+        if user_col:
+            rows = (features[batch_index] if isinstance(batch_index, slice)
+                    else _take_rows(features, batch_index,
+                                    buffers["rows"][:n]))
+            user_features = np.take(rows, user_col, axis=1,
+                                    out=buffers["user"][:n], mode="clip")
+            out.reshape(n, self.num_neg + 1, -1)[
+                :, :, buffers["user_pos"]] = user_features[:, None, :]
+        if item_col:
+            _check_bounds(item_indices_sampled, len(item_unique),
+                          "sampled item index")
+            item_features = np.take(item_unique, item_indices_sampled,
+                                    axis=0, out=buffers["item"][:size],
+                                    mode="clip")
+            out[:, buffers["item_pos"]] = item_features
+        return out
 
 
 class PairwiseSampling(SamplingBase):
@@ -260,38 +358,32 @@ class PairwiseSampling(SamplingBase):
             self.user_indices = dataset.user_indices
             self.item_indices = dataset.item_indices
         self.data_size = len(self.user_indices)
+        self.order = None
 
     def __call__(self, shuffle=True, batch_size=None):
-        if shuffle:
-            mask = np.random.permutation(range(self.data_size))
-            self.user_indices = self.user_indices[mask]
-            self.item_indices = self.item_indices[mask]
+        self.order = (np.random.permutation(self.data_size)
+                      if shuffle else None)
 
-        user_consumed = {
-            u: set(items) for u, items in self.data_info.user_consumed.items()
-        }
         n_items = self.data_info.n_items
-        return self.sample_batch(user_consumed, n_items, batch_size)
-
-    def sample_batch(self, user_consumed, n_items, batch_size):
-        for k in tqdm(range(0, self.data_size, batch_size),
-                      desc="pair_sampling train"):
-            batch_slice = slice(k, k + batch_size)
-            batch_user_indices = self.user_indices[batch_slice]
-            batch_item_indices_pos = self.item_indices[batch_slice]
-
-            batch_item_indices_neg = list()
-            for u in batch_user_indices:
-                item_neg = floor(n_items * random())
-                while item_neg in user_consumed[u]:
-                    item_neg = floor(n_items * random())
-                batch_item_indices_neg.append(item_neg)
-
-            batch_item_indices_neg = np.asarray(batch_item_indices_neg)
-        #    batch_item_diff
-            yield (
+        consumed_keys = self.data_info.consumed_index.keys
+        return self.sample_batch(consumed_keys, n_items, batch_size)
+
+    def sample_batch(self, consumed_keys, n_items, batch_size):
+        def _sample_one_batch(batch_index):
+            batch_user_indices = self.user_indices[batch_index]
+            batch_item_indices_pos = self.item_indices[batch_index]
+            batch_item_indices_neg = sample_negatives(
+                batch_user_indices,
+                np.empty((len(batch_user_indices), 1), dtype=np.int64),
+                n_items, consumed_keys)[:, 0]
+            return (
                 batch_user_indices,
                 batch_item_indices_pos,
                 batch_item_indices_neg
             )
 
+        return iter_batches(
+            _sample_one_batch,
+            split_batches(self.data_size, batch_size, self.order),
+            desc="pair_sampling train")
+
@@ -5,10 +5,7 @@ import os
 import shutil
 import sys
 import numpy as np
-import tensorflow as tf2
-from .misc import colorize
-tf = tf2.compat.v1
-tf.disable_v2_behavior()
+from .misc import colorize, import_tf
 
 
 def save_knn(path, model, train_data, k=20):
@@ -54,6 +51,57 @@ def save_info(path, model, train_data, data_info=None):
                      convert_last_interacted_to_json)
 
 
+def save_arrays(path, arrays, meta=None):
+    """Save arrays into directory `path`, one `.npy` file per array, and
+    `meta` into `meta.json`.
+
+    Arrays are written into temporary files first and then renamed, so
+    arrays which are currently memory-mapped from `path` stay valid. Files
+    of None arrays are removed, so they won't be loaded later.
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for name, array in arrays.items():
+        file_path = os.path.join(path, name + ".npy")
+        if array is None:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            continue
+        array = np.asarray(array)
+        if array.dtype == object and all(isinstance(v, str) for v in array):
+            # fixed width strings can be memory-mapped, python objects can't
+            array = array.astype(str)
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, array, allow_pickle=(array.dtype == object))
+        os.replace(tmp_path, file_path)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta if meta is not None else dict(), f)
+
+
+def load_arrays(path, names, mmap=True):
+    """Load arrays saved by `save_arrays`, missing arrays are None.
+
+    If `mmap` is True, arrays are memory-mapped read-only, so they are
+    loaded lazily and shared between processes through the OS page cache.
+    """
+    arrays = dict()
+    for name in names:
+        file_path = os.path.join(path, name + ".npy")
+        if not os.path.exists(file_path):
+            arrays[name] = None
+            continue
+        try:
+            arrays[name] = np.load(file_path,
+                                   mmap_mode="r" if mmap else None)
+        except ValueError:
+            # python objects can't be memory-mapped
+            arrays[name] = np.load(file_path, allow_pickle=True)
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    return arrays, meta
+
+
 def save_to_json(path, data, convert_func):
     json_data = convert_func(data)
     with open(path, 'w') as f:
@@ -97,7 +145,7 @@ def convert_last_interacted_to_json(model):
     seq_len = model.max_seq_len
     u_last_interacted = dict()
     for u, consumed in model.user_consumed.items():
-        u_last_interacted[int(u)] = list(consumed)[-seq_len:]
+        u_last_interacted[int(u)] = np.asarray(consumed)[-seq_len:].tolist()
     return u_last_interacted
 
 
@@ -144,6 +192,7 @@ def convert_data_info_to_json(data_info):
 
 def save_model_tf_serving(path, model, model_name,
                           version=1, simple_save=False):
+    tf = import_tf()
     if not path:
         model_base_path = os.path.realpath("..")
         export_path = os.path.join(model_base_path,
@@ -182,6 +231,11 @@ def save_model_tf_serving(path, model, model_name,
             input_dict.update({"sparse_indices": model.sparse_indices})
         if model.dense:
             input_dict.update({"dense_values": model.dense_values})
+        if getattr(model, "multi_sparse", False):
+            input_dict.update(
+                {"multi_sparse_indices": model.multi_sparse_indices,
+                 "multi_sparse_indptr": model.multi_sparse_indptr}
+            )
         if need_seq:
             input_dict.update(
                 {"user_interacted_seq": model.user_interacted_seq,
@@ -211,6 +265,15 @@ def save_model_tf_serving(path, model, model_name,
                 {"dense_values": tf.saved_model.build_tensor_info(
                     model.dense_values)}
             )
+        if getattr(model, "multi_sparse", False):
+            input_dict.update(
+                {
+                    "multi_sparse_indices": tf.saved_model.build_tensor_info(
+                        model.multi_sparse_indices),
+                    "multi_sparse_indptr": tf.saved_model.build_tensor_info(
+                        model.multi_sparse_indptr)
+                }
+            )
         if need_seq:
             input_dict.update(
                 {
@@ -1,5 +1,6 @@
 import numpy as np
 import tensorflow as tf2
+from ..data.sequence import random_sample, user_recent_interact
 tf = tf2.compat.v1
 tf.disable_v2_behavior()
 
@@ -106,36 +107,18 @@ def sparse_tensor_interaction(data, recent_num=None, random_sample_rate=None):
     return sparse_tensor
 
 
-def random_sample(sample_rate, indices, values):
-    assert 0.0 < sample_rate < 1.0, "sample_rate must be in (0.0, 1.0)"
-    total_length = len(values)
-    sample_num = int(total_length * sample_rate)
-    sampled_indices = np.random.choice(
-        range(total_length), size=sample_num, replace=False)
-    indices = indices[sampled_indices]
-    values = values[sampled_indices]
-    return indices, values
-
-
-def user_recent_interact(num, indices, values):
-    assert isinstance(num, int), "recent_interact_num must be int"
-    (users,
-     user_position,
-     user_counts) = np.unique(indices[:, 0],
-                              return_inverse=True,
-                              return_counts=True)
-
-    user_split_indices = np.split(
-        np.argsort(user_position, kind="mergesort"),
-        np.cumsum(user_counts)[:-1]
-    )
-
-    n_users = len(users)
-    recent_indices = list()
-    for u in range(n_users):
-        # assume user interactions have already been sorted by time.
-        u_data = user_split_indices[u][-num:]
-        recent_indices.extend(u_data)
-    indices = indices[recent_indices]
-    values = values[recent_indices]
-    return indices, values
+def multi_sparse_embedding(embed_var, indices, indptr, n_fields,
+                           combiner="mean"):
+    """Pooled embeddings of multi-hot fields, shape: B * F * K.
+
+    `indices` and `indptr` are field-major ragged rows, i.e. row j * B + b
+    is field j of sample b. Only the present values are looked up, and a
+    field without any value becomes a zero vector.
+    """
+    sparse_ids = tf.RaggedTensor.from_row_splits(
+        tf.cast(indices, tf.int64), indptr).to_sparse()
+    # F*B * K
+    pooled = tf.nn.safe_embedding_lookup_sparse(
+        embed_var, sparse_ids, combiner=combiner)
+    pooled = tf.reshape(pooled, [n_fields, -1, embed_var.shape[-1]])
+    return tf.transpose(pooled, [1, 0, 2])
@@ -1,6 +1,10 @@
+from collections import namedtuple
 import numbers
 import numpy as np
 
+# ragged rows, values of row r are indices[indptr[r]: indptr[r+1]]
+MultiSparse = namedtuple("MultiSparse", ["indptr", "indices"])
+
 
 def construct_unique_feat(user_indices, item_indices, sparse_indices,
                           dense_values, user_sparse_col, user_dense_col,
@@ -45,6 +49,65 @@ def _compress_unique_values(orig_val, col, unique_indices):
     return np.unique(indices_plus_values, axis=0)[:, 1:]
 
 
+def take_ragged_rows(indptr, indices, rows):
+    """Gather `rows` of ragged `indptr` and `indices`, without python loops.
+    Returns the `indptr` and `indices` of the gathered rows."""
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    new_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_indptr[1:])
+    positions = (np.arange(new_indptr[-1], dtype=np.int64)
+                 + np.repeat(starts - new_indptr[:-1], lengths))
+    return new_indptr, indices[positions]
+
+
+def construct_multi_sparse_unique(multi_sparse, unique_indices, n_unique,
+                                  col):
+    """Multi-hot features of every user or item, taken from its last sample.
+
+    `multi_sparse` is the field-major `MultiSparse` of data, and `col` are
+    the positions of user or item columns in `multi_sparse_col`. Row
+    i * n_unique + u of the result is the i-th column in `col` of u.
+    """
+    if not col:
+        return None
+    n_samples = len(unique_indices)
+    unique_vals, first_reversed = np.unique(unique_indices[::-1],
+                                            return_index=True)
+    last_samples = np.zeros(n_unique, dtype=np.int64)
+    last_samples[unique_vals] = n_samples - 1 - first_reversed
+    rows = np.concatenate([j * n_samples + last_samples for j in col])
+    return MultiSparse(*take_ragged_rows(
+        multi_sparse.indptr, multi_sparse.indices, rows))
+
+
+def get_multi_sparse_indices(data_info, user, item):
+    """Field-major ragged multi-hot indices of user-item pairs, i.e. row
+    j * n + k is the j-th column of `multi_sparse_col` in pair k, looked up
+    in the unique features of users and items."""
+    user = np.asarray(user, dtype=np.int64)
+    item = np.asarray(item, dtype=np.int64)
+    sources = dict()
+    for i, j in enumerate(data_info.user_multi_sparse_col.index):
+        sources[j] = (data_info.user_multi_sparse_unique,
+                      i * data_info.n_users + user)
+    for i, j in enumerate(data_info.item_multi_sparse_col.index):
+        sources[j] = (data_info.item_multi_sparse_unique,
+                      i * data_info.n_items + item)
+
+    lengths, indices = [], []
+    for j in data_info.multi_sparse_col.index:
+        unique, rows = sources[j]
+        col_indptr, col_indices = take_ragged_rows(
+            unique.indptr, unique.indices, rows)
+        lengths.append(np.diff(col_indptr))
+        indices.append(col_indices)
+    indptr = np.zeros(len(lengths) * len(user) + 1, dtype=np.int64)
+    np.cumsum(np.concatenate(lengths), out=indptr[1:])
+    return MultiSparse(indptr, np.concatenate(indices))
+
+
 def get_predict_indices_and_values(data_info, user, item, n_items,
                                    sparse, dense):
     if isinstance(user, numbers.Integral):
@@ -53,6 +53,12 @@ extensions = [
               language="c++",
               extra_compile_args=compile_args,
               extra_link_args=link_args),
+    Extension('libreco.algorithms._svd',
+              [os.path.join("libreco", "algorithms", "_svd" + ext)],
+              include_dirs=[np.get_include()],
+              language="c++",
+              extra_compile_args=compile_args,
+              extra_link_args=link_args),
     Extension('libreco.utils._similarities',
               [os.path.join("libreco", "utils", "_similarities" + ext)],
               include_dirs=[np.get_include()],
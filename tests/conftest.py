@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+from libreco.utils.misc import import_tf
+
+
+def make_pure_data(n_users=50, n_items=40, size=2000, seed=42):
+    rng = np.random.RandomState(seed)
+    data = pd.DataFrame({
+        "user": rng.randint(n_users, size=size),
+        "item": rng.randint(n_items, size=size),
+        "label": rng.randint(1, 6, size=size).astype(np.float32),
+    })
+    return data.drop_duplicates(["user", "item"]).reset_index(drop=True)
+
+
+def make_feat_data(n_users=50, n_items=40, size=2000, seed=42):
+    data = make_pure_data(n_users, n_items, size, seed)
+    # features are functions of the user / item, as in real data
+    data["sex"] = np.where(data["user"] % 2 == 0, "F", "M")
+    data["age"] = (data["user"] % 7 + 18).astype(np.float32)
+    data["genre"] = "g" + (data["item"] % 5).astype(str)
+    data["price"] = (data["item"] % 11 / 10.0).astype(np.float32)
+    return data
+
+
+@pytest.fixture
+def pure_data():
+    return make_pure_data()
+
+
+@pytest.fixture
+def feat_data():
+    return make_feat_data()
+
+
+@pytest.fixture
+def tf_graph():
+    # models build into the default graph, so every test starts a fresh one
+    tf = import_tf()
+    tf.reset_default_graph()
+    yield
+    tf.reset_default_graph()
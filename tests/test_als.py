@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from libreco.data import DatasetPure
+from libreco.algorithms import ALS
+
+
+def _user_row(train_data, user):
+    interaction = train_data.sparse_interaction
+    row = slice(interaction.indptr[user], interaction.indptr[user + 1])
+    return interaction.indices[row], interaction.data[row]
+
+
+@pytest.mark.parametrize("task", ["rating", "ranking"])
+@pytest.mark.parametrize("use_cg", [False, True])
+def test_fold_in_user(pure_data, task, use_cg):
+    if task == "ranking":
+        pure_data["label"] = 1.0
+    train_data, data_info = DatasetPure.build_trainset(pure_data)
+    if task == "ranking":
+        train_data.build_negative_samples(data_info, seed=2020)
+    model = ALS(task, data_info, embed_size=8, n_epochs=2, reg=1.0)
+    model.fit(train_data, verbose=0, use_cg=False)
+
+    items, labels = _user_row(train_data, 3)
+    Y = model.item_embed.astype(np.float64)
+    reg = model.reg * np.eye(model.embed_size)
+    if task == "rating":
+        A = Y[items].T @ Y[items] + reg
+        b = Y[items].T @ labels
+        user_vector = model.fold_in_user(items, labels, use_cg=use_cg)
+    else:
+        # implicit labels are all 1.0
+        confidence = np.full(len(items), model.alpha + 1.0)
+        A = Y.T @ Y + reg + (Y[items].T * (confidence - 1)) @ Y[items]
+        b = Y[items].T @ confidence
+        user_vector = model.fold_in_user(items, use_cg=use_cg)
+
+    expected = np.linalg.solve(A, b)
+    assert user_vector.shape == (model.embed_size,)
+    if use_cg:
+        # a few cg steps only approach the exact solution
+        assert (np.linalg.norm(user_vector - expected)
+                < np.linalg.norm(expected))
+    else:
+        np.testing.assert_allclose(user_vector, expected, rtol=1e-3,
+                                   atol=1e-4)
+
+
+def test_fold_in_user_requires_labels_for_rating(pure_data):
+    train_data, data_info = DatasetPure.build_trainset(pure_data)
+    model = ALS("rating", data_info, embed_size=8, n_epochs=1, reg=1.0)
+    model.fit(train_data, verbose=0)
+    items, _ = _user_row(train_data, 3)
+    with pytest.raises(ValueError, match="labels"):
+        model.fold_in_user(items)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from libreco.data import DatasetPure
+from libreco.algorithms import BPR
+from libreco.algorithms._bpr import build_consumed_bitmap
+
+
+@pytest.fixture
+def ranking_trainset(pure_data):
+    pure_data["label"] = 1
+    train_data, data_info = DatasetPure.build_trainset(pure_data)
+    train_data.build_negative_samples(data_info, seed=2020)
+    return train_data, data_info
+
+
+@pytest.mark.parametrize("min_density", [0.0, 0.0625, 0.5, 2.0])
+def test_consumed_bitmap(ranking_trainset, min_density):
+    train_data, data_info = ranking_trainset
+    n_items = data_info.n_items
+    interaction = train_data.sparse_interaction
+    offsets, words = build_consumed_bitmap(interaction, n_items, min_density)
+    counts = np.diff(interaction.indptr)
+    heavy = counts >= max(1, min_density * n_items)
+    np.testing.assert_array_equal(offsets >= 0, heavy)
+    n_words = (n_items + 63) // 64
+    assert len(words) == heavy.sum() * n_words
+
+    consumed = set(zip(train_data.user_indices_orig.tolist(),
+                       train_data.item_indices_orig.tolist()))
+    for u in np.flatnonzero(heavy):
+        row = words[offsets[u]: offsets[u] + n_words]
+        bits = [(int(row[i >> 6]) >> (i & 63)) & 1 for i in range(n_items)]
+        assert bits == [(u, i) in consumed for i in range(n_items)]
+
+
+@pytest.mark.parametrize("optimizer", ["sgd", "minibatch_adam"])
+@pytest.mark.parametrize("bitmap_density", [0.0, 2.0])
+def test_warp_training(ranking_trainset, optimizer, bitmap_density):
+    train_data, data_info = ranking_trainset
+    model = BPR("ranking", data_info, embed_size=8, n_epochs=3, lr=0.05,
+                reg=0.0, batch_size=64, use_tf=False)
+    model.fit(train_data, verbose=0, optimizer=optimizer, sampler="warp",
+              max_sampled=5, compute_loss=True,
+              bitmap_density=bitmap_density)
+    assert np.all(np.isfinite(model.user_embed))
+    losses = [stats["loss"] for stats in model.train_stats_]
+    assert losses[-1] < losses[0]
+    # bitmap and binary search reject the same consumed items
+    assert all(stats["samples"] + stats["skipped"] == len(
+        train_data.user_indices_orig) for stats in model.train_stats_)
+
+
+def test_loss_only_on_request(ranking_trainset):
+    train_data, data_info = ranking_trainset
+    model = BPR("ranking", data_info, embed_size=8, n_epochs=1,
+                use_tf=False)
+    model.fit(train_data, verbose=0)
+    assert model.train_stats_[0]["loss"] is None
+    model.fit(train_data, verbose=0, compute_loss=True)
+    assert model.train_stats_[0]["loss"] > 0
@@ -0,0 +1,64 @@
+import numpy as np
+from libreco.data import DatasetPure
+from libreco.data.data_info import ConsumedIndex, ConsumedMapping
+
+
+def test_consumed_mapping():
+    users = np.array([2, 0, 2, 2, 0, 5])
+    items = np.array([7, 3, 1, 9, 4, 0])
+    mapping = ConsumedMapping.from_pairs(users, items)
+    # original order inside each user is kept
+    np.testing.assert_array_equal(mapping[2], [7, 1, 9])
+    np.testing.assert_array_equal(mapping[0], [3, 4])
+    np.testing.assert_array_equal(mapping[5], [0])
+    # users without interaction behave like the former defaultdict
+    assert len(mapping[1]) == 0
+    assert len(mapping[100]) == 0
+    assert 1 not in mapping and 100 not in mapping and 2 in mapping
+    assert list(mapping) == [0, 2, 5]
+    assert len(mapping) == 3
+    np.testing.assert_array_equal(mapping.counts, [2, 0, 3, 0, 0, 1])
+    assert not mapping.indices.flags.writeable
+
+
+def test_consumed_index_vs_set(pure_data):
+    train_data, data_info = DatasetPure.build_trainset(pure_data)
+    n_users, n_items = data_info.n_users, data_info.n_items
+    consumed = set(zip(train_data.user_indices.tolist(),
+                       train_data.item_indices.tolist()))
+    index = data_info.consumed_index
+
+    all_items = np.arange(n_items)
+    for u in range(n_users):
+        expected = [(u, i) in consumed for i in range(n_items)]
+        np.testing.assert_array_equal(index.contains(u, all_items), expected)
+        assert index.n_consumed(u) == sum(expected)
+        np.testing.assert_array_equal(index.items_of(u),
+                                      np.flatnonzero(expected))
+
+    users = np.repeat(np.arange(n_users), n_items)
+    items = np.tile(all_items, n_users)
+    expected = [pair in consumed for pair in zip(users.tolist(),
+                                                 items.tolist())]
+    np.testing.assert_array_equal(index.is_consumed(users, items), expected)
+    assert np.all(np.diff(index.keys) > 0)
+    assert len(index.keys) == len(consumed)
+
+
+def test_consumed_index_from_dict():
+    user_consumed = {0: [5, 1, 3], 2: [4], 3: []}
+    index = ConsumedIndex.from_user_consumed(user_consumed, 4, 6)
+    mapping = ConsumedMapping.from_pairs([0, 0, 0, 2], [5, 1, 3, 4])
+    index_from_mapping = ConsumedIndex.from_user_consumed(mapping, 4, 6)
+    for idx in (index, index_from_mapping):
+        np.testing.assert_array_equal(idx.indptr, [0, 3, 3, 4, 4])
+        np.testing.assert_array_equal(idx.indices, [1, 3, 5, 4])
+        np.testing.assert_array_equal(idx.contains(1, [0, 1]), [False, False])
+        np.testing.assert_array_equal(idx.contains(3, [0]), [False])
+
+
+def test_consumed_index_empty():
+    index = ConsumedIndex.from_user_consumed(dict(), 3, 4)
+    assert len(index.keys) == 0
+    np.testing.assert_array_equal(index.is_consumed([0, 2], [1, 3]),
+                                  [False, False])
@@ -0,0 +1,127 @@
+import threading
+import numpy as np
+import pytest
+from libreco.data import DatasetPure, DatasetFeat
+
+
+def test_build_testset_encoder(pure_data):
+    train, test = pure_data[:1000], pure_data[1000:]
+    _, data_info = DatasetPure.build_trainset(train)
+    by_info = DatasetPure.build_testset(test, data_info=data_info)
+    by_encoder = DatasetPure.build_testset(test, encoder=data_info.encoder)
+    np.testing.assert_array_equal(by_info.user_indices,
+                                  by_encoder.user_indices)
+    np.testing.assert_array_equal(by_info.user_indices,
+                                  data_info.map_users(test.user.to_numpy()))
+    np.testing.assert_array_equal(by_info.item_indices,
+                                  data_info.map_items(test.item.to_numpy()))
+
+
+def test_build_testset_deprecated_fallback(pure_data):
+    train, test = pure_data[:1000], pure_data[1000:]
+    _, data_info = DatasetPure.build_trainset(train)
+    with pytest.warns(FutureWarning, match="build_testset without"):
+        testset = DatasetPure.build_testset(test)
+    np.testing.assert_array_equal(testset.item_indices,
+                                  data_info.map_items(test.item.to_numpy()))
+
+    # the fallback never leaks into other threads
+    errors = []
+
+    def _build():
+        try:
+            DatasetPure.build_testset(test)
+        except ValueError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=_build)
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
+
+
+def test_data_info_mappings(pure_data):
+    _, data_info = DatasetPure.build_trainset(pure_data)
+    user2id = data_info.user2id
+    assert data_info.user2id is user2id
+    users = data_info.user_unique_vals
+    assert [user2id[u] for u in users] == list(range(data_info.n_users))
+    assert user2id[-1] == data_info.n_users
+    items = data_info.item_unique_vals
+    assert ([data_info.item2id[i] for i in items]
+            == list(range(data_info.n_items)))
+    assert data_info.id2item[3] == items[3]
+    np.testing.assert_array_equal(data_info.decode_users(
+        data_info.map_users(users)), users)
+    assert data_info.n_users == pure_data.user.nunique()
+    assert data_info.n_items == pure_data.item.nunique()
+    np.testing.assert_allclose(data_info.global_mean,
+                               pure_data.label.mean(), rtol=1e-6)
+
+
+def test_feat_build_testset(feat_data):
+    train, test = feat_data[:1000], feat_data[1000:]
+    _, data_info = DatasetFeat.build_trainset(
+        train, user_col=["sex", "age"], item_col=["genre", "price"],
+        sparse_col=["sex", "genre"], dense_col=["age", "price"])
+    testset = DatasetFeat.build_testset(
+        test, sparse_col=["sex", "genre"], dense_col=["age", "price"],
+        data_info=data_info)
+    assert testset.sparse_indices.shape == (len(test), 2)
+    np.testing.assert_allclose(testset.dense_values,
+                               test[["age", "price"]].to_numpy())
+
+
+def _write_parts(data, tmp_path):
+    paths = [str(tmp_path / "part1.csv"), str(tmp_path / "part2.csv")]
+    data[:700].to_csv(paths[0], index=False)
+    data[700:].to_csv(paths[1], index=False)
+    return paths
+
+
+def _assert_same_info(from_files, in_memory):
+    np.testing.assert_array_equal(from_files.user_unique_vals,
+                                  in_memory.user_unique_vals)
+    np.testing.assert_array_equal(from_files.item_unique_vals,
+                                  in_memory.item_unique_vals)
+    np.testing.assert_allclose(tuple(from_files.label_stats),
+                               tuple(in_memory.label_stats), rtol=1e-6)
+    np.testing.assert_array_equal(from_files.consumed_index.keys,
+                                  in_memory.consumed_index.keys)
+
+
+def test_pure_trainset_from_files(pure_data, tmp_path):
+    paths = _write_parts(pure_data, tmp_path)
+    # a small chunksize also merges the collected unique values
+    train_files, info_files = DatasetPure.build_trainset_from_files(
+        paths, str(tmp_path / "out"), chunksize=7)
+    train_memory, info_memory = DatasetPure.build_trainset(pure_data)
+    for name in ("user_indices", "item_indices", "labels"):
+        np.testing.assert_array_equal(getattr(train_files, name),
+                                      getattr(train_memory, name))
+    assert isinstance(train_files.user_indices, np.memmap)
+    _assert_same_info(info_files, info_memory)
+
+
+def test_feat_trainset_from_files(feat_data, tmp_path):
+    paths = _write_parts(feat_data, tmp_path)
+    kwargs = dict(user_col=["sex", "age"], item_col=["genre", "price"],
+                  sparse_col=["sex", "genre"], dense_col=["age", "price"])
+    train_files, info_files = DatasetFeat.build_trainset_from_files(
+        paths, str(tmp_path / "out"), chunksize=300, num_workers=2,
+        **kwargs)
+    train_memory, info_memory = DatasetFeat.build_trainset(feat_data,
+                                                           **kwargs)
+    for name in ("user_indices", "item_indices", "labels",
+                 "sparse_indices", "dense_values"):
+        np.testing.assert_array_equal(getattr(train_files, name),
+                                      getattr(train_memory, name))
+    _assert_same_info(info_files, info_memory)
+    for name in ("user_col", "item_col", "sparse_col", "dense_col",
+                 "user_sparse_col", "item_dense_col"):
+        assert getattr(info_files, name) == getattr(info_memory, name)
+    assert info_files.sparse_feat_size == info_memory.sparse_feat_size
+    for name in ("user_sparse_unique", "user_dense_unique",
+                 "item_sparse_unique", "item_dense_unique"):
+        np.testing.assert_array_equal(getattr(info_files, name),
+                                      getattr(info_memory, name))
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pytest
+from libreco.data import DatasetFeat
+from libreco.data.encoder import FeatureEncoder, encode_values, hash_values
+
+
+def _train_data():
+    return pd.DataFrame({
+        "user": [3, 1, 3, 2],
+        "item": ["b", "a", "c", "a"],
+        "label": [1, 2, 3, 4],
+        "city": ["x", "y", "x", "z"],
+        "tag": ["t1", "t2", "t3", "t4"],
+        "genres": [["g2", "g1"], [], ["g3"], "g1"],
+    })
+
+
+def test_encode_values():
+    unique_vals = np.array([10, 20, 30])
+    np.testing.assert_array_equal(
+        encode_values([20, 10, 30, 25, 40, 5], unique_vals),
+        [1, 0, 2, 3, 3, 3])
+    np.testing.assert_array_equal(encode_values([1, 2], np.array([])),
+                                  [0, 0])
+
+
+def test_feature_encoder():
+    data = _train_data()
+    encoder = FeatureEncoder.from_data(data, sparse_col=["city", "tag"],
+                                       hash_buckets={"tag": 8},
+                                       num_workers=2)
+    assert encoder.n_users == 3 and encoder.n_items == 3
+    np.testing.assert_array_equal(encoder.sparse_unique_vals["city"],
+                                  ["x", "y", "z"])
+    assert "tag" not in encoder.sparse_unique_vals
+
+    test = pd.DataFrame({"user": [2, 9], "item": ["c", "d"],
+                         "city": ["z", "unseen"], "tag": ["t1", "new"]})
+    users, items = encoder.encode_user_item(test)
+    np.testing.assert_array_equal(users, [1, 3])
+    np.testing.assert_array_equal(items, [2, 3])
+
+    # city has 3 values plus one unknown, then 8 buckets of tag
+    np.testing.assert_array_equal(encoder.feature_offset(["city", "tag"]),
+                                  [0, 4, 12])
+    sparse = encoder.encode_sparse(test, ["city", "tag"], num_workers=2)
+    assert sparse.dtype == np.int32
+    np.testing.assert_array_equal(sparse[:, 0], [2, 3])
+    assert np.all((sparse[:, 1] >= 4) & (sparse[:, 1] < 12))
+    np.testing.assert_array_equal(
+        sparse[:, 1] - 4, hash_values(["t1", "new"], 8))
+
+    out = np.zeros((2, 2), dtype=np.int32)
+    assert encoder.encode_sparse(test, ["city", "tag"], out=out) is out
+    np.testing.assert_array_equal(out, sparse)
+
+
+def test_hash_buckets_check():
+    data = _train_data()
+    with pytest.raises(ValueError):
+        FeatureEncoder.from_data(data, sparse_col=["city"],
+                                 hash_buckets={"tag": 8})
+    with pytest.raises(ValueError):
+        FeatureEncoder.from_data(data, sparse_col=["city"],
+                                 hash_buckets={"city": 0})
+
+
+def test_encoder_save_load(tmp_path):
+    data = _train_data()
+    encoder = FeatureEncoder.from_data(data, sparse_col=["city", "tag"],
+                                       hash_buckets={"tag": 8})
+    encoder.save(str(tmp_path))
+    loaded = FeatureEncoder.load(str(tmp_path))
+    np.testing.assert_array_equal(loaded.user_unique_vals,
+                                  encoder.user_unique_vals)
+    np.testing.assert_array_equal(loaded.item_unique_vals,
+                                  encoder.item_unique_vals)
+    assert loaded.hash_buckets == {"tag": 8}
+    np.testing.assert_array_equal(
+        loaded.encode_sparse(data, ["city", "tag"]),
+        encoder.encode_sparse(data, ["city", "tag"]))
+
+
+def test_multi_sparse_encoding():
+    data = _train_data()
+    encoder = FeatureEncoder.from_data(data, multi_sparse_col=["genres"])
+    np.testing.assert_array_equal(encoder.sparse_unique_vals["genres"],
+                                  ["g1", "g2", "g3"])
+    indptr, indices = encoder.encode_multi_sparse(data, ["genres"])
+    # missing lists are empty, scalars are lists of one value
+    np.testing.assert_array_equal(indptr, [0, 2, 2, 3, 4])
+    np.testing.assert_array_equal(indices, [1, 0, 2, 0])
+
+    two_cols = data.assign(other=[["g9"], ["g9", "g8"], [], []])
+    encoder = FeatureEncoder.from_data(two_cols,
+                                       multi_sparse_col=["genres", "other"])
+    indptr, indices = encoder.encode_multi_sparse(two_cols,
+                                                  ["genres", "other"])
+    # field-major rows, "other" starts after 3 genres plus one unknown
+    n = len(two_cols)
+    assert len(indptr) == 2 * n + 1
+    np.testing.assert_array_equal(indices[indptr[n]: indptr[n + 1]], [5])
+    np.testing.assert_array_equal(indices[indptr[n + 1]: indptr[n + 2]],
+                                  [5, 4])
+
+
+def test_multi_sparse_dataset():
+    data = _train_data()
+    train_data, data_info = DatasetFeat.build_trainset(
+        data, user_col=["city"], item_col=["genres"],
+        sparse_col=["city"], multi_sparse_col=["genres"])
+    multi_sparse = train_data.multi_sparse
+    assert multi_sparse.indptr[-1] == len(multi_sparse.indices) == 4
+    assert data_info.multi_sparse_feat_size == 4
+    # rows of item_multi_sparse_unique are the genres of every item
+    unique = data_info.item_multi_sparse_unique
+    item_a = data_info.map_items(["a"])[0]
+    np.testing.assert_array_equal(
+        unique.indices[unique.indptr[item_a]: unique.indptr[item_a + 1]],
+        [0])
+
+    test_data = DatasetFeat.build_testset(
+        data.assign(genres=[["g3", "new"], [], [], []]),
+        sparse_col=["city"], multi_sparse_col=["genres"],
+        data_info=data_info)
+    test_multi = test_data.multi_sparse
+    np.testing.assert_array_equal(
+        test_multi.indices[test_multi.indptr[0]: test_multi.indptr[1]],
+        [2, 3])
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+from libreco.data import DatasetPure, DatasetFeat
+from libreco.algorithms import SVD, SVDpp, NCF, FM
+from libreco.utils.misc import import_tf
+
+
+def _pipeline_ops():
+    tf = import_tf()
+    return [op for op in tf.get_default_graph().get_operations()
+            if op.name.startswith("input_pipeline")]
+
+
+def test_feed_dict_builds_no_pipeline(feat_data, tf_graph):
+    train_data, data_info = DatasetFeat.build_trainset(
+        feat_data, user_col=["sex", "age"], item_col=["genre", "price"],
+        sparse_col=["sex", "genre"], dense_col=["age", "price"])
+    model = FM("rating", data_info, n_epochs=1, batch_size=64)
+    model.fit(train_data, verbose=0, input_pipeline="feed_dict")
+    assert model.pipeline_batch is None
+    assert not _pipeline_ops()
+    assert model.user_indices.op.type == "Placeholder"
+
+
+@pytest.mark.parametrize("model_cls", [SVD, SVDpp])
+def test_tf_data_rating(pure_data, tf_graph, model_cls):
+    train_data, data_info = DatasetPure.build_trainset(pure_data)
+    model = model_cls("rating", data_info, n_epochs=2, batch_size=64)
+    model.fit(train_data, verbose=0, input_pipeline="tf_data")
+    assert _pipeline_ops()
+    preds = model.predict(train_data.user_indices, train_data.item_indices)
+    assert np.all(np.isfinite(preds))
+    assert np.all((preds >= 1) & (preds <= 5))
+
+
+def test_tf_data_feat_ranking(feat_data, tf_graph):
+    feat_data["label"] = 1
+    train_data, data_info = DatasetFeat.build_trainset(
+        feat_data, user_col=["sex", "age"], item_col=["genre", "price"],
+        sparse_col=["sex", "genre"], dense_col=["age", "price"])
+    model = FM("ranking", data_info, n_epochs=2, batch_size=64,
+               batch_sampling=True, num_neg=2)
+    model.fit(train_data, verbose=0, input_pipeline="tf_data")
+    preds = model.predict(train_data.user_indices, train_data.item_indices)
+    assert np.all((preds >= 0) & (preds <= 1))
+
+
+def test_tf_data_negative_sampling_exact(tf_graph):
+    # each user consumed 10 of 12 items, so a bounded number of rejection
+    # rounds would often keep consumed items
+    rng = np.random.RandomState(0)
+    n_users, n_items = 30, 12
+    users, items = [], []
+    for u in range(n_users):
+        users.extend([u] * 10)
+        items.extend(rng.choice(n_items, 10, replace=False))
+    data = pd.DataFrame({"user": users, "item": items, "label": 1})
+    train_data, data_info = DatasetPure.build_trainset(data)
+
+    model = NCF("ranking", data_info, n_epochs=1, batch_size=32,
+                batch_sampling=True, num_neg=3, hidden_units="8")
+    model.fit(train_data, verbose=0, input_pipeline="tf_data")
+
+    tf = import_tf()
+    model._load_pipeline_data(model._pipeline_arrays(train_data, True))
+    feed = model.pipeline_feed
+    model.sess.run(model.pipeline_iterator.initializer,
+                   {feed["order"]: np.arange(len(train_data)),
+                    feed["batch_size"]: 32,
+                    feed["neg_sampling"]: True})
+    consumed = set(zip(train_data.user_indices.tolist(),
+                       train_data.item_indices.tolist()))
+    n_neg = 0
+    while True:
+        try:
+            batch = model.sess.run(model.pipeline_batch)
+        except tf.errors.OutOfRangeError:
+            break
+        neg = batch["labels"] == 0
+        pairs = zip(batch["user_indices"][neg].tolist(),
+                    batch["item_indices"][neg].tolist())
+        assert not consumed.intersection(pairs)
+        n_neg += neg.sum()
+    assert n_neg == 3 * len(train_data)
@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+from libreco.data import DatasetPure, DatasetFeat
+from libreco.utils.sampling import (
+    NegativeSampling,
+    build_alias_table,
+    sample_alias,
+    sample_negatives
+)
+
+
+def _consumed_set(train_data):
+    return set(zip(train_data.user_indices.tolist(),
+                   train_data.item_indices.tolist()))
+
+
+def test_sample_negatives(pure_data):
+    train_data, data_info = DatasetPure.build_trainset(pure_data)
+    consumed = _consumed_set(train_data)
+    users = np.repeat(np.arange(data_info.n_users), 5)
+    neg = np.empty((len(users), 4), dtype=np.int64)
+    np.random.seed(0)
+    out = sample_negatives(users, neg, data_info.n_items,
+                           data_info.consumed_index.keys)
+    assert out is neg
+    assert np.all((neg >= 0) & (neg < data_info.n_items))
+    for u, items in zip(users.tolist(), neg.tolist()):
+        assert not any((u, i) in consumed for i in items)
+
+
+def test_sample_negatives_with_draw():
+    # user 0 consumed items 0 and 1, so only item 2 can be drawn
+    consumed_keys = np.array([0, 1])
+    neg = np.empty((1, 6), dtype=np.int64)
+    np.random.seed(0)
+    sample_negatives(np.array([0]), neg, 3, consumed_keys,
+                     draw=lambda size: np.random.randint(3, size=size))
+    np.testing.assert_array_equal(neg, 2)
+
+
+def test_alias_table():
+    weights = np.array([1.0, 0.0, 5.0, 2.0, 2.0])
+    prob, alias = build_alias_table(weights)
+    assert np.all((prob >= 0) & (prob <= 1))
+    # exact distribution implied by the table
+    n = len(weights)
+    implied = prob / n
+    np.add.at(implied, alias, (1 - prob) / n)
+    np.testing.assert_allclose(implied, weights / weights.sum(), atol=1e-12)
+
+    np.random.seed(0)
+    samples = sample_alias(prob, alias, 200000)
+    freq = np.bincount(samples, minlength=n) / len(samples)
+    np.testing.assert_allclose(freq, weights / weights.sum(), atol=0.01)
+    assert freq[1] == 0
+
+
+@pytest.fixture
+def feat_trainset(feat_data):
+    feat_data["label"] = 1
+    return DatasetFeat.build_trainset(
+        feat_data, user_col=["sex", "age"], item_col=["genre", "price"],
+        sparse_col=["sex", "genre"], dense_col=["age", "price"])
+
+
+def _check_features(data_info, users, items, sparse, dense):
+    # sampled features must be the features of the sampled users and items
+    sparse_col = data_info.sparse_col.index
+    dense_col = data_info.dense_col.index
+    user_sparse, item_sparse = (data_info.user_sparse_col.index,
+                                data_info.item_sparse_col.index)
+    user_dense, item_dense = (data_info.user_dense_col.index,
+                              data_info.item_dense_col.index)
+    assert sparse.shape == (len(users), len(sparse_col))
+    np.testing.assert_array_equal(sparse[:, item_sparse],
+                                  data_info.item_sparse_unique[items])
+    np.testing.assert_array_equal(sparse[:, user_sparse],
+                                  data_info.user_sparse_unique[users])
+    np.testing.assert_array_equal(dense[:, item_dense],
+                                  data_info.item_dense_unique[items])
+    np.testing.assert_array_equal(dense[:, user_dense],
+                                  data_info.user_dense_unique[users])
+
+
+@pytest.mark.parametrize("prefetch_batches", [0, 2])
+def test_sample_batch(feat_trainset, prefetch_batches):
+    train_data, data_info = feat_trainset
+    consumed = _consumed_set(train_data)
+    sampler = NegativeSampling(train_data, data_info, num_neg=2, sparse=True,
+                               dense=True, batch_sampling=True,
+                               prefetch_batches=prefetch_batches)
+    n_samples = 0
+    for users, items, labels, sparse, dense in sampler(True, 64):
+        assert len(users) == len(items) == len(labels) <= 64 * 3
+        np.testing.assert_array_equal(labels.reshape(-1, 3),
+                                      [[1, 0, 0]] * (len(labels) // 3))
+        pos = labels == 1
+        assert all(pair in consumed for pair in zip(users[pos].tolist(),
+                                                    items[pos].tolist()))
+        assert not any(pair in consumed
+                       for pair in zip(users[~pos].tolist(),
+                                       items[~pos].tolist()))
+        _check_features(data_info, users, items, sparse, dense)
+        n_samples += pos.sum()
+    assert n_samples == len(train_data)
+
+
+@pytest.mark.parametrize("item_gen_mode", ["random", "popular"])
+def test_generate_all(feat_trainset, item_gen_mode):
+    train_data, data_info = feat_trainset
+    consumed = _consumed_set(train_data)
+    sampler = NegativeSampling(train_data, data_info, num_neg=1,
+                               sparse=True, dense=True)
+    users, items, labels, sparse, dense = sampler.generate_all(
+        seed=1, item_gen_mode=item_gen_mode)
+    assert len(users) == len(items) == 2 * len(train_data)
+    assert not any(pair in consumed for pair in zip(users[1::2].tolist(),
+                                                    items[1::2].tolist()))
+    np.testing.assert_array_equal(users[::2], train_data.user_indices)
+    np.testing.assert_array_equal(items[::2], train_data.item_indices)
+    np.testing.assert_array_equal(labels, np.tile([1, 0], len(train_data)))
+    _check_features(data_info, users, items, sparse, dense)
+    assert sparse.dtype == train_data.sparse_indices.dtype
+    assert dense.dtype == train_data.dense_values.dtype
+
+
+def test_popular_sampling(pure_data):
+    # half of the items are consumed 10 times more than the others
+    pure_data = pure_data[(pure_data.item < 20) | (pure_data.index % 10 == 0)]
+    train_data, data_info = DatasetPure.build_trainset(pure_data)
+    sampler = NegativeSampling(train_data, data_info, num_neg=5)
+    item_counts = data_info.item_consumed.counts
+    np.random.seed(0)
+    random_neg = sampler.sample_items_random().reshape(-1, 6)[:, 1:]
+    popular_neg = sampler.sample_items_popular(
+        exponent=1.0).reshape(-1, 6)[:, 1:]
+    assert (item_counts[popular_neg].mean()
+            > 1.5 * item_counts[random_neg].mean())
+    # exponent 0 is uniform over items
+    uniform_neg = sampler.sample_items_popular(
+        exponent=0.0).reshape(-1, 6)[:, 1:]
+    assert (abs(item_counts[uniform_neg].mean()
+                - item_counts[random_neg].mean())
+            < 0.1 * item_counts[random_neg].mean())
@@ -0,0 +1,84 @@
+import numpy as np
+from libreco.data import DatasetFeat
+from libreco.data.data_info import DataInfo
+from libreco.utils.serialization import save_arrays, load_arrays
+
+
+def test_save_load_arrays(tmp_path):
+    path = str(tmp_path)
+    arrays = {"ints": np.arange(6, dtype=np.int32).reshape(2, 3),
+              "floats": np.linspace(0, 1, 5, dtype=np.float32),
+              "strings": np.array(["a", "bc", "def"], dtype=object),
+              "mixed": np.array([1, "a"], dtype=object),
+              "missing": None}
+    meta = {"name": "test", "sizes": [1, 2]}
+    save_arrays(path, arrays, meta)
+    loaded, loaded_meta = load_arrays(path, list(arrays) + ["other"])
+    assert loaded_meta == meta
+    assert loaded["missing"] is None and loaded["other"] is None
+    for name in ("ints", "floats"):
+        assert isinstance(loaded[name], np.memmap)
+        assert loaded[name].dtype == arrays[name].dtype
+        np.testing.assert_array_equal(loaded[name], arrays[name])
+    # strings are stored with fixed width, so they can be memory-mapped
+    assert isinstance(loaded["strings"], np.memmap)
+    np.testing.assert_array_equal(loaded["strings"], ["a", "bc", "def"])
+    assert loaded["mixed"].tolist() == [1, "a"]
+
+    not_mapped, _ = load_arrays(path, ["ints"], mmap=False)
+    assert not isinstance(not_mapped["ints"], np.memmap)
+
+    # saving None removes the former array, others stay readable
+    save_arrays(path, {"ints": None, "floats": arrays["floats"] * 2})
+    reloaded, reloaded_meta = load_arrays(path, ["ints", "floats"])
+    assert reloaded["ints"] is None and reloaded_meta == dict()
+    np.testing.assert_array_equal(reloaded["floats"], arrays["floats"] * 2)
+    np.testing.assert_array_equal(loaded["floats"], arrays["floats"])
+
+
+def test_data_info_save_load(tmp_path, feat_data):
+    feat_data["tags"] = [["t%d" % (i % 3)] * (i % 3) for i in feat_data.item]
+    train_data, data_info = DatasetFeat.build_trainset(
+        feat_data, user_col=["sex", "age"], item_col=["genre", "price",
+                                                      "tags"],
+        sparse_col=["sex", "genre"], dense_col=["age", "price"],
+        multi_sparse_col=["tags"])
+    path = str(tmp_path / "data_info")
+    data_info.save(path)
+    loaded = DataInfo.load(path)
+
+    assert loaded.col_name_mapping == data_info.col_name_mapping
+    assert loaded.user_col == data_info.user_col
+    assert loaded.item_col == data_info.item_col
+    assert tuple(loaded.label_stats) == tuple(data_info.label_stats)
+    assert loaded.sparse_feat_size == data_info.sparse_feat_size
+    assert loaded.multi_sparse_feat_size == data_info.multi_sparse_feat_size
+    for name in ("user_sparse_unique", "user_dense_unique",
+                 "item_sparse_unique", "item_dense_unique",
+                 "user_unique_vals", "item_unique_vals"):
+        np.testing.assert_array_equal(getattr(loaded, name),
+                                      getattr(data_info, name))
+    for name in ("user_consumed", "item_consumed"):
+        loaded_consumed = getattr(loaded, name)
+        consumed = getattr(data_info, name)
+        assert list(loaded_consumed) == list(consumed)
+        for key in consumed:
+            np.testing.assert_array_equal(loaded_consumed[key],
+                                          consumed[key])
+    np.testing.assert_array_equal(
+        loaded.item_multi_sparse_unique.indptr,
+        data_info.item_multi_sparse_unique.indptr)
+    np.testing.assert_array_equal(
+        loaded.item_multi_sparse_unique.indices,
+        data_info.item_multi_sparse_unique.indices)
+    np.testing.assert_array_equal(loaded.consumed_index.keys,
+                                  data_info.consumed_index.keys)
+
+    # the loaded encoder builds the same test data
+    test_data = DatasetFeat.build_testset(
+        feat_data, sparse_col=["sex", "genre"], dense_col=["age", "price"],
+        multi_sparse_col=["tags"], data_info=loaded)
+    np.testing.assert_array_equal(test_data.sparse_indices,
+                                  train_data.sparse_indices)
+    np.testing.assert_array_equal(test_data.multi_sparse.indices,
+                                  train_data.multi_sparse.indices)
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from libreco.algorithms import VectorModel
+
+
+@pytest.mark.parametrize("task", ["rating", "ranking"])
+def test_save_load(tmp_path, task):
+    rng = np.random.RandomState(0)
+    bound = (1, 5) if task == "rating" else None
+    model = VectorModel(task, rng.rand(6, 4), rng.rand(9, 4),
+                        [[0, 3], [1], [], [8], [2, 4, 6], []],
+                        offset=0.5, lower_upper_bound=bound)
+    path = str(tmp_path / "vector_model")
+    model.save(path)
+    loaded = VectorModel.load(path)
+
+    users = np.repeat(np.arange(6), 9)
+    items = np.tile(np.arange(9), 6)
+    np.testing.assert_allclose(loaded.predict(users, items),
+                               model.predict(users, items))
+    for u in range(6):
+        assert loaded.recommend_user(u, 3) == model.recommend_user(u, 3)
+    # consumed items are filtered
+    assert 0 not in [i for i, _ in loaded.recommend_user(0, 9)]
+
+
+def test_no_fit():
+    assert not hasattr(VectorModel, "fit")
+    with pytest.raises(ValueError):
+        VectorModel("rating", np.ones((2, 2)), np.ones((2, 2)))
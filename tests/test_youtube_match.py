@@ -0,0 +1,27 @@
+import numpy as np
+from libreco.data import DatasetFeat
+from libreco.algorithms import YouTubeMatch
+
+
+def test_user_item_col(feat_data):
+    _, data_info = DatasetFeat.build_trainset(
+        feat_data, user_col=["sex", "age"], item_col=["genre", "price"],
+        sparse_col=["sex", "genre"], dense_col=["age", "price"])
+    assert sorted(data_info.user_col) == ["age", "sex"]
+    assert sorted(data_info.item_col) == ["genre", "price"]
+
+
+def test_youtube_match_fit(feat_data, tf_graph):
+    feat_data["label"] = 1
+    train_data, data_info = DatasetFeat.build_trainset(
+        feat_data, user_col=["sex", "age"], item_col=[],
+        sparse_col=["sex"], dense_col=["age"])
+    assert len(data_info.item_col) == 0
+
+    model = YouTubeMatch("ranking", data_info, embed_size=8, n_epochs=1,
+                         batch_size=64, hidden_units="16,8", recent_num=5)
+    model.fit(train_data, verbose=0, shuffle=True)
+    assert model.user_vector.shape == (data_info.n_users, 8)
+    assert np.all(np.isfinite(model.user_vector))
+    recos = model.recommend_user(1, 5)
+    assert len(recos) <= 5